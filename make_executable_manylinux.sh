@@ -1,8 +1,9 @@
 #!/usr/bin/bash
 
-rm -rf .venv/ __pycache__/ build/ dist/ myPRL-qt.spec
+rm -rf .venv/ __pycache__/ build/ dist/
 python3 -m venv .venv
 source .venv/bin/activate
 python3 -m pip install -r requirements.txt
-python3 -m PyInstaller myPRL-qt.py
+# build options (no UPX, excluded modules) are in the spec file
+python3 -m PyInstaller myPRL-qt.spec
 deactivate
\ No newline at end of file
@@ -0,0 +1,336 @@
+''' myPRL benchmarks: times the hot paths of myPRL-qt (calibrations, table,
+views, plot, live folder watch, file I/O) at several table sizes, headless
+(offscreen Qt).
+Results are saved as JSON, and can be compared with a previous run:
+
+	python myPRL-bench.py -o bench-1.2.json
+	python myPRL-bench.py -o bench-new.json --compare bench-1.2.json
+
+Times are in seconds per call, the best of a few repeats.
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+import tempfile
+import subprocess
+import importlib.util
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+
+# myPRL-qt modules:
+import myPRLModels
+import myPRLSession
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(name):
+	''' imports a myPRL-xx.py script as a module '''
+	spec = importlib.util.spec_from_file_location(name.replace('-', '_'),
+								os.path.join(here, name + '.py'))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+
+def timeit(func, mintime=0.1, repeat=3):
+	''' best time per call of func, called enough times for mintime '''
+	t = time.perf_counter()
+	func()
+	t = time.perf_counter() - t
+	if t > 1:
+		# slow: once is enough
+		return t
+	number = max(1, int(mintime / max(t, 1e-7)))
+	best = t
+	for _ in range(repeat):
+		t = time.perf_counter()
+		for _ in range(number):
+			func()
+		best = min(best, (time.perf_counter() - t) / number)
+	return best
+
+
+def point(calib):
+	p = myPRLModels.HPData(Pm=1, P=0, x=calib.x0default * 1.01, T=300,
+						   x0=calib.x0default, T0=298, calib=calib,
+						   file='bench.txt', sx=0.01)
+	p.calcP()
+	return p
+
+
+def filled_table(n, calibrations):
+	# two calibrations, half of the points each
+	table = myPRLModels.HPDataTable()
+	for k, calib in enumerate(list(calibrations.values())[:2]):
+		m = n // 2 + (n % 2) * (k == 0)
+		x = calib.x0default * (1 + np.linspace(0, 0.05, m))
+		table.extend(Pm=np.linspace(0, 100, m),
+					 P=calib.func(x, 300, calib.x0default, 298),
+					 x=x, T=300, x0=calib.x0default, T0=298, calib=calib,
+					 files=['spectrum_{:07d}.txt'.format(i) for i in range(m)],
+					 sx=0.01)
+	table.history.clear()
+	return table
+
+
+def refill(table, df, calibrations):
+	# back to the n rows of df once a bench added rows: the next benches 
+	# are timed at size n
+	table.reconstruct_from_df(df, calibrations)
+	table.history.clear()
+
+
+# each bench_ function yields (name, function to time) for a table size n
+
+def bench_calibrations(n, calibrations, folder):
+	for calib in calibrations.values():
+		x = calib.x0default * (1 + np.linspace(0, 0.05, n))
+		T = np.full(n, 300.)
+		P = calib.func(x, T, calib.x0default, 298.)
+		yield ('calib/' + calib.name,
+				lambda: calib.func(x, T, calib.x0default, 298.))
+		yield ('invfunc/' + calib.name,
+				lambda: calib.invfunc(P, T, calib.x0default, 298.))
+
+
+def bench_table(n, calibrations, folder):
+	table = filled_table(n, calibrations)
+	df = table.df.copy()
+	p = point(calibrations['Ruby2020'])
+
+	yield 'table/df', lambda: table.df
+	yield 'table/add', lambda: table.add(p)
+	refill(table, df, calibrations)
+	yield 'table/recalc_all_P', table.recalc_all_P
+	yield ('table/reconstruct_from_df',
+		   lambda: myPRLModels.HPDataTable().reconstruct_from_df(df,
+														calibrations))
+
+
+def bench_gui(n, calibrations, folder):
+	from PyQt5.QtWidgets import QApplication
+	app = QApplication.instance() or QApplication(sys.argv[:1])
+	qt = load_script('myPRL-qt')
+	import myPRLPlots
+
+	table = filled_table(n, calibrations)
+	df = table.df.copy()
+	p = point(calibrations['Ruby2020'])
+
+	view = qt.HPTableWidget(table)
+	view.show()
+	app.processEvents()
+
+	def add_to_view():
+		table.add(p)
+		app.processEvents()
+
+	def reset_view():
+		table.reconstruct_from_df(df, calibrations)
+		app.processEvents()
+
+	yield 'gui/table_view_add', add_to_view
+	refill(table, df, calibrations)
+	app.processEvents()
+	yield 'gui/table_view_reset', reset_view
+	table.history.clear()
+
+	model = view.model()
+	column = model.columns.index('P')
+
+	def sort_view():
+		# first sort of the column, not the cached permutation
+		model.view.sorts.perms.clear()
+		model.sort(column)
+		app.processEvents()
+
+	def filter_view():
+		model.set_filter('P > 1 and calib == Ruby2020')
+		app.processEvents()
+
+	yield 'gui/table_view_sort', sort_view
+	yield 'gui/table_view_filter', filter_view
+	model.sort(-1)
+	model.set_filter('')
+	view.close()
+	view.deleteLater()
+
+	plot = myPRLPlots.PmPPlotWindow(table, calibrations)
+	plot.show()
+	app.processEvents()
+
+	def add_to_plot():
+		# not connected to table.changed: refreshed right away
+		table.add(p)
+		plot.refreshplot()
+
+	yield 'gui/plot_add_refresh', add_to_plot
+	refill(table, df, calibrations)
+	plot.refreshplot()
+	yield 'gui/plot_full_draw', plot.canvas.draw
+	plot.close()
+	plot.deleteLater()
+	app.processEvents()
+
+
+def bench_live(n, calibrations, folder):
+	from PyQt5.QtCore import QCoreApplication
+	app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+	import myPRLWatch
+
+	if n > 100000:
+		# filling the folder would take most of the time
+		return
+	# acquisition folder of n spectra, and another file
+	watched = os.path.join(folder, 'live-{}'.format(n))
+	os.mkdir(watched)
+	for i in range(n):
+		open(os.path.join(watched, 'spectrum_{:07d}.txt'.format(i)), 
+												'w').close()
+	open(os.path.join(watched, 'notes.log'), 'w').close()
+	watcher = myPRLWatch.FolderWatcher(watched, ('*.txt', '*.dat', '*.csv',
+												 '*.asc'))
+	count = itertools.count(n)
+
+	def new_file():
+		# as at a directoryChanged of one new spectrum
+		open(os.path.join(watched, 'spectrum_{:07d}.txt'.format(next(count))),
+												'w').close()
+		watcher.check()
+
+	yield 'live/watch_new_file', new_file
+	watcher.stop()
+
+
+def bench_io(n, calibrations, folder):
+	import pandas as pd
+
+	table = filled_table(n, calibrations)
+	csv = os.path.join(folder, 'bench.csv')
+	session = os.path.join(folder, 'bench' + myPRLSession.EXTENSION)
+
+	# as HPTableWindow.save_data_to_csv / load_data_from_csv
+	def save_csv():
+		table.df.to_csv(csv, sep='\t', decimal='.', header=True, index=False)
+
+	def load_csv():
+		df = pd.read_csv(csv, sep='\t', decimal='.', header=[0], index_col=None)
+		myPRLModels.HPDataTable().reconstruct_from_df(df, calibrations)
+
+	yield 'io/csv_save', save_csv
+	yield 'io/csv_load', load_csv
+	yield 'io/session_save', lambda: myPRLSession.save_session(table, session)
+	yield ('io/session_load',
+		   lambda: myPRLSession.load_session(session,
+							myPRLModels.HPDataTable(), calibrations))
+
+
+BENCHES = {'calib': bench_calibrations,
+		   'table': bench_table,
+		   'gui': bench_gui,
+		   'live': bench_live,
+		   'io': bench_io}
+
+
+def metadata():
+	meta = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'cpu_count': os.cpu_count(),
+			'numpy': np.__version__}
+	for name in ['pandas', 'matplotlib', 'PyQt5.QtCore']:
+		try:
+			module = importlib.import_module(name)
+			meta[name] = getattr(module, '__version__', None) or \
+						 getattr(module, 'PYQT_VERSION_STR', None)
+		except ImportError:
+			meta[name] = None
+	try:
+		meta['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+									cwd=here, capture_output=True, text=True,
+									timeout=10).stdout.strip() or None
+	except (OSError, subprocess.SubprocessError):
+		meta['commit'] = None
+	return meta
+
+
+def compare(results, old, threshold):
+	''' prints the time ratios new / old, returns the regressions '''
+	regressions = []
+	print('\n{:45s} {:>9s} {:>12s} {:>12s} {:>7s}'.format(
+							'benchmark', 'rows', 'old (s)', 'new (s)', 'ratio'))
+	for name, sizes in results.items():
+		for n, t in sizes.items():
+			t0 = old.get(name, {}).get(n)
+			if t0 is None:
+				continue
+			ratio = t / t0
+			# differences of a few 10 us are mostly noise
+			slower = ratio > 1 + threshold and t - t0 > 5e-5
+			if slower:
+				regressions.append( (name, n, ratio) )
+			print('{:45s} {:>9s} {:12.3g} {:12.3g} {:7.2f}{}'.format(
+						name, n, t0, t, ratio, '  <-- slower' if slower else ''))
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		description='Times the hot paths of myPRL-qt at several table sizes.')
+	parser.add_argument('-o', '--output', default=None,
+						help='JSON file for the results')
+	parser.add_argument('--sizes', default='10,1000,100000,1000000',
+						help='comma separated table sizes, '
+							 'default 10,1000,100000,1000000')
+	parser.add_argument('--only', default=','.join(BENCHES),
+						help='comma separated groups among {}'.format(
+													', '.join(BENCHES)))
+	parser.add_argument('--compare', default=None,
+						help='JSON results of a previous run')
+	parser.add_argument('--threshold', type=float, default=0.25,
+						help='relative slow down reported as a regression, '
+							 'default 0.25')
+	args = parser.parse_args(argv)
+
+	sizes = [int(s) for s in args.sizes.split(',')]
+	groups = args.only.split(',')
+	for group in groups:
+		if group not in BENCHES:
+			parser.error('Unknown benchmark group: {}'.format(group))
+
+	calibrations = myPRLModels.default_calibrations()
+	results = {}
+	with tempfile.TemporaryDirectory() as folder:
+		for group in groups:
+			for n in sizes:
+				for name, func in BENCHES[group](n, calibrations, folder):
+					t = timeit(func)
+					results.setdefault(name, {})[str(n)] = t
+					print('{:45s} {:>9d} {:12.3g} s'.format(name, n, t),
+																file=sys.stderr)
+
+	out = {'meta': metadata(), 'results': results}
+	if args.output is not None:
+		with open(args.output, 'w') as f:
+			json.dump(out, f, indent=1)
+
+	if args.compare is not None:
+		with open(args.compare) as f:
+			old = json.load(f)['results']
+		regressions = compare(results, old, args.threshold)
+		if regressions:
+			print('\n{} regression(s)'.format(len(regressions)))
+			return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit( main() )
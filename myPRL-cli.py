@@ -0,0 +1,201 @@
+''' Headless myPRL: converts measurement files to pressures (or pressures to
+x with --invert) without Qt. Files are streamed in chunks, so that memory
+stays bounded whatever the file size, and each chunk is computed with one
+vectorized call per calibration. Lines starting with # at the beginning of
+the input are skipped (only there: # is data in file names).
+
+Examples:
+	python myPRL-cli.py -c Ruby2020 ramp.txt -o ramp_P.txt
+	python myPRL-cli.py -c cBN --T 1200 --sep , spectra.csv.gz
+	python myPRL-cli.py -c Ruby2020 --invert targets.txt
+	python myPRL-cli.py table.csv   # saved myPRL-qt table, calib per row
+'''
+
+import os
+import sys
+import bz2
+import gzip
+import lzma
+import argparse
+import pandas as pd
+
+# myPRL-qt modules:
+import myPRLModels
+
+
+def find_calib(name, calibrations):
+	''' exact name, or unique case-insensitive beginning of a name '''
+	if name in calibrations:
+		return calibrations[name]
+	found = [c for k, c in calibrations.items()
+						if k.lower().startswith(name.lower())]
+	if len(found) != 1:
+		raise KeyError('Unknown or ambiguous calibration: {}. '
+					   'Available: {}'.format(name, ', '.join(calibrations)))
+	return found[0]
+
+
+# text openers of the compressions whose comment lines are skipped
+_openers = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+def comment_lines(path):
+	''' number of lines starting with # at the beginning of the file '''
+	opener = _openers.get(os.path.splitext(path)[1].lower(), open)
+	n = 0
+	with opener(path, 'rt', errors='replace') as f:
+		for line in iter(f.readline, ''):
+			if not line.startswith('#'):
+				break
+			n += 1
+	return n
+
+
+class Uncommented():
+	''' text stream f (e.g. stdin, that cannot seek back) after the lines
+	starting with # at its beginning '''
+
+	def __init__(self, f):
+		self.f = f
+		self.head = ''
+		for line in iter(f.readline, ''):
+			if not line.startswith('#'):
+				# first line of data, read again by read()
+				self.head = line
+				break
+
+	def read(self, size=-1):
+		if not self.head:
+			return self.f.read(size)
+		if size is None or size < 0:
+			data, self.head = self.head + self.f.read(), ''
+		else:
+			data, self.head = self.head[:size], self.head[size:]
+		return data
+
+	def __iter__(self):
+		if self.head:
+			yield self.head
+			self.head = ''
+		yield from self.f
+
+
+def column_or_value(chunk, spec, default):
+	''' spec is a column name or a number, used if there is no such column '''
+	if spec is not None and spec in chunk.columns:
+		return chunk[spec].to_numpy(dtype=float)
+	try:
+		return float(spec)
+	except (TypeError, ValueError):
+		if default is None:
+			raise KeyError('No column {} in input'.format(spec))
+		return default
+
+
+def convert_chunk(chunk, calib, args):
+	''' adds the P column (x with invert) to chunk, in place '''
+	incol, outcol = (args.P, 'x') if args.invert else (args.x, 'P')
+
+	if calib is not None:
+		groups = [(calib, chunk.index)]
+	else:
+		# one calibration per row, e.g. a saved myPRL-qt table
+		if 'calib' not in chunk.columns:
+			raise KeyError("No calibration given and no 'calib' column in input")
+		groups = [(find_calib(name, args.calibrations), ind)
+					for name, ind in chunk.groupby('calib').groups.items()]
+
+	out = pd.Series(float('nan'), index=chunk.index)
+	for calib_, ind in groups:
+		sub = chunk.loc[ind]
+		v = column_or_value(sub, incol, None)
+		T = column_or_value(sub, args.T, 298.)
+		x0 = column_or_value(sub, args.x0, calib_.x0default)
+		T0 = column_or_value(sub, args.T0, 298.)
+
+		if args.invert:
+			out[ind] = calib_.invfunc(v, T, x0, T0)
+		else:
+			out[ind] = calib_.func(v, T, x0, T0)
+	chunk[outcol] = out
+	return chunk
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		description='Computes pressures from x (lambda or nu), T, x0, T0 '
+					'columns of text files, chunk by chunk.')
+	parser.add_argument('input', nargs='?', help="input file ('-' for stdin), "
+										'may be compressed (.gz, .bz2, ...)')
+	parser.add_argument('-o', '--output', default='-',
+						help="output file, default '-' (stdout)")
+	parser.add_argument('-c', '--calib', default=None,
+						help='calibration name, or beginning of it. '
+							 "Default: 'calib' column of the input")
+	parser.add_argument('--invert', action='store_true',
+						help='computes x from P instead')
+	parser.add_argument('--sep', default='\t',
+						help='column separator, default tab (as myPRL-qt)')
+	parser.add_argument('--chunksize', type=int, default=1000000,
+						help='rows per chunk, default 1000000')
+	parser.add_argument('--list', action='store_true',
+						help='lists the available calibrations and exits')
+	for k, default in [('x', 'x'), ('P', 'P'), ('T', 'T'),
+					   ('x0', 'x0'), ('T0', 'T0')]:
+		parser.add_argument('--' + k, default=default,
+							help='column name or constant value for '
+								 '{}, default {}'.format(k, default))
+
+	args = parser.parse_args(argv)
+	args.calibrations = myPRLModels.default_calibrations()
+
+	if args.list:
+		print('\n'.join(args.calibrations))
+		return 0
+
+	if args.input is None:
+		parser.error('the following arguments are required: input')
+
+	calib = None
+	if args.calib is not None:
+		try:
+			calib = find_calib(args.calib, args.calibrations)
+		except KeyError as e:
+			parser.error(e.args[0])
+
+	if args.input == '-':
+		infile, ncomments = Uncommented(sys.stdin), 0
+	else:
+		infile, ncomments = args.input, comment_lines(args.input)
+	outfile = sys.stdout if args.output == '-' else open(args.output, 'w',
+																newline='')
+
+	nrows = 0
+	try:
+		reader = pd.read_csv(infile,
+							 sep=args.sep,
+							 decimal='.',
+							 skiprows=ncomments,
+							 chunksize=args.chunksize)
+		for i, chunk in enumerate(reader):
+			try:
+				convert_chunk(chunk, calib, args)
+			except KeyError as e:
+				parser.error(e.args[0])
+			chunk.to_csv(outfile,
+						 sep=args.sep,
+						 decimal='.',
+						 header=(i == 0),
+						 index=False)
+			nrows += len(chunk)
+			print('{} rows'.format(nrows), end='\r', file=sys.stderr)
+	finally:
+		if outfile is not sys.stdout:
+			outfile.close()
+
+	print('{} rows done'.format(nrows), file=sys.stderr)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit( main() )
@@ -1,15 +1,43 @@
+import os
 import sys
+import time
+
+
+class StartupProfile():
+	''' Time spent in each step of the startup, printed with 
+	--startup-profile (python -X importtime gives the details of imports) '''
+	def __init__(self):
+		self.last = time.perf_counter()
+		self.steps = []
+
+	def step(self, name):
+		t = time.perf_counter()
+		self.steps.append( (name, t - self.last) )
+		self.last = t
+
+	def report(self, file=sys.stderr):
+		for name, dt in self.steps:
+			print('{:32s} {:8.1f} ms'.format(name, 1e3 * dt), file=file)
+		print('{:32s} {:8.1f} ms'.format('total', 
+						1e3 * sum(dt for _, dt in self.steps)), file=file)
+
+startup = StartupProfile()
+
+
+# matplotlib (myPRLPlots), pandas, and the batch fit modules are imported 
+# on first use: the calculator window does not need them
+import copy
+import glob
+import threading
+import multiprocessing
+startup.step('import stdlib modules')
 import numpy as np
-import pandas as pd
-import matplotlib
-matplotlib.use('Qt5Agg')
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
-from matplotlib.figure import Figure
-from scipy.optimize import minimize
+startup.step('import numpy')
+# QtGui and QtWidgets import QtCore: their steps include it
 from PyQt5.QtGui import (QColor, 
 						QDoubleValidator,
 						QKeySequence)
+startup.step('import PyQt5.QtGui')
 from PyQt5.QtWidgets import (QApplication, 
 							 QWidget, 
 							 QMainWindow, 
@@ -23,22 +51,45 @@ from PyQt5.QtWidgets import (QApplication,
 							 QGridLayout,
 							 QFrame,
 							 QSpinBox,
+							 QTableView,
 							 QTableWidget,
 							 QTableWidgetItem,
+							 QCheckBox,
 							 QHeaderView,
 							 QItemDelegate,
 							 QDoubleSpinBox,
 							 QStackedWidget,
 							 QDesktopWidget,
 							 QFileDialog,
+							 QProgressDialog,
+							 QMessageBox,
 							 QShortcut)
 from PyQt5.QtCore import (QObject, 
 						  pyqtSignal, 
-						  QLocale)
-
-# myPRL-qt modules:
-import myPRLCalibfuncs
+						  QLocale,
+						  Qt,
+						  QAbstractTableModel,
+						  QModelIndex,
+						  QTimer,
+						  QThread)
+startup.step('import PyQt5.QtWidgets')
+
+# myPRL-qt modules, each step includes the modules it is the first to use:
 import myPRLModels
+startup.step('import myPRLModels')
+import myPRLSpectra
+startup.step('import myPRLSpectra')
+import myPRLWatch
+startup.step('import myPRLWatch')
+import myPRLSession
+startup.step('import myPRLSession')
+import myPRLJournal
+startup.step('import myPRLJournal')
+import myPRLProfiling
+import myPRLExperiment
+startup.step('import myPRLExperiment')
+import myPRLQuery
+startup.step('import myPRLQuery')
 
 
 
@@ -48,133 +99,227 @@ class MyQSeparator(QFrame):
 		self.setFrameShape(QFrame.HLine)
 		self.setFrameShadow(QFrame.Sunken)
 
-class MplCanvas(FigureCanvas):
-    def __init__(self, parent=None, width=5, height=4, dpi=100):
-        fig = Figure(figsize=(width, height), dpi=dpi, constrained_layout=True)
-        self.axes = fig.add_subplot(111)
-        super(MplCanvas, self).__init__(fig)
-
-class PmPPlotWindow(QWidget):
-	def __init__(self, HPDataTable_, calibrations_):
+class HPTableModel(QAbstractTableModel):
+	''' Qt model on a HPDataTable. Follows HPDataTable.rowschanging and
+	rowschanged to tell the views exactly which rows are inserted or
+	removed, HPDataTable.changed for the values that changed.
+	Rows can be sorted and filtered on the values (myPRLQuery.RowView):
+	row i of the model is then row self.view.rows[i] of the table. '''
+	def __init__(self, HPDataTable_):
 		super().__init__()
 
-		self.setWindowTitle('myPRL-qt plot')
-
-		self.resize(500,400)
-
-		centerPoint = QDesktopWidget().availableGeometry().center()
-		thePosition = (centerPoint.x() + 300, centerPoint.y() - 400)
-		self.move(*thePosition)
+		self.table = HPDataTable_
+		self.columns = self.table.columns
+		self.view = myPRLQuery.RowView(self.table)
+		self.resetting = False # reset of the sorted view, until changed
 
-		self.data = HPDataTable_
-		self.calibrations = calibrations_
+		self.table.rowschanging.connect(self.on_rowschanging)
+		self.table.rowschanged.connect(self.on_rowschanged)
+		self.table.changed.connect(self.on_changed)
 
-		self.canvas = MplCanvas(self, width=5, height=4, dpi=100)
-		self.toolbar = NavigationToolbar(self.canvas, self)		
-		layout = QVBoxLayout()
+	def rowCount(self, parent=QModelIndex()):
+		return 0 if parent.isValid() else len(self.view)
 
-		layout.addWidget(self.toolbar)
-		layout.addWidget(self.canvas)
+	def columnCount(self, parent=QModelIndex()):
+		return 0 if parent.isValid() else len(self.columns)
 
-		self.setLayout(layout)
-
-#		self.updateplot()
+	def headerData(self, section, orientation, role=Qt.DisplayRole):
+		# called a lot by the vertical header: keep it cheap
+		if role != Qt.DisplayRole:
+			return None
+		if orientation == Qt.Horizontal:
+			return self.columns[section]
+		# row number in the table, also when sorted
+		return self.view.tablerow(section) + 1
+
+	def flags(self, index):
+		flags = super().flags(index)
+		if not index.isValid():
+			return flags
+		# I do not accept any calib change (for now a least), sP is
+		# computed from sx, sT, sx0 and sT0
+		if self.columns[index.column()] not in ('calib', 'sP'):
+			flags |= Qt.ItemIsEditable
+		return flags
+
+	def data(self, index, role=Qt.DisplayRole):
+		if role not in (Qt.DisplayRole, Qt.EditRole):
+			return None
 
-	def updateplot(self): 
+		# formatted on demand, for the rows on screen only
+		v = self.table.getitemval(self.view.tablerow(index.row()), 
+								  self.columns[index.column()])
+		if isinstance(v, float):
+			# print round() values in table
+			return str( round(v, 3) ) if role == Qt.DisplayRole else str(v)
+		elif isinstance(v, myPRLModels.HPCalibration):
+			return v.name
+		else:
+			return str(v)
 
-		self.canvas.axes.cla()
+	def setData(self, index, value, role=Qt.EditRole):
+		if role != Qt.EditRole:
+			return False
 
-		self.canvas.axes.set_xlabel('Pm (bar)')
-		self.canvas.axes.set_ylabel('P (GPa)')
+		row = self.view.tablerow(index.row())
+		key = self.columns[index.column()]
 
-		gr = self.data.df.groupby('calib')
-		groups = gr.groups.keys()
+		# takes care of types
+		if key in self.table.numcols:
+			try:
+				value = float(value)
+			except ValueError:
+				return False
 
-		for g in groups:
-			subdf = gr.get_group(g)
-			self.canvas.axes.plot(subdf['Pm'], 
-								  subdf['P'], 
-								  marker='o',
-								  color=self.calibrations[g].color,
-								  label=g)
-		if len(groups) != 0:
-			self.canvas.axes.legend()
-		self.canvas.draw()
+		# a single notification for the value and the recalculation
+		with self.table.batch():
+			self.table.setitemval(row, key, value)
 
-class HPTableWidget(QTableWidget):
+			if key == 'P':
+				try:
+					self.table.reinvcalc_item_P(row)
+				except ValueError:
+					# no x for this P: back to the P of the current x
+					self.table.recalc_item_P(row)
+			elif key in self.table.inputcols + self.table.sigmacols:
+				self.table.recalc_item_P(row)
+		return True
+
+	def sort(self, column, order=Qt.AscendingOrder):
+		# column -1: table order
+		self.beginResetModel()
+		self.view.set_sort(self.columns[column] if column >= 0 else None,
+						   order == Qt.DescendingOrder)
+		self.endResetModel()
+
+	def set_filter(self, text):
+		''' filter expression, see myPRLQuery. Raises ValueError if it
+		is invalid. '''
+		self.beginResetModel()
+		try:
+			self.view.set_filter(text)
+		finally:
+			self.endResetModel()
+
+	def on_rowschanging(self, change):
+		# the table is not modified yet: the views still see the old rows
+		if self.view.active:
+			# sorted or filtered: the view rows are made again at changed
+			if not self.resetting:
+				self.resetting = True
+				self.beginResetModel()
+		elif change.kind == 'insert':
+			self.beginInsertRows(QModelIndex(), change.first, change.last)
+		elif change.kind == 'remove':
+			self.beginRemoveRows(QModelIndex(), change.first, change.last)
+		else:
+			self.beginResetModel()
+
+	def on_rowschanged(self, change):
+		if self.view.active:
+			return
+		elif change.kind == 'insert':
+			self.endInsertRows()
+		elif change.kind == 'remove':
+			self.endRemoveRows()
+		else:
+			self.endResetModel()
+
+	@myPRLProfiling.timed('view.on_changed')
+	def on_changed(self, change):
+		# the table is already modified when this is received, and the
+		# rows were already inserted or removed in table order
+		moved = self.view.update(change)
+		if self.resetting:
+			self.resetting = False
+			self.endResetModel()
+		elif self.view.active and moved:
+			# sorted or filtered: rows are moved by the view, not their number
+			self.beginResetModel()
+			self.endResetModel()
+		elif change.kind in ('update', 'reset') and change.nrows > 0:
+			# (a 'reset' merged from a batch may hide updates)
+			if self.view.active:
+				rows = self.view.viewrows(change.first, change.last)
+			else:
+				rows = [change.first, change.last]
+			if len(rows):
+				cols = [self.columns.index(k) for k in change.columns]
+				self.dataChanged.emit(self.index(rows[0], min(cols)), 
+									  self.index(rows[-1], max(cols)))
+		elif change.kind == 'reset' and self.rowCount() > 0:
+			self.dataChanged.emit(self.index(0, 0), 
+					self.index(self.rowCount() - 1, self.columnCount() - 1))
+
+	def detach(self):
+		# from the table (not QObject.disconnect)
+		self.table.rowschanging.disconnect(self.on_rowschanging)
+		self.table.rowschanged.disconnect(self.on_rowschanged)
+		self.table.changed.disconnect(self.on_changed)
+
+
+class HPTableWidget(QTableView):
 	''' Qt widget class for HPDataTable objects '''
 	def __init__(self, HPDataTable_):
 		super().__init__()
 
 		self.data = HPDataTable_
+		self.setModel( HPTableModel(HPDataTable_) )
 
 		self.setStyleSheet('font-size: 12px;')
 
-		nrows, ncols = self.data.df.shape
-
-		self.setColumnCount(ncols)
-		self.setRowCount(nrows)
-
-		self.setHorizontalHeaderLabels( list(self.data.df.columns) )
 		self.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+		# fixed row heights: no need to look at all rows for the layout
+		self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
-		self.cellChanged[int,int].connect( self.getfromentry )
+		# sort on the values (see HPTableModel.sort), a third click on a
+		# column goes back to the table order
+		header = self.horizontalHeader()
+		header.setSectionsClickable(True)
+		header.setSortIndicatorShown(True)
+		header.setSortIndicator(-1, Qt.AscendingOrder)
+		header.sectionClicked.connect(self.sort_by)
 
 		deleteline_shortcut = QShortcut(QKeySequence("Ctrl+D"), self)
 		deleteline_shortcut.activated.connect(self.remove_line)
 
-	def getfromentry(self, row, col):
-		# takes care of types
-		try:
-			newval = float( self.item(row, col).text() )
-		except ValueError:
-			newval =  self.item(row, col).text()
-	
-		key = self.data.df.columns[col]
-	
-		if key != 'calib':
-			self.data.setitemval(row, key, newval)
-
-			if key == 'P':
-				self.data.reinvcalc_item_P(row)
-			elif key in ['x', 'x0', 'T', 'T0'] :
-				self.data.recalc_item_P(row)
-	
-		else: # k = calib 
-			# I do not accept any calib change (for now a least)
-			pass
-
-	def updatetable(self):
-
-		nrows, ncols = self.data.df.shape
-		self.setRowCount(nrows)
-
-		# Absolutely necessary to disconnect otherwise infinite loop
-		self.cellChanged[int,int].disconnect()
-
-		for irow in range(self.rowCount()):
-			for icol in range(self.columnCount()):
-
-				# print round() values in table
-				v = self.data.df.iloc[irow,icol]
-				if isinstance(v, (int, float)):
-					s = str( round(v, 3) )
-				else:
-					s = str( v )
-
-				self.setItem(irow, icol, QTableWidgetItem(s))
-
-		self.cellChanged[int,int].connect( self.getfromentry )
-		
+	def settable(self, HPDataTable_):
+		# another run: a new model, no copy of the table, same sort and
+		# filter
+		old = self.model()
+		old.detach()
+		self.data = HPDataTable_
+		model = HPTableModel(HPDataTable_)
+		if old.view.filter is not None:
+			model.view.set_filter(old.view.filter.text)
+		model.view.set_sort(old.view.column, old.view.descending)
+		self.setModel(model)
+		old.deleteLater()
+
+	@myPRLProfiling.timed('view.sort')
+	def sort_by(self, section):
+		view = self.model().view
+		if view.column != self.model().columns[section]:
+			order = Qt.AscendingOrder
+		elif not view.descending:
+			order = Qt.DescendingOrder
+		else:
+			section, order = -1, Qt.AscendingOrder
+		self.model().sort(section, order)
+		self.horizontalHeader().setSortIndicator(section, order)
 
 	def remove_line(self):
-		index = self.currentRow()
+		index = self.currentIndex().row()
 		if index >= 0:
-			self.data.removespecific(index)
+			self.data.removespecific(self.model().view.tablerow(index))
 
 
 
 class HPTableWindow(QWidget):
+
+	# path of the session or .csv file saved or loaded
+	filechanged = pyqtSignal(str)
+
 	def __init__(self, HPDataTable_, calibrations_):
 		super().__init__()
 
@@ -189,49 +334,143 @@ class HPTableWindow(QWidget):
 		self.move(*thePosition)
 
 		layout = QVBoxLayout()
+
+		# filter of the rows, see myPRLQuery
+		self.filter_edit = QLineEdit()
+		self.filter_edit.setPlaceholderText(
+							'filter, e.g. P > 20 and calib == Ruby2020')
+		self.filter_edit.setClearButtonEnabled(True)
+		self.count_label = QLabel('')
+		filter_layout = QHBoxLayout()
+		filter_layout.addWidget(self.filter_edit)
+		filter_layout.addWidget(self.count_label)
+		layout.addLayout(filter_layout)
 		
 		self.table_widget = HPTableWidget(HPDataTable_)
 		layout.addWidget(self.table_widget)
+		self.connect_model()
 		
 		table_actions_layout = QHBoxLayout()
 
-		self.table_save_csv_button = QPushButton('Save data to csv')
-		self.table_load_csv_button = QPushButton('Load data from csv')
+		self.table_save_csv_button = QPushButton('Save data')
+		self.table_load_csv_button = QPushButton('Load data')
+		self.uncertainty_combo = QComboBox()
+		self.uncertainty_combo.addItem('sP: linear', 'linear')
+		self.uncertainty_combo.addItem('sP: Monte Carlo', 'montecarlo')
 		table_actions_layout.addWidget(self.table_save_csv_button)
 		table_actions_layout.addWidget(self.table_load_csv_button)
+		table_actions_layout.addWidget(self.uncertainty_combo)
 
 		layout.addLayout(table_actions_layout)
 
 		self.setLayout(layout)
 
+		self.filter_edit.returnPressed.connect(self.apply_filter)
+		# cleared: all rows again
+		self.filter_edit.textChanged.connect(
+				lambda text: self.apply_filter() if not text else None)
+
 		self.table_save_csv_button.clicked.connect(self.save_data_to_csv)
 		self.table_load_csv_button.clicked.connect(self.load_data_from_csv)
+		self.uncertainty_combo.currentIndexChanged.connect(
+			lambda i: self.data.set_uncertainty(self.uncertainty_combo.itemData(i)))
+		# also changed by undo and redo
+		self.data.methodchanged.connect(self.show_uncertainty)
 
 		save_shortcut = QShortcut(QKeySequence("Ctrl+S"), self)
 		load_shortcut = QShortcut(QKeySequence("Ctrl+O"), self)
 		save_shortcut.activated.connect(self.save_data_to_csv)
 		load_shortcut.activated.connect(self.load_data_from_csv)
 
+		# self.data changes with the active run
+		undo_shortcut = QShortcut(QKeySequence("Ctrl+Z"), self)
+		undo_shortcut.activated.connect(lambda: self.data.undo())
+		for key in ["Ctrl+Y", "Ctrl+Shift+Z"]:
+			redo_shortcut = QShortcut(QKeySequence(key), self)
+			redo_shortcut.activated.connect(lambda: self.data.redo())
+
 
+	# sessions are saved in the binary myPRLSession format, .csv files 
+	# are text exports
 	def save_data_to_csv(self):
 		file = self.get_save_filename_dialog()
-		if file:
-			self.data.df.to_csv(file, 
-								sep='\t', 
-								decimal='.', 
-								header=True,
-								index=False)
+		if not file:
+			return
+		if file.lower().endswith('.csv'):
+			with myPRLProfiling.section('io.csv_save'):
+				self.data.df.to_csv(file, 
+									sep='\t', 
+									decimal='.', 
+									header=True,
+									index=False)
+		else:
+			myPRLSession.save_session(self.data, file)
+		self.filechanged.emit(file)
 
 	def load_data_from_csv(self):
 		file = self.get_load_filename_dialog()
-		if file:
-			df_ = pd.read_csv(file, 
-							  sep='\t', 
-							  decimal='.', 
-							  header=[0],
-							  index_col=None)
-
-		self.data.reconstruct_from_df(df_, self.calibrations)
+		if not file:
+			return
+		# the table is left as it is when the file cannot be read
+		try:
+			# sessions saved under any name
+			if myPRLSession.is_session(file):
+				myPRLSession.load_session(file, self.data, self.calibrations)
+			else:
+				import pandas as pd
+				with myPRLProfiling.section('io.csv_load'):
+					df_ = pd.read_csv(file, 
+									  sep='\t', 
+									  decimal='.', 
+									  header=[0],
+									  index_col=None)
+					self.data.reconstruct_from_df(df_, self.calibrations)
+		except Exception as e:
+			# newer session, corrupt or unknown file, unknown calibration...
+			QMessageBox.warning(self, 'myPRL-qt', 
+						'Could not load {}:\n{}'.format(file, e))
+			return
+
+		self.show_uncertainty()
+		self.filechanged.emit(file)
+
+	def settable(self, HPDataTable_):
+		self.data.methodchanged.disconnect(self.show_uncertainty)
+		self.data = HPDataTable_
+		self.data.methodchanged.connect(self.show_uncertainty)
+		self.table_widget.settable(HPDataTable_)
+		self.connect_model()
+		self.show_uncertainty()
+
+	def connect_model(self):
+		model = self.table_widget.model()
+		for signal in (model.modelReset, model.rowsInserted, model.rowsRemoved):
+			signal.connect(self.update_count)
+		self.update_count()
+
+	@myPRLProfiling.timed('view.filter')
+	def apply_filter(self):
+		try:
+			self.table_widget.model().set_filter(self.filter_edit.text())
+		except ValueError as e:
+			self.filter_edit.setStyleSheet('background: #ff7575;')
+			self.filter_edit.setToolTip(str(e))
+			return
+		self.filter_edit.setStyleSheet('')
+		self.filter_edit.setToolTip('')
+		self.update_count()
+
+	def update_count(self, *args):
+		# rows shown when filtered
+		view = self.table_widget.model().view
+		self.count_label.setText('' if view.filter is None else 
+						'{} / {} rows'.format(len(view), len(self.data)))
+
+	def show_uncertainty(self, *args):
+		self.uncertainty_combo.blockSignals(True)
+		self.uncertainty_combo.setCurrentIndex(
+						self.uncertainty_combo.findData(self.data.uncertainty))
+		self.uncertainty_combo.blockSignals(False)
 
 	def get_save_filename_dialog(self):
 
@@ -242,8 +481,9 @@ class HPTableWindow(QWidget):
 
 		fileName, fileType = \
 			QFileDialog.getSaveFileName(self,
-										"myPRL-qt: Save data to csv", 
+										"myPRL-qt: Save data", 
 										"",
+										"myPRL session (*.myprl);;"
 										"CSV Files (*.csv);;All Files (*)", 
 										options=options)
 
@@ -252,6 +492,9 @@ class HPTableWindow(QWidget):
 				pass
 			else:
 				fileName += '.csv'
+		elif fileType == 'myPRL session (*.myprl)':
+			if not fileName.endswith(myPRLSession.EXTENSION):
+				fileName += myPRLSession.EXTENSION
 
 		if fileName:
 			return fileName
@@ -267,9 +510,10 @@ class HPTableWindow(QWidget):
 
 		fileName, _ = \
 			QFileDialog.getOpenFileName(self,
-										"myPRL-qt: Load data from csv", 
+										"myPRL-qt: Load data", 
 										"",
-										"CSV Files (*.csv);;All Files (*)", 
+										"myPRL session or CSV (*.myprl *.csv);;"
+										"All Files (*)", 
 										options=options)
 		if fileName:
 			return fileName
@@ -277,58 +521,216 @@ class HPTableWindow(QWidget):
 			return None
 
 
+class ProfilingWindow(QWidget):
+	''' Diagnostics: report of myPRLProfiling, refreshed every second 
+	while shown '''
+	headers = ['name', 'count', 'total (s)', 'p50 (ms)', 'p99 (ms)', 'max (ms)']
+
+	def __init__(self):
+		super().__init__()
+
+		self.setWindowTitle('myPRL-qt diagnostics')
+		self.resize(600, 400)
+
+		layout = QVBoxLayout()
+
+		self.enable_checkbox = QCheckBox('Time the hot paths')
+		self.enable_checkbox.setChecked(myPRLProfiling.enabled)
+		layout.addWidget(self.enable_checkbox)
+
+		self.report_table = QTableWidget(0, len(self.headers))
+		self.report_table.setHorizontalHeaderLabels(self.headers)
+		self.report_table.setEditTriggers(QTableWidget.NoEditTriggers)
+		self.report_table.verticalHeader().setVisible(False)
+		self.report_table.horizontalHeader().setSectionResizeMode(
+														QHeaderView.Stretch)
+		layout.addWidget(self.report_table)
+
+		actions_layout = QHBoxLayout()
+		self.reset_button = QPushButton('Reset')
+		self.export_button = QPushButton('Export...')
+		actions_layout.addWidget(self.reset_button)
+		actions_layout.addWidget(self.export_button)
+		layout.addLayout(actions_layout)
+
+		self.setLayout(layout)
+
+		self.enable_checkbox.toggled.connect(myPRLProfiling.enable)
+		self.reset_button.clicked.connect(self.reset)
+		self.export_button.clicked.connect(self.export)
+
+		self.refresh_timer = QTimer(self)
+		self.refresh_timer.setInterval(1000)
+		self.refresh_timer.timeout.connect(self.refresh)
+
+	def showEvent(self, event):
+		super().showEvent(event)
+		self.enable_checkbox.setChecked(myPRLProfiling.enabled)
+		self.refresh()
+		self.refresh_timer.start()
+
+	def hideEvent(self, event):
+		self.refresh_timer.stop()
+		super().hideEvent(event)
+
+	def refresh(self):
+		rows = myPRLProfiling.report()
+		self.report_table.setRowCount(len(rows))
+		for i, row in enumerate(rows):
+			texts = [row['name'], str(row['count']), 
+					 '{:.3f}'.format(row['total'])] + \
+					['{:.3f}'.format(1e3 * row[k]) for k in ('p50', 'p99', 'max')]
+			for j, text in enumerate(texts):
+				item = QTableWidgetItem(text)
+				if j > 0:
+					item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+				self.report_table.setItem(i, j, item)
+
+	def reset(self):
+		myPRLProfiling.reset()
+		self.refresh()
+
+	def export(self):
+		fileName, _ = QFileDialog.getSaveFileName(self, 
+										"myPRL-qt: Export diagnostics", 
+										"",
+										"JSON (*.json);;Text (*.txt)")
+		if fileName:
+			myPRLProfiling.export(fileName)
+
+
+class BatchFitWorker(QObject):
+	''' Runs a myPRLBatch.BatchFit in a QThread '''
+	progress = pyqtSignal(int, int)
+	# the run failed, before finished
+	error = pyqtSignal(str)
+	finished = pyqtSignal()
+
+	def __init__(self, batch):
+		super().__init__()
+		self.batch = batch
+		self.cancelled = False
+		self.failed = False
+
+	def run(self):
+		try:
+			self.batch.run(progress=self.progress.emit, 
+						   cancel=lambda: self.cancelled)
+		except Exception as e:
+			# e.g. a broken process pool, or arguments that do not pickle
+			self.failed = True
+			self.error.emit('{}: {}'.format(type(e).__name__, e))
+		finally:
+			self.finished.emit()
+
+	def cancel(self):
+		self.cancelled = True
+
+
+@myPRLProfiling.timed('compute.point')
+def compute_point(point, inverse, cached=True):
+	''' P and sP of point (x and sP with inverse), in place. 
+	Returns (value, sP, ok). cached: through the interpolation grids of 
+	the calibrations, the inputs change a lot, T, x0 and T0 seldom. '''
+	try:
+		if inverse:
+			point.invcalcP(cached=cached)
+			value = point.x
+		else:
+			point.calcP(cached=cached)
+			value = point.P
+		return float(value), point.sP, bool(np.isfinite(value))
+	except Exception:
+		return np.nan, np.nan, False
+
+
+class ComputeWorker(QObject):
+	''' Computes the main window buffer in a QThread. Only the latest request
+	is computed: a request replaces the one waiting, and the result of a
+	request that became stale while computing is dropped. '''
+	result = pyqtSignal(int, bool, float, float, bool, float) # id, inverse, value, sP, ok, t
+	wake = pyqtSignal()
+
+	def __init__(self):
+		super().__init__()
+		self.lock = threading.Lock()
+		self.latest = None
+		self.wake.connect(self.process)
+
+	def request(self, id_, point, inverse, t):
+		# called from the GUI thread, point is a copy of the buffer
+		with self.lock:
+			self.latest = (id_, point, inverse, t)
+		self.wake.emit()
+
+	def process(self):
+		with self.lock:
+			req, self.latest = self.latest, None
+		if req is None:
+			# already taken by a previous wake
+			return
+		id_, point, inverse, t = req
+		value, sP, ok = compute_point(point, inverse)
+		with self.lock:
+			stale = self.latest is not None
+		if not stale:
+			self.result.emit(id_, inverse, value, sP, ok, t)
+
+
 class MyPRLMain(QMainWindow):
+
+	# crash-safe autosave of the tables, see myPRLJournal: a folder of
+	# autosave_folder per running instance, the first run at its top, the
+	# others in its runs/<k> subfolders
+	autosave_folder = myPRLJournal.default_folder()
+	autosave_interval = 250 # ms between fsyncs
+
 	def __init__(self):
 		super().__init__()
 
-		Ruby2020 = myPRLModels.HPCalibration(name = 'Ruby2020',
-							     func = myPRLCalibfuncs.Pruby2020,
-							     Tcor_name='Datchi 2007',
-							     xname = 'lambda',
-							     xunit = 'nm',
-							     x0default = 694.28,
-							     xstep = .01,
-							     color = 'lightcoral')
-
-		SamariumDatchi = myPRLModels.HPCalibration(name = 'Samarium Borate Datchi 1997',
-							     	   func = myPRLCalibfuncs.PsamDatchi1997,
-							     	   Tcor_name='NA',
-							     	   xname = 'lambda',
-							     	   xunit = 'nm',
-							     	   x0default = 685.41,
-							     	   xstep = .01,
-							     	   color = 'moccasin')
-
-		Akahama2006 = myPRLModels.HPCalibration(name = 'Diamond Raman Edge Akahama 2006',
-							     	func = myPRLCalibfuncs.PAkahama2006,
-							     	Tcor_name='NA',
-							     	xname = 'nu',
-							     	xunit = 'cm-1',
-							     	x0default = 1333,
-							     	xstep = .1,
-							     	color = 'darkgrey')
-
-		cBNDatchi = myPRLModels.HPCalibration(name = 'cBN Raman Datchi 2007',
-							      func = myPRLCalibfuncs.PcBN,
-							      Tcor_name='Datchi 2007',
-							      xname = 'nu',
-							      xunit = 'cm-1',
-							      x0default = 1054,
-							      xstep = .1,
-							      color = 'lightblue')
-
-		calib_list = [Ruby2020, 
-					  SamariumDatchi, 
-					  Akahama2006, 
-					  cBNDatchi]
-
-###############################################################################
-
-
-		self.calibrations = {a.name:a for a in calib_list}
-		self.data = myPRLModels.HPDataTable()
-		self.DataTableWindow = HPTableWindow(self.data, self.calibrations)
-		self.PmPplot_win = PmPPlotWindow(self.data, self.calibrations)
+		# name: HPCalibration
+		self.calibrations = myPRLModels.default_calibrations()
+		startup.step('main window: calibrations')
+		# runs of the experiment, self.data is the table of the active one
+		self.experiment = myPRLExperiment.Experiment()
+		self.data = self.experiment.add_run().table
+		startup.step('main window: experiment')
+		self.journals = None # run name: Journal, see start_autosave
+		self.instance_folder = None # ours in autosave_folder, and its lock
+		self.instance_lock = None
+		# secondary windows, built on first use (see the properties below)
+		self._DataTableWindow = None
+		self._PmPplot_win = None
+		self._spectrum_win = None
+		self._profiling_win = None
+		self._isobar_win = None
+
+		self.batch_thread = None
+		self.batch_table = None # table of the active run at the start
+		self.batch_nworkers = None # all cores
+		self.batch_next = [] # (files, points) to fit after, see fit_skipped
+
+		self.live_thread = None
+		self.live_patterns = ('*.txt', '*.dat', '*.csv', '*.asc')
+		# (path, point) dropped or failed live, see fit_skipped
+		self.live_skipped = []
+
+		# P (or x) computation: requests are numbered, only the result of
+		# the last one is shown. Bursts of valueChanged within debounce ms 
+		# make one request.
+		self.compute_id = 0
+		self.compute_done = 0
+		self.compute_t = None
+		self.compute_timer = QTimer(self)
+		self.compute_timer.setSingleShot(True)
+		self.compute_timer.setInterval(10) # debounce, ms
+		self.compute_timer.timeout.connect(self.compute)
+		self.compute_thread = QThread()
+		self.compute_worker = ComputeWorker()
+		self.compute_worker.moveToThread(self.compute_thread)
+		self.compute_worker.result.connect(self.show_result)
+		self.compute_thread.start()
+		startup.step('main window: compute thread')
 
 		# this will be our initial state
 		self.buffer = myPRLModels.HPData(Pm = 0, 
@@ -348,7 +750,7 @@ class MyPRLMain(QMainWindow):
 		self.setLocale(QLocale(QLocale.C))
 
 		self.setWindowTitle("myPRL-qt")
-		self.resize(240, 325)
+		self.resize(320, 440)
 
 		# large layout containing all widgets
 		layout = QVBoxLayout()
@@ -387,6 +789,19 @@ class MyPRLMain(QMainWindow):
 		self.T0_spinbox.setRange(-np.inf, +np.inf)
 		self.T0_spinbox.setSingleStep(1)
 
+		# uncertainties (1 sigma) of x, T, x0, T0, and the resulting sP
+		self.sigma_spinboxes = {}
+		for key, decimals, step in [('sx', 3, .01), ('sT', 0, 1), 
+									('sx0', 3, .01), ('sT0', 0, 1)]:
+			spinbox = QDoubleSpinBox()
+			spinbox.setObjectName(key + '_spinbox')
+			spinbox.setPrefix('± ')
+			spinbox.setDecimals(decimals)
+			spinbox.setRange(0, +np.inf)
+			spinbox.setSingleStep(step)
+			self.sigma_spinboxes[key] = spinbox
+		self.sP_label = QLabel('± 0.000')
+
 
 		self.calibration_combo = QComboBox()
 		self.calibration_combo.setObjectName('calibration_combo')
@@ -399,28 +814,64 @@ class MyPRLMain(QMainWindow):
 			self.calibration_combo.model().item(ind).setBackground(QColor(
 				v.color))
 
+		# runs: active one, new run, cell of the active run
+		self.run_combo = QComboBox()
+		self.run_combo.setObjectName('run_combo')
+		self.newrun_button = QPushButton('New run')
+		self.cell_edit = QLineEdit()
+		self.cell_edit.setObjectName('cell_edit')
+		self.cell_edit.setPlaceholderText('cell / sample')
+
 		self.x_label = QLabel('lambda (nm)')
 		self.x0_label = QLabel('lambda0 (nm)')
 
 		# pressure form
 		pressure_form = QFormLayout()
 		pressure_form.addRow('Pm (bar)', self.Pm_spinbox)
-		pressure_form.addRow('P (GPa)', self.P_spinbox)
+		P_layout = QHBoxLayout()
+		P_layout.addWidget(self.P_spinbox)
+		P_layout.addWidget(self.sP_label)
+		pressure_form.addRow('P (GPa)', P_layout)
 
 
-		# data form
+		# data form: value and uncertainty on each row
 		data_form = QFormLayout()
-		data_form.addRow(self.x_label, self.x_spinbox)
-		data_form.addRow('T (K)', self.T_spinbox)
-		data_form.addRow(self.x0_label, self.x0_spinbox)
-		data_form.addRow('T0 (K)', self.T0_spinbox)
+		for label, spinbox, key in [(self.x_label, self.x_spinbox, 'sx'),
+									('T (K)', self.T_spinbox, 'sT'),
+									(self.x0_label, self.x0_spinbox, 'sx0'),
+									('T0 (K)', self.T0_spinbox, 'sT0')]:
+			row_layout = QHBoxLayout()
+			row_layout.addWidget(spinbox)
+			row_layout.addWidget(self.sigma_spinboxes[key])
+			data_form.addRow(label, row_layout)
+
+		self.fit_button = QPushButton('Fit spectrum...')
+		self.batchfit_button = QPushButton('Batch...')
+		self.live_button = QPushButton('Live...')
+		self.live_button.setCheckable(True)
+		fit_layout = QHBoxLayout()
+		fit_layout.addWidget(self.fit_button)
+		fit_layout.addWidget(self.batchfit_button)
+		fit_layout.addWidget(self.live_button)
+		data_form.addRow(fit_layout)
 
 
 		self.Tcor_Label = QLabel('NA')
 
 		calibration_form = QFormLayout()
 		calibration_form.addRow(QLabel('Calibration: '), self.calibration_combo)
-		calibration_form.addRow(QLabel('T correction: '), self.Tcor_Label)
+		self.isobars_button = QPushButton('Isobars...')
+		Tcor_layout = QHBoxLayout()
+		Tcor_layout.addWidget(self.Tcor_Label)
+		Tcor_layout.addWidget(self.isobars_button)
+		calibration_form.addRow(QLabel('T correction: '), Tcor_layout)
+
+		run_form = QFormLayout()
+		run_layout = QHBoxLayout()
+		run_layout.addWidget(self.run_combo, 1)
+		run_layout.addWidget(self.newrun_button)
+		run_form.addRow(QLabel('Run: '), run_layout)
+		run_form.addRow(QLabel('Cell: '), self.cell_edit)
 
 
 		self.add_button = QPushButton('+')
@@ -460,6 +911,12 @@ class MyPRLMain(QMainWindow):
 		layout.addWidget(MyQSeparator())
 		layout.addStretch()
 
+		layout.addLayout(run_form)
+
+		layout.addStretch()
+		layout.addWidget(MyQSeparator())
+		layout.addStretch()
+
 		layout.addLayout(actions_form)
 
 
@@ -468,6 +925,7 @@ class MyPRLMain(QMainWindow):
 		vcontainer.setLayout(layout)
 		self.setCentralWidget(vcontainer)	
 		#self.setLayout(layout) #only if inherits from QWidget/not QMainWindow
+		startup.step('main window: widgets')
 
 		# set some initial values 
 		self.Pm_spinbox.setValue(self.buffer.Pm)
@@ -491,11 +949,26 @@ class MyPRLMain(QMainWindow):
 		self.x0_spinbox.valueChanged.connect(self.update)
 		self.T_spinbox.valueChanged.connect(self.update)
 		self.T0_spinbox.valueChanged.connect(self.update)
+		for spinbox in self.sigma_spinboxes.values():
+			spinbox.valueChanged.connect(self.update)
 
 		self.add_button.clicked.connect(self.add_to_data)
 		self.removelast_button.clicked.connect(self.removelast)
 
 		self.PmPplot_button.clicked.connect(self.showPmPplot)
+		self.isobars_button.clicked.connect(self.showisobars)
+
+		self.run_combo.currentTextChanged.connect(self.select_run)
+		self.newrun_button.clicked.connect(self.new_run)
+		self.cell_edit.editingFinished.connect(self.set_cell)
+		self.experiment.runschanged.connect(self.update_runs)
+		self.experiment.runschanged.connect(self.update_journals)
+		self.experiment.activechanged.connect(self.set_run)
+		self.update_runs()
+
+		self.fit_button.clicked.connect(self.fit_spectrum_file)
+		self.batchfit_button.clicked.connect(self.batch_fit_files)
+		self.live_button.toggled.connect(self.toggle_live)
 
 		# shortcuts
 
@@ -505,44 +978,162 @@ class MyPRLMain(QMainWindow):
 		removelast_shortcut = QShortcut(QKeySequence("Ctrl+R"), self)
 		removelast_shortcut.activated.connect(self.removelast)
 
+		fit_shortcut = QShortcut(QKeySequence("Ctrl+F"), self)
+		fit_shortcut.activated.connect(self.fit_spectrum_file)
+
+		batchfit_shortcut = QShortcut(QKeySequence("Ctrl+Shift+F"), self)
+		batchfit_shortcut.activated.connect(self.batch_fit_files)
+
 		showtable_shortcut = QShortcut(QKeySequence("Ctrl+T"), self)
 		showtable_shortcut.activated.connect(self.showtable)
 
+		diagnostics_shortcut = QShortcut(QKeySequence("Ctrl+Shift+D"), self)
+		diagnostics_shortcut.activated.connect(self.showprofiling)
+
+		# undo / redo of the table changes of the active run, see 
+		# HPDataTable.undo
+		undo_shortcut = QShortcut(QKeySequence("Ctrl+Z"), self)
+		undo_shortcut.activated.connect(lambda: self.data.undo())
+		for key in ["Ctrl+Y", "Ctrl+Shift+Z"]:
+			redo_shortcut = QShortcut(QKeySequence(key), self)
+			redo_shortcut.activated.connect(lambda: self.data.redo())
+
 		self.table_button.clicked.connect(self.showtable)
+		startup.step('main window: connects')
 
-		self.data.changed.connect(self.DataTableWindow.table_widget.updatetable)
-		self.data.changed.connect(self.PmPplot_win.updateplot)
 #		self.data.changed.connect(self.testreceive)
 
 		# 1 cause it needs a signal
 		self.updatecalib(1)	
 		# for some reason updatecalib does not call update at __init__
 		self.update(1)
+		startup.step('main window: first computation')
+
+		self.start_autosave()
+		startup.step('autosave')
+
+	@property
+	def DataTableWindow(self):
+		if self._DataTableWindow is None:
+			self._DataTableWindow = HPTableWindow(self.data, self.calibrations)
+			self._DataTableWindow.filechanged.connect(
+				lambda path: self.experiment.set_tags(self.experiment.active.name,
+											file=os.path.basename(path)))
+		return self._DataTableWindow
+
+	@property
+	def PmPplot_win(self):
+		if self._PmPplot_win is None:
+			import myPRLPlots
+			run = self.experiment.active
+			self._PmPplot_win = myPRLPlots.PmPPlotWindow(run.table, 
+														 self.calibrations,
+														 run.models,
+														 run.index)
+			self.data.changed.connect(self._PmPplot_win.updateplot)
+		return self._PmPplot_win
+
+	@property
+	def spectrum_win(self):
+		if self._spectrum_win is None:
+			import myPRLPlots
+			self._spectrum_win = myPRLPlots.SpectrumPlotWindow()
+		return self._spectrum_win
+
+	@property
+	def isobar_win(self):
+		if self._isobar_win is None:
+			import myPRLPlots
+			self._isobar_win = myPRLPlots.IsobarWindow(self.calibrations, 
+													   self.buffer.calib)
+		return self._isobar_win
+
+	@property
+	def profiling_win(self):
+		if self._profiling_win is None:
+			self._profiling_win = ProfilingWindow()
+		return self._profiling_win
 
 #	def testreceive(self):
 #		print('changed!')
 
 	def add_to_data(self):
-		self.data.add(self.buffer)
+		# the last inputs may not be computed yet
+		self.flush_compute()
+		# shown values are interpolated (see compute_point): exact ones in
+		# the table
+		point = copy.copy(self.buffer)
+		compute_point(point, self.P_spinbox.hasFocus(), cached=False)
+		self.data.add(point)
 	#	print(self.data)
 
 	def removelast(self):
 		if len(self.data) > 0:
 			self.data.removelast()
 
-		# update is called two time, not very good but working
-	def update(self, s):
-
-		if self.P_spinbox.hasFocus():
+	def new_run(self, s=None):
+		# same cell and uncertainty as the active run: set before its
+		# journal starts, no undo step
+		active = self.experiment.active
+		table = myPRLModels.HPDataTable()
+		table.uncertainty = active.table.uncertainty
+		table.ndraws = active.table.ndraws
+		run = self.experiment.add_run(table=table, **active.tags)
+		self.experiment.set_active(run.name)
+
+	def select_run(self, name):
+		if name in self.experiment:
+			self.experiment.set_active(name)
+
+	def set_cell(self):
+		cell = self.cell_edit.text().strip() or None
+		if cell != self.experiment.active.tags.get('cell'):
+			self.experiment.set_tags(self.experiment.active.name, cell=cell)
+
+	def update_runs(self):
+		# names of the runs, their tags as tooltips
+		self.run_combo.blockSignals(True)
+		self.run_combo.clear()
+		for name, run in self.experiment.runs.items():
+			self.run_combo.addItem(name)
+			tags = ', '.join('{}: {}'.format(k, v) for k, v in run.tags.items())
+			self.run_combo.setItemData(self.run_combo.count() - 1, tags, 
+									   Qt.ToolTipRole)
+		self.run_combo.setCurrentText(self.experiment.active.name)
+		self.run_combo.blockSignals(False)
+
+	@myPRLProfiling.timed('main.set_run')
+	def set_run(self, run):
+		# the windows follow the table of the active run: no copy, and its
+		# index and models are kept by the run
+		old = self.data
+		self.data = run.table
+		if self._DataTableWindow is not None:
+			self._DataTableWindow.settable(run.table)
+		if self._PmPplot_win is not None:
+			old.changed.disconnect(self._PmPplot_win.updateplot)
+			self._PmPplot_win.settable(run.table, run.models, run.index)
+			run.table.changed.connect(self._PmPplot_win.updateplot)
+
+		self.run_combo.blockSignals(True)
+		self.run_combo.setCurrentText(run.name)
+		self.run_combo.blockSignals(False)
+		self.cell_edit.setText(run.tags.get('cell', ''))
+
+	def update(self, s=None):
+		# computed by compute_worker after the debounce delay
+		if self.compute_t is None:
+			self.compute_t = time.perf_counter()
+		if not self.compute_timer.isActive():
+			self.compute_timer.start()
+
+	def read_inputs(self):
+		# P typed in: x is computed, else P
+		inverse = self.P_spinbox.hasFocus()
+		for key, spinbox in self.sigma_spinboxes.items():
+			setattr(self.buffer, key, spinbox.value())
+		if inverse:
 			self.buffer.P = self.P_spinbox.value()
-			try:
-				self.buffer.invcalcP()
-				self.x_spinbox.setValue(self.buffer.x)
-				
-				self.x_spinbox.setStyleSheet("background: #c6fcc5;") # green
-			except:
-				self.x_spinbox.setStyleSheet("background: #ff7575;") # red
-
 		else:
 			# read everything stupidly
 			self.buffer.Pm = self.Pm_spinbox.value()
@@ -550,15 +1141,55 @@ class MyPRLMain(QMainWindow):
 			self.buffer.T = self.T_spinbox.value()
 			self.buffer.x0 = self.x0_spinbox.value()
 			self.buffer.T0 = self.T0_spinbox.value()
+		return inverse
+
+	def compute(self):
+		inverse = self.read_inputs()
+		self.compute_id += 1
+		self.compute_worker.request(self.compute_id, copy.copy(self.buffer), 
+									inverse, self.compute_t)
+		self.compute_t = None
+
+	def flush_compute(self):
+		# computes the pending inputs now, in the GUI thread
+		if not self.compute_timer.isActive() and \
+		   self.compute_done == self.compute_id:
+			return
+		self.compute_timer.stop()
+		t = self.compute_t if self.compute_t is not None else time.perf_counter()
+		inverse = self.read_inputs()
+		self.compute_id += 1 # the result on the way is stale
+		value, sP, ok = compute_point(copy.copy(self.buffer), inverse)
+		self.compute_t = None
+		self.show_result(self.compute_id, inverse, value, sP, ok, t)
+
+	def show_result(self, id_, inverse, value, sP, ok, t):
+		if id_ != self.compute_id:
+			return
+		self.compute_done = id_
+
+		spinbox = self.x_spinbox if inverse else self.P_spinbox
+		if inverse:
+			if ok:
+				self.buffer.x = value
+		else:
+			self.buffer.P = value
+		self.buffer.sP = sP
+		self.sP_label.setText('± {:.3f}'.format(sP))
+		if ok:
+			# not an input: no update from here
+			spinbox.blockSignals(True)
+			spinbox.setValue(value)
+			spinbox.blockSignals(False)
+			spinbox.setStyleSheet("background: #c6fcc5;") # green
+		else:
+			spinbox.setStyleSheet("background: #ff7575;") # red
 
-			try:
-				self.buffer.calcP()
-				self.P_spinbox.setValue(self.buffer.P)
-				
-				self.P_spinbox.setStyleSheet("background: #c6fcc5;") # green
-			except:
-				self.P_spinbox.setStyleSheet("background: #ff7575;") # red
-			
+		latency = time.perf_counter() - t
+		if myPRLProfiling.enabled:
+			myPRLProfiling.record('main.input_to_result', latency)
+		self.statusBar().showMessage('{} = {:.4g} shown {:.1f} ms after input'
+					.format('x' if inverse else 'P', value, 1e3 * latency))
 
 
 	def updatecalib(self, s):
@@ -578,12 +1209,403 @@ class MyPRLMain(QMainWindow):
 		self.x0_label.setText('{}0 ({})'.format(self.buffer.calib.xname, 
 													self.buffer.calib.xunit))
 
+		self.fit_button.setEnabled(self.buffer.calib.fitmodel is not None)
+		self.batchfit_button.setEnabled(self.buffer.calib.fitmodel is not None)
+		if self.buffer.calib.fitmodel is None:
+			self.live_button.setChecked(False)
+		self.live_button.setEnabled(self.buffer.calib.fitmodel is not None)
+
 		self.x_spinbox.setSingleStep(self.buffer.calib.xstep)
 		self.x0_spinbox.setSingleStep(self.buffer.calib.xstep)
 
 		# note that this should call update() but it does not at __init__ !!
 		self.x0_spinbox.setValue(self.buffer.calib.x0default)
 
+	def fit_spectrum_file(self, s=None):
+		if self.buffer.calib.fitmodel is None:
+			return
+
+		file, _ = QFileDialog.getOpenFileName(self,
+									"myPRL-qt: Fit spectrum", 
+									"",
+									"Spectra (*.txt *.dat *.csv *.asc);;All Files (*)")
+		if not file:
+			return
+		try:
+			x, y = myPRLSpectra.load_spectrum(file)
+			fit = myPRLSpectra.fit_spectrum(self.buffer.calib, x, y)
+		except Exception:
+			self.x_spinbox.setStyleSheet("background: #ff7575;") # red
+			return
+
+		self.buffer.file = os.path.basename(file)
+		self.x_spinbox.setValue(fit.x)
+		self.x_spinbox.setStyleSheet("background: #c6fcc5;") # green
+
+		self.spectrum_win.updateplot(x, y, fit, self.buffer.calib, 
+													self.buffer.file)
+		self.spectrum_win.show()
+
+	def batch_fit_files(self, s=None, files=None, points=None):
+		# fits many files (asked for if None) on a process pool, points are 
+		# added when all done. points: the conditions of each file (HPData
+		# of a same calibration, see fit_skipped), the current ones if None
+		calib = self.buffer.calib if points is None else points[0].calib
+		if calib.fitmodel is None or self.batch_thread is not None:
+			return
+		import myPRLBatch
+		import myPRLStack
+
+		if files is None:
+			files, _ = QFileDialog.getOpenFileNames(self,
+									"myPRL-qt: Batch fit spectra", 
+									"",
+									"Spectra (*.txt *.dat *.csv *.asc);;"
+									"Spectrum stacks (index.tsv);;"
+									"All Files (*)")
+		if not files:
+			return
+		keys = ['Pm', 'T', 'x0', 'T0', 'sx', 'sT', 'sx0', 'sT0']
+		if points is None:
+			files.sort()
+			conditions = {key: getattr(self.buffer, key) for key in keys}
+		else:
+			order = sorted(range(len(files)), key=files.__getitem__)
+			files = [files[k] for k in order]
+			conditions = {key: np.array([getattr(points[k], key) 
+												for k in order], dtype=float)
+														for key in keys}
+		self.batch_table = self.data
+
+		stackpath = os.path.dirname(files[0])
+		if len(files) == 1 and myPRLStack.is_stack(stackpath):
+			stack = myPRLStack.SpectrumStack(stackpath)
+			batch = myPRLBatch.StackBatchFit(stack,
+											 calib,
+											 conditions['T'],
+											 conditions['x0'],
+											 conditions['T0'],
+											 nworkers=self.batch_nworkers)
+			# Pm of the stack index when known
+			conditions['Pm'] = np.where(np.isfinite(stack.Pm), stack.Pm, 
+															conditions['Pm'])
+			self.batch_files = ['{}/{}'.format(stack.name, f) 
+														for f in stack.files]
+		else:
+			batch = myPRLBatch.BatchFit(files, 
+										calib,
+										conditions['T'],
+										conditions['x0'],
+										conditions['T0'],
+										nworkers=self.batch_nworkers)
+			self.batch_files = [os.path.basename(f) for f in files]
+		self.batch_conditions = {key: np.broadcast_to(np.asarray(v, 
+												dtype=float), (len(batch),))
+										for key, v in conditions.items()}
+
+		self.batch_progress = QProgressDialog('Fitting {} spectra...'.format(
+									len(batch)), 'Cancel', 0, len(batch), self)
+		self.batch_progress.setWindowModality(Qt.WindowModal)
+		self.batch_progress.setMinimumDuration(0)
+
+		self.batch_thread = QThread()
+		self.batch_worker = BatchFitWorker(batch)
+		self.batch_worker.moveToThread(self.batch_thread)
+		self.batch_thread.started.connect(self.batch_worker.run)
+		self.batch_worker.progress.connect(
+						lambda n, _: self.batch_progress.setValue(n))
+		# direct call: the worker thread is busy in run()
+		self.batch_progress.canceled.connect(self.batch_worker.cancel, 
+											 Qt.DirectConnection)
+		self.batch_worker.error.connect(self.batch_fit_error)
+		self.batch_worker.finished.connect(self.batch_fit_done)
+		self.batch_thread.start()
+
+	def stop_batch(self):
+		# as Cancel of the progress dialog, without adding the points: the
+		# process pool is shut down when BatchFit.run returns
+		if self.batch_thread is None:
+			return
+		self.batch_worker.error.disconnect(self.batch_fit_error)
+		self.batch_worker.finished.disconnect(self.batch_fit_done)
+		self.batch_next = []
+		self.batch_worker.cancel()
+		self.batch_thread.quit()
+		self.batch_thread.wait()
+		self.batch_thread = None
+		self.batch_progress.reset()
+
+	def batch_fit_error(self, message):
+		self.batch_progress.reset()
+		QMessageBox.warning(self, 'myPRL-qt', 
+							'Batch fit failed, no point added:\n' + message)
+
+	def batch_fit_done(self):
+		batch = self.batch_worker.batch
+		self.batch_thread.quit()
+		self.batch_thread.wait()
+		self.batch_thread = None
+		self.batch_progress.reset()
+
+		if batch.cancelled or self.batch_worker.failed:
+			# and the next calibrations of fit_skipped
+			self.batch_next = []
+			return
+		ok = np.isfinite(batch.x)
+		conditions = self.batch_conditions
+		# to the run active at the start, even if another one is now
+		self.batch_table.extend(Pm = conditions['Pm'][ok],
+								 P = batch.P[ok],
+								 x = batch.x[ok],
+								 T = batch.T[ok],
+								 x0 = batch.x0[ok],
+								 T0 = batch.T0[ok],
+								 calib = batch.calib,
+								 files = [f for f, k in zip(self.batch_files, ok) if k],
+								 sx = conditions['sx'][ok],
+								 sT = conditions['sT'][ok],
+								 sx0 = conditions['sx0'][ok],
+								 sT0 = conditions['sT0'][ok])
+		if self.batch_next:
+			files, points = self.batch_next.pop(0)
+			self.batch_fit_files(files=files, points=points)
+
+	def toggle_live(self, checked):
+		# live mode: each new spectrum of a folder is fitted and added
+		if not checked:
+			self.stop_live()
+			self.fit_skipped()
+			return
+		if self.live_thread is not None:
+			return
+
+		folder = QFileDialog.getExistingDirectory(self, 
+									"myPRL-qt: Live acquisition folder")
+		if not folder:
+			self.live_button.setChecked(False)
+			return
+
+		self.live_thread = QThread()
+		self.live_worker = myPRLWatch.LiveFitWorker()
+		self.live_worker.moveToThread(self.live_thread)
+		self.live_thread.started.connect(self.live_worker.run)
+		self.live_worker.fitted.connect(self.add_live_point)
+		self.live_worker.failed.connect(self.live_failed)
+		self.live_worker.dropped.connect(self.live_dropped)
+
+		self.live_watcher = myPRLWatch.FolderWatcher(folder, self.live_patterns)
+		# with the conditions at its detection
+		self.live_watcher.newfile.connect(
+			lambda path, t: self.live_worker.put(path, self.live_conditions(), t))
+
+		self.live_thread.start()
+		self.statusBar().showMessage('Live: watching {}'.format(folder))
+
+	def live_conditions(self):
+		# Pm, T, x0, T0, calibration and uncertainties of a new spectrum
+		return myPRLModels.HPData(Pm = self.Pm_spinbox.value(),
+								  P = 0,
+								  x = 0,
+								  T = self.buffer.T,
+								  x0 = self.buffer.x0,
+								  T0 = self.buffer.T0,
+								  calib = self.buffer.calib,
+								  file = '',
+								  sx = self.buffer.sx,
+								  sT = self.buffer.sT,
+								  sx0 = self.buffer.sx0,
+								  sT0 = self.buffer.sT0)
+
+	def live_dropped(self, path, point):
+		# not fitted to keep up with the acquisition: fitted when live stops
+		self.live_skipped.append( (path, point) )
+		self.statusBar().showMessage('Live: skipped {} ({} spectra skipped '
+						'so far)'.format(os.path.basename(path), 
+										 len(self.live_skipped)))
+
+	def live_failed(self, path, point):
+		# e.g. still being written after the retries (slow writer, network
+		# share): the watcher will not report it again, fitted when live
+		# stops
+		self.live_skipped.append( (path, point) )
+		self.statusBar().showMessage('Live: could not fit {} ({} spectra '
+						'skipped so far)'.format(os.path.basename(path),
+												 len(self.live_skipped)))
+
+	def fit_skipped(self):
+		skipped = self.live_skipped
+		if not skipped or self.batch_thread is not None:
+			return
+		files = [path for path, _ in skipped]
+		names = ', '.join(os.path.basename(f) for f in files[:5])
+		answer = QMessageBox.question(self, 'myPRL-qt', 
+			'{} spectra were not fitted live, skipped to keep up with the '
+			'acquisition or not ready in time ({}{}).\nFit them now?'.format(len(files), names, 
+								', ...' if len(files) > 5 else ''),
+			QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+		self.live_skipped = []
+		if answer == QMessageBox.Yes:
+			# with the conditions of their detection, a batch per
+			# calibration
+			groups = {}
+			for path, point in skipped:
+				group = groups.setdefault(point.calib.name, ([], []))
+				group[0].append(path)
+				group[1].append(point)
+			self.batch_next = list(groups.values())
+			files, points = self.batch_next.pop(0)
+			self.batch_fit_files(files=files, points=points)
+
+	def stop_live(self):
+		if self.live_thread is None:
+			return
+		self.live_watcher.stop()
+		self.live_worker.stop()
+		self.live_thread.quit()
+		self.live_thread.wait()
+		self.live_thread = None
+		# detected but not fitted yet: fitted with the skipped ones
+		self.live_skipped.extend(self.live_worker.remaining())
+		self.statusBar().showMessage('Live: stopped')
+
+	def add_live_point(self, path, x, point, t):
+		# Pm, T, x0, T0, calibration at the detection of the file
+		point.x = x
+		point.file = os.path.basename(path)
+		point.calcP()
+		self.data.add(point)
+
+		latency = time.perf_counter() - t
+		try:
+			written = time.time() - os.path.getmtime(path)
+		except OSError:
+			written = float('nan')
+		self.statusBar().showMessage('Live: {} P = {:.3f} GPa, {:.0f} ms '
+			'after detection, {:.0f} ms after writing'.format(point.file, 
+								point.P, 1e3 * latency, 1e3 * written))
+
+	def autosave_folders(self, folder):
+		# run folders of an instance folder, the first run's one first
+		runs = [path for path in glob.glob(os.path.join(folder, 'runs', '*'))
+						if os.path.basename(path).isdigit()]
+		runs.sort(key=lambda path: int(os.path.basename(path)))
+		return [folder] + runs
+
+	def start_autosave(self):
+		# left by crashed instances, the running ones hold their locks
+		orphans = myPRLJournal.orphans(self.autosave_folder)
+		self.instance_folder, self.instance_lock = myPRLJournal.new_folder(
+														self.autosave_folder)
+		journals = {orphan: [myPRLJournal.Journal(folder)
+								for folder in self.autosave_folders(orphan)]
+								for orphan, _ in orphans}
+		failed = [] # (journal, error), their files are kept
+		if any(self.has_data(journal) for found in journals.values()
+											for journal in found):
+			answer = QMessageBox.question(self, 'myPRL-qt', 
+				'myPRL-qt did not close properly last time.\n'
+				'Recover the unsaved data?', 
+				QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+			if answer == QMessageBox.Yes:
+				failed = self.recover(journals)
+		# the recovered runs are saved in our folder before the orphans
+		# are removed, the ones that could not be recovered stay for
+		# another try
+		self.journals = {}
+		self.update_journals()
+		kept = {journal.folder for journal, _ in failed}
+		for orphan, lock in orphans:
+			if any(journal.folder in kept for journal in journals[orphan]):
+				for journal in journals[orphan]:
+					if journal.folder not in kept:
+						journal.discard()
+				lock.close()
+			else:
+				myPRLJournal.remove_folder(orphan, lock)
+		if failed:
+			QMessageBox.warning(self, 'myPRL-qt', 
+				'Could not recover the data of:\n{}\n'
+				'Their autosave files are kept for the next start.'.format(
+					'\n'.join('{}: {}'.format(journal.folder, e)
+											for journal, e in failed)))
+
+		self.autosave_timer = QTimer(self)
+		self.autosave_timer.timeout.connect(self.sync_journals)
+		self.autosave_timer.start(self.autosave_interval)
+
+	def has_data(self, journal):
+		try:
+			return journal.has_data()
+		except Exception:
+			# unreadable snapshot: recover() tells why
+			return True
+
+	def recover(self, journals):
+		''' one run per journal with data, in their order. Returns the
+		[(journal, error)] that could not be replayed. '''
+		failed = []
+		for journal in (journal for found in journals.values()
+										for journal in found):
+			if not self.has_data(journal):
+				continue
+			# in a new table first: a failed replay leaves no run behind
+			table = myPRLModels.HPDataTable()
+			try:
+				journal.replay(table, self.calibrations)
+			except Exception as e:
+				failed.append( (journal, e) )
+				continue
+			active = self.experiment.active.table
+			if len(active) == 0 and len(self.experiment) == 1:
+				active.reconstruct({key: table.column(key)
+											for key in table.numcols},
+								   table.codes, table.calibs, table.files)
+				active.uncertainty = table.uncertainty
+				active.ndraws = table.ndraws
+				# the recovered content is where undo starts
+				active.history.clear()
+			else:
+				self.experiment.add_run(table=table)
+		return failed
+
+	def update_journals(self):
+		# a journal per run, started when the run is added: switching runs
+		# does not save anything
+		if self.journals is None:
+			# not started yet, or recovering
+			return
+		for name in list(self.journals):
+			if name not in self.experiment:
+				self.journals.pop(name).close(discard=True)
+		folders = {journal.folder for journal in self.journals.values()}
+		for name, run in self.experiment.runs.items():
+			if name in self.journals:
+				continue
+			folder = self.instance_folder
+			k = 1
+			while folder in folders:
+				k += 1
+				folder = os.path.join(self.instance_folder, 'runs', str(k))
+			folders.add(folder)
+			self.journals[name] = myPRLJournal.Journal(folder)
+			self.journals[name].start(run.table)
+
+	def sync_journals(self):
+		for journal in self.journals.values():
+			journal.sync()
+
+	def closeEvent(self, event):
+		# normal exit: the autosave is not needed anymore
+		self.autosave_timer.stop()
+		for journal in self.journals.values():
+			journal.close(discard=True)
+		myPRLJournal.remove_folder(self.instance_folder, self.instance_lock)
+		self.stop_live()
+		self.stop_batch()
+		self.compute_thread.quit()
+		self.compute_thread.wait()
+		super().closeEvent(event)
+
 	def showtable(self, s=None):
 		if self.DataTableWindow.isVisible(): 
 			self.DataTableWindow.hide()
@@ -596,12 +1618,46 @@ class MyPRLMain(QMainWindow):
 		else:
 			self.PmPplot_win.show()
 
+	def showisobars(self, s=None):
+		if self.isobar_win.isVisible(): 
+			self.isobar_win.hide()
+		else:
+			self.isobar_win.show()
+
+	def showprofiling(self, s=None):
+		if self.profiling_win.isVisible(): 
+			self.profiling_win.hide()
+		else:
+			self.profiling_win.show()
+
 
 if __name__ == '__main__':
 
+	# for the batch fit process pool in frozen (PyInstaller) builds
+	multiprocessing.freeze_support()
+
+	profile = '--startup-profile' in sys.argv
+	if profile:
+		sys.argv.remove('--startup-profile')
+	# hot paths timed from the start, see the diagnostics window (Ctrl+Shift+D)
+	if '--profile' in sys.argv:
+		sys.argv.remove('--profile')
+		myPRLProfiling.enable()
+
 	app = QApplication(sys.argv)
+	startup.step('QApplication')
 	
 	main = MyPRLMain()
 	main.show()
+	startup.step('show')
+
+	if profile:
+		# first event loop iteration: the window is painted
+		def report():
+			startup.step('first paint')
+			startup.report()
+			main.close()
+			app.quit()
+		QTimer.singleShot(0, report)
 	
 	app.exec()
\ No newline at end of file
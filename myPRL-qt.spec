@@ -9,11 +9,12 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # imported on first use by myPRL-qt.py
+    hiddenimports=['myPRLPlots', 'myPRLBatch', 'myPRLStack'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter', 'scipy', 'IPython'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -30,7 +31,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # UPX-packed Qt libraries are unpacked at each start
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -44,7 +45,7 @@ coll = COLLECT(
     a.zipfiles,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,  # UPX-packed Qt libraries are unpacked at each start
     upx_exclude=[],
     name='myPRL-qt',
 )
@@ -0,0 +1,152 @@
+import os
+import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import myPRLSpectra
+import myPRLStack
+
+
+def fit_files(files, calib):
+	''' fitted x of each spectrum file, NaN when it could not be fitted '''
+	x = np.full(len(files), np.nan)
+	for i, file in enumerate(files):
+		try:
+			xs, ys = myPRLSpectra.load_spectrum(file)
+			x[i] = myPRLSpectra.fit_spectrum(calib, xs, ys).x
+		except Exception:
+			pass
+	return x
+
+
+def _fit_chunk(start, files, calib, T, x0, T0):
+	# work unit of the pool: fit and calcP of a chunk of files
+	x = fit_files(files, calib)
+	return start, x, calib.func(x, T, x0, T0)
+
+
+def _fit_stack_chunk(start, path, stop, calib, T, x0, T0):
+	# same for spectra start to stop of a stack, read from the memory map
+	x = myPRLStack.SpectrumStack(path).fit(calib, start, stop)
+	return start, x, calib.func(x, T, x0, T0)
+
+
+class BatchFit():
+	''' Fits a series of spectrum files, and computes their pressures, on
+	a pool of processes. Files are sent by chunks of chunksize, results
+	are put back in the order of the files. T, x0 and T0 are scalars
+	or arrays of the same length as files. '''
+
+	work = staticmethod(_fit_chunk)
+
+	def __init__(self, files, calib, T, x0, T0, nworkers=None, chunksize=64):
+		self.files = list(files)
+		self.calib = calib
+		n = len(self.files)
+		self.T, self.x0, self.T0 = (np.broadcast_to(np.asarray(a, dtype=float),
+																(n,))
+														for a in (T, x0, T0))
+		self.nworkers = nworkers or os.cpu_count() or 1
+		self.chunksize = chunksize
+
+		self.x = np.full(n, np.nan)
+		self.P = np.full(n, np.nan)
+		self.cancelled = False
+
+	def __len__(self):
+		return len(self.files)
+
+	def chunks(self):
+		for start in range(0, len(self), self.chunksize):
+			end = min(start + self.chunksize, len(self))
+			yield (start, self.files[start:end], self.calib,
+					self.T[start:end], self.x0[start:end], self.T0[start:end])
+
+	def run(self, progress=None, cancel=None):
+		''' progress(ndone, ntotal) is called after each chunk, the run stops
+		as soon as cancel() returns True (self.cancelled is then set).
+		Returns the fitted x and P arrays, NaN for unfitted spectra. '''
+		if len(self) == 0:
+			return self.x, self.P
+
+		ndone = 0
+		chunks = self.chunks()
+		# spawn: forking a process running Qt threads is not safe
+		context = multiprocessing.get_context('spawn')
+		with ProcessPoolExecutor(self.nworkers, mp_context=context) as pool:
+			# a few chunks in flight per worker, so that cancel is fast
+			running = set()
+			while True:
+				while len(running) < 2 * self.nworkers:
+					chunk = next(chunks, None)
+					if chunk is None:
+						break
+					running.add( pool.submit(self.work, *chunk) )
+				if not running:
+					break
+
+				finished, running = wait(running, timeout=0.1,
+										 return_when=FIRST_COMPLETED)
+				for future in finished:
+					start, x, P = future.result()
+					self.x[start:start + len(x)] = x
+					self.P[start:start + len(x)] = P
+					ndone += len(x)
+
+				if progress is not None and finished:
+					progress(ndone, len(self))
+				if cancel is not None and cancel():
+					self.cancelled = True
+					for future in running:
+						future.cancel()
+					break
+
+		return self.x, self.P
+
+
+class StackBatchFit(BatchFit):
+	''' BatchFit of the spectra of a myPRLStack.SpectrumStack: workers read
+	their chunk from the memory-mapped stack, no text file is parsed '''
+
+	work = staticmethod(_fit_stack_chunk)
+
+	def __init__(self, stack, calib, T, x0, T0, nworkers=None, chunksize=256):
+		super().__init__(stack.files, calib, T, x0, T0, nworkers, chunksize)
+		self.stack = stack
+
+	def chunks(self):
+		for start in range(0, len(self), self.chunksize):
+			end = min(start + self.chunksize, len(self))
+			yield (start, self.stack.path, end, self.calib,
+					self.T[start:end], self.x0[start:end], self.T0[start:end])
+
+
+if __name__ == '__main__':
+
+	# throughput vs. number of workers on synthetic ruby spectra
+	import sys
+	import time
+	import tempfile
+	import myPRLModels
+
+	nfiles = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+	calib = myPRLModels.default_calibrations()['Ruby2020']
+
+	with tempfile.TemporaryDirectory() as folder:
+		rng = np.random.default_rng(0)
+		xs = np.linspace(680, 710, 2048)
+		model = myPRLSpectra.PeaksModel(2, 697)
+		files = []
+		for i in range(nfiles):
+			R1 = 694.3 + 5 * i / nfiles
+			p = np.array([1000, R1, 0.25, 0.4, 500, R1 - 1.4, 0.25, 0.4, 50, 0])
+			files.append( os.path.join(folder, '{:05d}.txt'.format(i)) )
+			np.savetxt(files[-1], np.c_[xs, model(xs, p) + rng.normal(0, 10, 2048)])
+
+		nworkers = 1
+		while nworkers <= (os.cpu_count() or 1):
+			t = time.perf_counter()
+			x, P = BatchFit(files, calib, 298, 694.28, 298, nworkers).run()
+			t = time.perf_counter() - t
+			print('{:2d} workers: {:8.1f} spectra/s'.format(nworkers, nfiles/t))
+			nworkers *= 2
@@ -1,14 +1,53 @@
+import numpy as np
+
+# All calibration functions accept scalars or NumPy arrays (any mix of them,
+# with the usual broadcasting rules over x, T, x0 and T0) and return
+# a scalar or an array accordingly.
+# grad* functions return the partial derivatives of P with respect to
+# (x, T, x0, T0), as 4 arrays of the broadcast shape.
+
+def _asarrays(*args):
+	return tuple(np.asarray(a, dtype=float) for a in args)
+
 # Shen G., Wang Y., Dewaele A. et al. (2020) High Pres. Res. doi: 10.1080/08957959.2020.1791107
-def Pruby2020(l, T, l0, T0):
+def _dlcorr_ruby(T, T0):
 	dT = T - T0
-	dlcorr = 0.00746 * dT - 3.01e-6 * dT**2 + 8.76e-9 * dT**3  # Datchi HPR 2007
+	# 0.00746 dT - 3.01e-6 dT^2 + 8.76e-9 dT^3, Datchi HPR 2007. Horner form:
+	# pow() of negative dT (T < T0) is ~20 times slower
+	return dT * (0.00746 + dT * (-3.01e-6 + dT * 8.76e-9))
+
+def Pruby2020(l, T, l0, T0):
+	l, T, l0, T0 = _asarrays(l, T, l0, T0)
+	dlcorr = _dlcorr_ruby(T, T0)
 	dl = (l - dlcorr) - l0
 	P = 1870 * dl/l0 * (1 + 5.63 * dl/l0)
 
 	return P
 
+def invPruby2020(P, T, l0, T0):
+	P, T, l0, T0 = _asarrays(P, T, l0, T0)
+	# P = A u (1 + b u) with u = dl/l0, stable root of the quadratic
+	A, b = 1870, 5.63
+	with np.errstate(invalid='ignore'):
+		u = 2 * P/A / (1 + np.sqrt(1 + 4 * b * P/A))
+	l = l0 * (1 + u) + _dlcorr_ruby(T, T0)
+	return l
+
+def gradPruby2020(l, T, l0, T0):
+	l, T, l0, T0 = np.broadcast_arrays(*_asarrays(l, T, l0, T0))
+	dT = T - T0
+	ddlcorr = 0.00746 + dT * (-2 * 3.01e-6 + dT * 3 * 8.76e-9)
+	lc = l - _dlcorr_ruby(T, T0)
+	u = lc/l0 - 1
+	dPdu = 1870 * (1 + 2 * 5.63 * u)
+	return (dPdu / l0, 
+			-dPdu * ddlcorr / l0, 
+			-dPdu * lc / l0**2, 
+			dPdu * ddlcorr / l0)
+
 #  F. Datchi, High Pressure Research, 27:4, 447-463, DOI: 10.1080/08957950701659593 
 def PsamDatchi1997(l, T, l0, T0):
+    l, T, l0, T0 = _asarrays(l, T, l0, T0)
     dT = T - T0
 #    dlcorr = -8.7e-5 * dT + 4.62e-6 * dT**2 -2.38e-9 * dT**3    # problem here !? (Datchi HPR 2007)
 #    if T >= 500:
@@ -20,25 +59,110 @@ def PsamDatchi1997(l, T, l0, T0):
     P = 4.032 * dl * (1 + 9.29e-3 * dl) / (1 + 2.32e-2 * dl)
     return P
 
+def invPsamDatchi1997(P, T, l0, T0):
+    P, T, l0, T0 = _asarrays(P, T, l0, T0)
+    # P (1 + b dl) = A dl (1 + a dl) is a quadratic in dl,
+    # stable form of the root going through dl = 0 at P = 0
+    A, a, b = 4.032, 9.29e-3, 2.32e-2
+    B = A - b * P
+    with np.errstate(invalid='ignore'):
+        dl = 2 * P / (B + np.sqrt(B**2 + 4 * A * a * P))
+    l = l0 + dl     # no T correction (see above)
+    return l
+
+def gradPsamDatchi1997(l, T, l0, T0):
+    l, T, l0, T0 = np.broadcast_arrays(*_asarrays(l, T, l0, T0))
+    A, a, b = 4.032, 9.29e-3, 2.32e-2
+    dl = l - l0
+    dPddl = A * (1 + 2 * a * dl + a * b * dl**2) / (1 + b * dl)**2
+    zero = np.zeros_like(dl)
+    return dPddl, zero, -dPddl, zero
+
 #  F. Datchi, High Pressure Research, 27:4, 447-463, DOI: 10.1080/08957950701659593 
-def PcBN(nu, T, nu0, T0):
+def _nu0_T_cBN(T, nu0, T0):
 	# find nu(p = 0 GPa, T = 0 K)
 	nu00 = nu0 + 0.0091 * T0 + 1.54e-5 * T0**2
+	return nu00 - 0.0091 * T - 1.54e-5 * T**2
+
+def _B0_T_cBN(T):
+	return 396.5 - 0.0288 * (T - 300) - 6.84e-6 * (T - 300)**2
 
-	nu0_T = nu00 - 0.0091 * T - 1.54e-5 * T**2
-	B0_T = 396.5 - 0.0288 * (T - 300) - 6.84e-6 * (T - 300)**2
+def PcBN(nu, T, nu0, T0):
+	nu, T, nu0, T0 = _asarrays(nu, T, nu0, T0)
+	nu0_T = _nu0_T_cBN(T, nu0, T0)
+	B0_T = _B0_T_cBN(T)
 	B0p = 3.62
 	P = (B0_T/B0p) * ( (nu/nu0_T)**2.876 - 1 )
 	return P
 
+def invPcBN(P, T, nu0, T0):
+	P, T, nu0, T0 = _asarrays(P, T, nu0, T0)
+	nu0_T = _nu0_T_cBN(T, nu0, T0)
+	B0_T = _B0_T_cBN(T)
+	B0p = 3.62
+	with np.errstate(invalid='ignore'):
+		nu = nu0_T * (1 + P * B0p/B0_T)**(1/2.876)
+	return nu
+
+def gradPcBN(nu, T, nu0, T0):
+	nu, T, nu0, T0 = np.broadcast_arrays(*_asarrays(nu, T, nu0, T0))
+	nu0_T = _nu0_T_cBN(T, nu0, T0)
+	B0_T = _B0_T_cBN(T)
+	B0p = 3.62
+	rk = (nu/nu0_T)**2.876
+	dPdnu0_T = -(B0_T/B0p) * 2.876 * rk / nu0_T
+	dB0dT = -0.0288 - 2 * 6.84e-6 * (T - 300)
+	return ((B0_T/B0p) * 2.876 * rk / nu,
+			dB0dT/B0p * (rk - 1) - dPdnu0_T * (0.0091 + 3.08e-5 * T),
+			dPdnu0_T,
+			dPdnu0_T * (0.0091 + 3.08e-5 * T0))
+
 # AKAHAMA, KAWAMURA, JOURNAL OF APPLIED PHYSICS 100, 043516 2006
 def PAkahama2006(nu, T, nu0, T0):
+	nu, T, nu0, T0 = _asarrays(nu, T, nu0, T0)
 	K0  = 547 # GPa
 	K0p = 3.75
 	dnu = nu - nu0 
 	p = K0 * (dnu/nu0) * (1 + 0.5 * (K0p -1)*dnu/nu0)
 	return p 
 
+def invPAkahama2006(p, T, nu0, T0):
+	p, T, nu0, T0 = _asarrays(p, T, nu0, T0)
+	K0  = 547 # GPa
+	K0p = 3.75
+	b = 0.5 * (K0p - 1)
+	with np.errstate(invalid='ignore'):
+		u = 2 * p/K0 / (1 + np.sqrt(1 + 4 * b * p/K0))
+	nu = nu0 * (1 + u)
+	return nu
+
+def gradPAkahama2006(nu, T, nu0, T0):
+	nu, T, nu0, T0 = np.broadcast_arrays(*_asarrays(nu, T, nu0, T0))
+	K0  = 547 # GPa
+	K0p = 3.75
+	u = nu/nu0 - 1
+	dPdu = K0 * (1 + (K0p - 1) * u)
+	zero = np.zeros_like(u)
+	return dPdu / nu0, zero, -dPdu * nu / nu0**2, zero
+
 
 if __name__ == '__main__':
-	pass
\ No newline at end of file
+
+	# quick benchmark: per-point cost of each calibration vs. array size
+	from timeit import repeat
+
+	funcs = [(Pruby2020, 694.28), 
+			 (PsamDatchi1997, 685.41), 
+			 (PcBN, 1054.), 
+			 (PAkahama2006, 1333.)]
+
+	for func, x0 in funcs:
+		print(func.__name__)
+		for n in [1, 1000, 1000000]:
+			x = x0 + np.linspace(0, 0.05 * x0, n)
+			T = np.full(n, 300.)
+			number = max(1, 100000 // n)
+			t = min(repeat(lambda: func(x, T, x0, 298.), 
+						   number=number, repeat=5)) / number
+			print('  n = {:>7d} : {:10.3f} us/call  {:10.4f} us/point'.format(
+											n, t * 1e6, t * 1e6 / n))
\ No newline at end of file
@@ -0,0 +1,142 @@
+''' Level of detail for plotting long series of points: a min/max pyramid
+gives, for any view, a subset of a few points per pixel that keeps the
+extreme points (outliers included) of every part of the series.
+
+Level k of the pyramid cuts the series, in its order, into buckets of
+2**k consecutive points, and keeps for each bucket the indices of its
+points of min and max x and y. For a view, the finest level with at
+most budget buckets in the view is used, and the extreme points of
+these buckets are plotted. Appending points only updates the last
+buckets of each level.
+'''
+
+import numpy as np
+
+
+def nbuckets(k, n):
+	return (n + (1 << k) - 1) >> k
+
+
+def nlevels(n):
+	# up to the level of a single bucket
+	return max(1, (n - 1).bit_length() + 1)
+
+
+class MinMaxPyramid():
+	''' min/max pyramid of the points (x, y), see the module docstring.
+	Arrays grow by doubling, like HPDataTable columns. '''
+
+	def __init__(self, x=(), y=(), capacity=1024):
+		self.n = 0
+		self.capacity = 0
+		self.x = np.empty(0)
+		self.y = np.empty(0)
+		self.levels = [] # (4, buckets) indices of min x, max x, min y, max y
+		self._reserve(capacity)
+		self.extend(x, y)
+
+	def __len__(self):
+		return self.n
+
+	def _reserve(self, n):
+		if n <= self.capacity:
+			return
+		capacity = max(n, 2 * self.capacity)
+		x, y = np.empty(capacity), np.empty(capacity)
+		x[:self.n], y[:self.n] = self.x[:self.n], self.y[:self.n]
+		levels = []
+		for k in range(nlevels(capacity)):
+			level = np.empty( (4, nbuckets(k, capacity)), dtype=np.int64)
+			if k < len(self.levels):
+				m = nbuckets(k, self.n)
+				level[:, :m] = self.levels[k][:, :m]
+			levels.append(level)
+		self.x, self.y, self.levels = x, y, levels
+		self.capacity = capacity
+
+	def extend(self, x, y):
+		m = len(x)
+		if m == 0:
+			return
+		first = self.n
+		self._reserve(first + m)
+		self.x[first:first + m] = x
+		self.y[first:first + m] = y
+		self.n += m
+		self.levels[0][:, first:self.n] = np.arange(first, self.n)
+
+		# buckets from start on changed at each level
+		start = first
+		for k in range(1, nlevels(self.n)):
+			start //= 2
+			stop = nbuckets(k, self.n)
+			last = nbuckets(k - 1, self.n) - 1
+			prev = self.levels[k - 1]
+			pairs = 2 * np.arange(start, stop)
+			a = prev[:, pairs]
+			b = prev[:, np.minimum(pairs + 1, last)]
+			level = self.levels[k]
+			for r, (values, lower) in enumerate([(self.x, True), (self.x, False),
+												 (self.y, True), (self.y, False)]):
+				va, vb = values[a[r]], values[b[r]]
+				takeb = (vb < va) if lower else (vb > va)
+				# NaN (e.g. a failed fit) never wins
+				takeb |= np.isnan(va)
+				level[r, start:stop] = np.where(takeb, b[r], a[r])
+
+	def select(self, xlim, ylim, budget):
+		''' sorted indices of the points to plot in the view xlim, ylim,
+		from the finest level with at most budget buckets in view '''
+		if self.n == 0:
+			return np.empty(0, dtype=np.int64)
+		x, y = self.x[:self.n], self.y[:self.n]
+		(x0, x1), (y0, y1) = sorted(xlim), sorted(ylim)
+		# a bucket holds the points of its two children: only the children
+		# of the buckets in view are looked at, level after level
+		top = nlevels(self.n) - 1
+		buckets = np.arange(nbuckets(top, self.n))
+		chosen = None
+		for k in range(top, -1, -1):
+			if k < top:
+				buckets = np.stack([2 * buckets, 2 * buckets + 1], 
+								   axis=1).ravel()
+				buckets = buckets[buckets < nbuckets(k, self.n)]
+			level = self.levels[k][:, buckets]
+			inview = (x[level[1]] >= x0) & (x[level[0]] <= x1) & \
+					 (y[level[3]] >= y0) & (y[level[2]] <= y1)
+			if chosen is not None and np.count_nonzero(inview) > budget:
+				break
+			buckets = buckets[inview]
+			chosen = level[:, inview]
+		return np.unique(chosen)
+
+
+if __name__ == '__main__':
+
+	# build, append and select times on a 1M points noisy ramp
+	import time
+
+	n = 1000000
+	rng = np.random.default_rng(0)
+	x = np.linspace(0, 100, n)
+	y = 0.5 * x + rng.normal(0, 0.1, n)
+	y[rng.integers(0, n, 10)] += 20 # outliers
+
+	t = time.perf_counter()
+	pyramid = MinMaxPyramid(x[:-1000], y[:-1000])
+	t1 = time.perf_counter() - t
+	t = time.perf_counter()
+	for i in range(n - 1000, n, 100):
+		pyramid.extend(x[i:i + 100], y[i:i + 100])
+	t2 = (time.perf_counter() - t) / 10
+	print('build: {:.3f} s, append of 100 points: {:.2f} ms'.format(t1,
+																t2 * 1e3))
+
+	for xlim, ylim in [((0, 100), (-5, 75)), ((40, 41), (19, 21)),
+					   ((40, 40.01), (19, 21))]:
+		t = time.perf_counter()
+		ind = pyramid.select(xlim, ylim, 1000)
+		t = time.perf_counter() - t
+		outliers = np.count_nonzero(y[ind] > 0.5 * x[ind] + 10)
+		print('view {} {}: {} points, {} outliers, {:.2f} ms'.format(xlim,
+										ylim, len(ind), outliers, t * 1e3))
@@ -0,0 +1,326 @@
+''' Experiment store: the runs of an experiment, each a HPDataTable tagged
+by free keywords (cell, sample, file...), one of them active (the one
+myPRL-qt adds points to and shows).
+
+Rows of a calibration are kept in a CalibIndex of each run, updated with
+the changes of its table: appended rows are appended to their group,
+removed or inserted rows shift the groups after them, without a scan of
+the table. Runs are indexed by tag values the same way: grouping and
+filtering cost the size of the result.
+'''
+
+import numpy as np
+
+import myPRLModels
+import myPRLPmModel
+import myPRLProfiling
+from myPRLModels import QObject, pyqtSignal
+
+
+class CalibIndex():
+	''' sorted rows of table per calibration name, kept up to date with
+	table.changed. The arrays are never modified in place, except for rows
+	appended past their end: they can be kept as they are. '''
+
+	def __init__(self, table):
+		self.table = table
+		self.groups = {} # calib name: [rows buffer, number of rows]
+		self.rebuild()
+		table.changed.connect(self.on_changed)
+
+	def __getitem__(self, name):
+		rows, n = self.groups[name]
+		return rows[:n]
+
+	def __contains__(self, name):
+		return name in self.groups
+
+	def __iter__(self):
+		return iter(self.groups)
+
+	def __len__(self):
+		return len(self.groups)
+
+	def get(self, name):
+		''' rows of name, empty if none '''
+		if name not in self.groups:
+			return np.empty(0, dtype=np.int64)
+		return self[name]
+
+	def _split(self, first, last):
+		# (calib name, sorted rows) of the rows first to last
+		codes = self.table.codes[first:last + 1]
+		if len(codes) == 1:
+			codes, groups = codes, [np.array([first], dtype=np.int64)]
+		else:
+			codes, inverse = np.unique(codes, return_inverse=True)
+			order = np.argsort(inverse, kind='stable').astype(np.int64) + first
+			groups = np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+		return [(self.table.calibs[code].name, rows)
+								for code, rows in zip(codes, groups)]
+
+	def _append(self, name, rows):
+		# rows after the last one of the group, grows by doubling
+		if name not in self.groups:
+			self.groups[name] = [rows, len(rows)]
+			return
+		group = self.groups[name]
+		buf, n = group
+		if n + len(rows) > len(buf):
+			new = np.empty(max(n + len(rows), 2 * len(buf)), dtype=np.int64)
+			new[:n] = buf[:n]
+			group[0] = buf = new
+		buf[n:n + len(rows)] = rows
+		group[1] = n + len(rows)
+
+	def _cut(self, first, last, shift):
+		# drops the rows first to last, moves the ones after by shift
+		for name in list(self.groups):
+			rows = self[name]
+			lo, hi = np.searchsorted(rows, [first, last + 1])
+			if lo == hi and (shift == 0 or hi == len(rows)):
+				continue
+			rows = np.concatenate([rows[:lo], rows[hi:] + shift])
+			if len(rows):
+				self.groups[name] = [rows, len(rows)]
+			else:
+				del self.groups[name]
+
+	def _insert(self, name, rows):
+		if name not in self.groups:
+			self.groups[name] = [rows, len(rows)]
+			return
+		old = self[name]
+		k = np.searchsorted(old, rows[0])
+		new = np.concatenate([old[:k], rows, old[k:]])
+		self.groups[name] = [new, len(new)]
+
+	@myPRLProfiling.timed('index.rebuild')
+	def rebuild(self):
+		self.groups = {}
+		if len(self.table):
+			for name, rows in self._split(0, len(self.table) - 1):
+				self._append(name, rows)
+
+	@myPRLProfiling.timed('index.on_changed')
+	def on_changed(self, change):
+		if change.kind == 'insert' and change.last == len(self.table) - 1:
+			for name, rows in self._split(change.first, change.last):
+				self._append(name, rows)
+		elif change.kind == 'insert':
+			# e.g. undo of a removal: the inserted rows are contiguous
+			self._cut(change.first, change.first - 1, change.nrows)
+			for name, rows in self._split(change.first, change.last):
+				self._insert(name, rows)
+		elif change.kind == 'remove':
+			self._cut(change.first, change.last, -change.nrows)
+		elif change.kind == 'update' and 'calib' in change.columns:
+			if change.nrows > 0:
+				self._cut(change.first, change.last, 0)
+				for name, rows in self._split(change.first, change.last):
+					self._insert(name, rows)
+		elif change.kind == 'reset':
+			self.rebuild()
+
+	def disconnect(self):
+		self.table.changed.disconnect(self.on_changed)
+
+
+class Run():
+	''' a run of the experiment: its table, its tags (e.g. cell, sample,
+	file) and the index of its rows per calibration. The P(Pm) models of
+	the run are made on first use, and kept up to date from then on. '''
+
+	def __init__(self, name, table=None, **tags):
+		self.name = name
+		self.table = myPRLModels.HPDataTable() if table is None else table
+		self.tags = tags
+		self.index = CalibIndex(self.table)
+		self._models = None
+
+	def __len__(self):
+		return len(self.table)
+
+	def __repr__(self):
+		return 'Run({!r}, {} rows, {})'.format(self.name, len(self), self.tags)
+
+	@property
+	def models(self):
+		if self._models is None:
+			self._models = myPRLPmModel.PmPModels(self.table)
+		return self._models
+
+	def rows(self, calib=None):
+		''' all rows, or the rows of the calibration named calib '''
+		if calib is None:
+			return np.arange(len(self.table))
+		return self.index.get(calib)
+
+	def close(self):
+		self.index.disconnect()
+		if self._models is not None:
+			self._models.disconnect()
+
+
+class Experiment(QObject):
+	''' runs by name, in the order they were added, and the active run.
+	Runs are indexed by their tag values: find() and rows() only look at
+	the runs they return. '''
+
+	# the new active Run
+	activechanged = pyqtSignal(object)
+	# runs added, removed or retagged
+	runschanged = pyqtSignal()
+
+	def __init__(self):
+		super().__init__()
+		self.runs = {} # name: Run
+		self.bytag = {} # tag: {value: set of run names}
+		self.active = None
+		self._count = 0 # for new_name and the order of the runs
+		self._order = {} # run name: rank of creation
+
+	def __len__(self):
+		return len(self.runs)
+
+	def __getitem__(self, name):
+		return self.runs[name]
+
+	def __contains__(self, name):
+		return name in self.runs
+
+	def __iter__(self):
+		return iter(self.runs)
+
+	def new_name(self):
+		k = len(self.runs) + 1
+		while 'run {}'.format(k) in self.runs:
+			k += 1
+		return 'run {}'.format(k)
+
+	def _tag(self, run, on):
+		for tag, value in run.tags.items():
+			names = self.bytag.setdefault(tag, {}).setdefault(value, set())
+			if on:
+				names.add(run.name)
+			else:
+				names.discard(run.name)
+				if not names:
+					del self.bytag[tag][value]
+
+	def add_run(self, name=None, table=None, **tags):
+		''' new Run (of table, or of a new empty table), active if it is
+		the first one '''
+		name = self.new_name() if name is None else name
+		if name in self.runs:
+			raise ValueError('Experiment: there is already a run {}'.format(name))
+		run = Run(name, table, **tags)
+		self.runs[name] = run
+		self._order[name] = self._count
+		self._count += 1
+		self._tag(run, True)
+		if self.active is None:
+			self.set_active(name)
+		self.runschanged.emit()
+		return run
+
+	def remove_run(self, name):
+		run = self.runs.pop(name)
+		del self._order[name]
+		self._tag(run, False)
+		run.close()
+		if self.active is run:
+			self.active = None
+			if self.runs:
+				self.set_active(next(iter(self.runs)))
+		self.runschanged.emit()
+
+	def set_tags(self, name, **tags):
+		''' changes the tags of run name, None removes a tag '''
+		run = self.runs[name]
+		self._tag(run, False)
+		run.tags.update(tags)
+		run.tags = {k: v for k, v in run.tags.items() if v is not None}
+		self._tag(run, True)
+		self.runschanged.emit()
+
+	@myPRLProfiling.timed('experiment.set_active')
+	def set_active(self, name):
+		run = self.runs[name]
+		if run is not self.active:
+			self.active = run
+			self.activechanged.emit(run)
+
+	def find(self, **tags):
+		''' runs with all these tag values, in the order they were added '''
+		names = None
+		for tag, value in tags.items():
+			found = self.bytag.get(tag, {}).get(value, set())
+			names = set(found) if names is None else names & found
+		if names is None:
+			return list(self.runs.values())
+		return [self.runs[name] for name in sorted(names, key=self._order.get)]
+
+	def rows(self, calib=None, **tags):
+		''' {run name: rows} of the runs with these tags, only the rows of
+		calib if given. Runs without such rows are left out. '''
+		found = {}
+		for run in self.find(**tags):
+			rows = run.rows(calib)
+			if len(rows):
+				found[run.name] = rows
+		return found
+
+
+if __name__ == '__main__':
+
+	# index updates against a full scan, and lookups, on 1M rows
+	import time
+
+	calibrations = myPRLModels.default_calibrations()
+	names = list(calibrations)[:3]
+	experiment = Experiment()
+	n = 1000000
+	for k, cell in enumerate(['A', 'A', 'B']):
+		run = experiment.add_run(cell=cell)
+		run.table.history = None
+		for name in names:
+			calib = calibrations[name]
+			m = n // len(names)
+			run.table.extend(Pm=np.linspace(0, 100, m), P=np.linspace(0, 50, m),
+							 x=calib.x0default, T=300, x0=calib.x0default, T0=298,
+							 calib=calib, files=['No'] * m)
+	table = experiment.active.table
+	index = experiment.active.index
+	point = myPRLModels.HPData(Pm=1, P=1, x=694.3, T=300, x0=694.28, T0=298,
+							   calib=calibrations[names[0]], file='No')
+
+	t = time.perf_counter()
+	for _ in range(1000):
+		table.add(point)
+	print('add: {:.1f} us'.format((time.perf_counter() - t) * 1e3))
+	t = time.perf_counter()
+	for _ in range(1000):
+		np.flatnonzero(table.codes == 0)
+	print('full scan: {:.2f} ms'.format(time.perf_counter() - t))
+	t = time.perf_counter()
+	for _ in range(1000):
+		index[names[0]]
+	print('index lookup: {:.2f} us'.format((time.perf_counter() - t) * 1e3))
+	t = time.perf_counter()
+	table.removespecific(n // 2)
+	table.removelast()
+	print('2 removals: {:.2f} ms'.format((time.perf_counter() - t) * 1e3))
+
+	ok = all(np.array_equal(index[calib.name],
+							np.flatnonzero(table.codes == code))
+			 for code, calib in enumerate(table.calibs))
+	print('index consistent with the table:', ok)
+
+	t = time.perf_counter()
+	rows = experiment.rows(calib=names[1], cell='A')
+	print('rows of {} in cell A: {} runs, {:.1f} us'.format(names[1],
+						len(rows), (time.perf_counter() - t) * 1e6))
+	t = time.perf_counter()
+	experiment.set_active('run 3')
+	print('set_active: {:.1f} us'.format((time.perf_counter() - t) * 1e6))
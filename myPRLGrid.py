@@ -0,0 +1,96 @@
+''' P(x, T) and x(P, T) of a HPCalibration on whole (T, x) or (T, P)
+meshes, for isobar charts and lookup tables at high temperature.
+
+Rows (T values) are computed by chunks, so that the temporary arrays of
+the calibration functions stay within maxbytes whatever the size of the
+mesh; only the result is allocated in full (or given as out, e.g. a
+np.memmap for very large meshes).
+'''
+
+import numpy as np
+
+import myPRLProfiling
+
+# temporaries of a calibration call, in arrays of the size of its result
+# (about 3 for the analytic functions, more for bracketed_newton)
+NTEMP = 16
+
+
+def _chunked(func, values, T, out, maxbytes):
+	# out[i, j] = func(values[j], T[i]), T rows by chunks
+	values = np.asarray(values, dtype=float).ravel()
+	T = np.asarray(T, dtype=float).ravel()
+	if out is None:
+		out = np.empty( (len(T), len(values)) )
+	rows = max(1, int(maxbytes // (NTEMP * 8 * max(len(values), 1))))
+	for start in range(0, len(T), rows):
+		stop = min(start + rows, len(T))
+		with np.errstate(all='ignore'):
+			res = func(values[None, :], T[start:stop, None])
+		# calibrations without T correction give a single row
+		out[start:stop] = np.broadcast_to(res, (stop - start, len(values)))
+	return out
+
+
+@myPRLProfiling.timed('grid.P')
+def P_grid(calib, x, T, x0, T0, out=None, maxbytes=64 * 2**20):
+	''' P[i, j] of calib at x[j], T[i] (x0, T0 scalars) '''
+	return _chunked(lambda x_, T_: calib.func(x_, T_, x0, T0), x, T, out,
+					maxbytes)
+
+
+@myPRLProfiling.timed('grid.x')
+def x_grid(calib, P, T, x0, T0, out=None, maxbytes=64 * 2**20):
+	''' x[i, j] giving P[j] at T[i]: each column is an isobar (NaN where
+	P cannot be reached) '''
+	return _chunked(lambda P_, T_: calib.invfunc(P_, T_, x0, T0), P, T, out,
+					maxbytes)
+
+
+def export_table(path, rowvalues, colvalues, table, rowname='T', colname='P'):
+	''' writes table with its row and column values: tab separated text
+	like the data table export (first row: colname values, first column:
+	rowname values), or a .npz archive of the three arrays '''
+	rowvalues = np.asarray(rowvalues, dtype=float)
+	colvalues = np.asarray(colvalues, dtype=float)
+	if path.lower().endswith('.npz'):
+		np.savez(path, **{rowname: rowvalues, colname: colvalues,
+						  'table': table})
+		return
+	header = '\t'.join(['{}\\{}'.format(rowname, colname)] +
+					   ['{:.6g}'.format(v) for v in colvalues])
+	np.savetxt(path, np.column_stack([rowvalues, table]), delimiter='\t',
+			   fmt='%.6f', header=header, comments='')
+
+
+if __name__ == '__main__':
+
+	# 4k x 4k P grid and 4k T x 100 P isobars, time and memory
+	import time
+	import tracemalloc
+	import myPRLModels
+
+	calibrations = myPRLModels.default_calibrations()
+	n = 4096
+	T = np.linspace(298, 1000, n)
+	Plevels = np.linspace(0, 100, 101)
+	for name in ['Ruby2020', 'cBN Raman Datchi 2007']:
+		calib = calibrations[name]
+		x = calib.x0default * np.linspace(1, 1.1, n)
+
+		tracemalloc.start()
+		t = time.perf_counter()
+		P = P_grid(calib, x, T, calib.x0default, 298.)
+		t = time.perf_counter() - t
+		peak = tracemalloc.get_traced_memory()[1] - P.nbytes
+		tracemalloc.stop()
+		print('{:24s} P grid {}x{}: {:.2f} s, {:.0f} MB temporaries'.format(
+								name, n, n, t, peak / 2**20))
+
+		t = time.perf_counter()
+		xs = x_grid(calib, Plevels, T, calib.x0default, 298.)
+		t = time.perf_counter() - t
+		err = np.nanmax(np.abs(calib.func(xs, T[:, None], calib.x0default,
+										  298.) - Plevels))
+		print('{:24s} {} isobars: {:.3f} s, P error {:.1g} GPa'.format(name,
+												len(Plevels), t, err))
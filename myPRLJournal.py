@@ -0,0 +1,385 @@
+''' Crash-safe autosave of a HPDataTable: an append-only journal of its
+changes on top of a session snapshot (myPRLSession format).
+
+	folder/
+		snapshot-<k>.myprl   table at the start of generation k (k >= 1)
+		journal-<k>.jsonl    changes since then, one JSON object per line
+
+Each HPDataTable.changed appends one line to the journal (the values of
+inserted or updated rows, the range of removed rows), and so does each
+HPDataTable.methodchanged (the sP method): its cost does not
+depend on the size of the table. Lines are written to the OS at once and
+fsync'ed by sync(), that the application calls periodically. Compaction
+starts a new generation: the whole table is saved as snapshot-<k+1>, and
+the journal restarts empty. The newest snapshot is always complete, so
+that a crash at any time leaves a consistent snapshot + journal pair.
+
+Each running application has its own folder in the autosave folder (see
+new_folder), locked as long as it runs: only the folders whose lock is
+free (see orphans) are left by a crash.
+'''
+
+import os
+import re
+import json
+import glob
+import uuid
+import shutil
+import numpy as np
+try:
+	import fcntl
+except ImportError:
+	# Windows
+	fcntl = None
+	import msvcrt
+
+import myPRLModels
+import myPRLSession
+import myPRLProfiling
+
+
+class Journal():
+	''' Autosave of table into folder, see the module docstring. Changes
+	of more than maxrows rows (e.g. loading a file) and journals longer
+	than maxlines trigger a compaction. '''
+
+	def __init__(self, folder, maxlines=20000, maxrows=10000):
+		self.folder = folder
+		self.maxlines = maxlines
+		self.maxrows = maxrows
+		self.table = None
+		self.file = None
+		self.generation = 0
+		self.nlines = 0
+		self.dirty = False
+		self.calibnames = set() # calibrations already described in the journal
+
+	def _path(self, kind, k):
+		ext = myPRLSession.EXTENSION if kind == 'snapshot' else '.jsonl'
+		return os.path.join(self.folder, '{}-{}{}'.format(kind, k, ext))
+
+	def _generations(self):
+		# generation numbers of the snapshots and journals on disk
+		found = set()
+		for path in glob.glob(os.path.join(self.folder, '*-*')):
+			m = re.match(r'(snapshot|journal)-(\d+)\.', os.path.basename(path))
+			if m:
+				found.add( int(m.group(2)) )
+		return sorted(found)
+
+	def _latest(self):
+		# newest complete snapshot, and the journal on top of it
+		k = max([g for g in self._generations()
+						if os.path.exists(self._path('snapshot', g))], default=0)
+		journal = self._path('journal', k)
+		return k, journal if os.path.exists(journal) else None
+
+	def has_data(self):
+		''' True if a previous run left something to recover '''
+		k, journal = self._latest()
+		if journal is not None and os.path.getsize(journal) > 0:
+			return True
+		if k > 0:
+			with np.load(self._path('snapshot', k), allow_pickle=False) as f:
+				return len(f['codes']) > 0
+		return False
+
+	@myPRLProfiling.timed('journal.replay')
+	def replay(self, table, calibrations):
+		''' loads the last snapshot and journal into table. Journal lines
+		are applied on plain columns, the table is built once at the end. '''
+		k, journal = self._latest()
+		if k > 0:
+			myPRLSession.load_session(self._path('snapshot', k), table,
+														calibrations)
+		cols = {key: list(table.column(key)) for key in table.numcols}
+		calibs = list(table.calibs)
+		names = [c.name for c in calibs]
+		codes = list(table.codes)
+		files = list(table.files)
+		uncertainty, ndraws = table.uncertainty, table.ndraws
+
+		if journal is not None:
+			with open(journal, encoding='utf-8') as f:
+				for line in f:
+					try:
+						rec = json.loads(line)
+					except ValueError:
+						# last line cut by the crash
+						break
+					op = rec['op']
+					if op == 'calib':
+						if rec['calib']['name'] not in names:
+							calib = calibrations.get(rec['calib']['name']) or \
+									myPRLSession.calib_from_dict(rec['calib'])
+							calibs.append(calib)
+							names.append(calib.name)
+					elif op == 'insert':
+						# appended, or put back by an undo
+						n = len(rec['file'])
+						sl = slice(rec.get('first', len(codes)),
+								   rec.get('first', len(codes)))
+						for key in table.numcols:
+							cols[key][sl] = rec['cols'][key]
+						codes[sl] = [names.index(rec['calib'])] * n
+						files[sl] = rec['file']
+					elif op == 'remove':
+						sl = slice(rec['first'], rec['last'] + 1)
+						for key in table.numcols:
+							del cols[key][sl]
+						del codes[sl], files[sl]
+					elif op == 'method':
+						uncertainty, ndraws = rec['uncertainty'], rec['ndraws']
+					elif op == 'update':
+						sl = slice(rec['first'], rec['last'] + 1)
+						for key, values in rec['cols'].items():
+							if key == 'calib':
+								codes[sl] = [names.index(v) for v in values]
+							elif key == 'file':
+								files[sl] = values
+							else:
+								cols[key][sl] = values
+
+		table.reconstruct({key: np.array(v, dtype=float)
+								for key, v in cols.items()},
+						  np.array(codes, dtype=int), calibs,
+						  np.array(files, dtype=object))
+		table.uncertainty, table.ndraws = uncertainty, ndraws
+		return table
+
+	def start(self, table):
+		''' journals the changes of table from now on, starting from
+		a snapshot of its current content '''
+		os.makedirs(self.folder, exist_ok=True)
+		self.table = table
+		self.generation = max(self._generations(), default=0)
+		self.compact()
+		table.changed.connect(self.on_changed)
+		table.methodchanged.connect(self.on_methodchanged)
+
+	@myPRLProfiling.timed('journal.compact')
+	def compact(self):
+		''' new generation: snapshot of the table, empty journal '''
+		if self.file is not None:
+			self.file.close()
+		k = self.generation + 1
+		# on disk, with its name, when save_session returns
+		myPRLSession.save_session(self.table, self._path('snapshot', k))
+		self.file = open(self._path('journal', k), 'a', encoding='utf-8')
+		self.generation = k
+		self.nlines = 0
+		self.calibnames = set()
+		# older generations are no longer needed, now that the new
+		# snapshot is durable
+		for g in self._generations():
+			for kind in ('snapshot', 'journal'):
+				if g < k and os.path.exists(self._path(kind, g)):
+					os.remove(self._path(kind, g))
+
+	def _write(self, rec):
+		self.file.write(json.dumps(rec) + '\n')
+		self.nlines += 1
+		self.dirty = True
+
+	def _calib(self, calib):
+		# the calibration description is written before its first use
+		if calib.name not in self.calibnames:
+			self._write({'op': 'calib',
+						 'calib': myPRLSession.calib_to_dict(calib)})
+			self.calibnames.add(calib.name)
+
+	def _rows(self, first, last, columns):
+		sl = slice(first, last + 1)
+		cols = {}
+		for key in columns:
+			if key == 'calib':
+				cols[key] = [self.table.calibs[c].name
+									for c in self.table.codes[sl]]
+			elif key == 'file':
+				cols[key] = [str(f) for f in self.table.files[sl]]
+			else:
+				cols[key] = self.table.column(key)[sl].tolist()
+		return cols
+
+	@myPRLProfiling.timed('journal.on_changed')
+	def on_changed(self, change):
+		if change.kind == 'reset' or change.nrows > self.maxrows:
+			self.compact()
+			return
+
+		if change.kind == 'remove':
+			self._write({'op': 'remove', 'first': change.first,
+						 'last': change.last})
+		elif change.kind == 'insert':
+			# added by add() or extend(): a single calibration, or put
+			# back in the middle by an undo
+			codes = self.table.codes[change.first:change.last + 1]
+			for code in np.unique(codes):
+				self._calib(self.table.calibs[code])
+			if len(np.unique(codes)) > 1:
+				self.compact()
+				return
+			self._write({'op': 'insert', 'first': change.first,
+						 'cols': self._rows(change.first, change.last,
+											self.table.numcols),
+						 'calib': self.table.calibs[codes[0]].name,
+						 'file': self._rows(change.first, change.last,
+											['file'])['file']})
+		elif change.kind == 'update' and change.nrows > 0:
+			if 'calib' in change.columns:
+				for code in np.unique(self.table.codes[change.first:
+													   change.last + 1]):
+					self._calib(self.table.calibs[code])
+			self._write({'op': 'update', 'first': change.first,
+						 'last': change.last,
+						 'cols': self._rows(change.first, change.last,
+											sorted(change.columns))})
+
+		if self.nlines > self.maxlines:
+			self.compact()
+		else:
+			# to the OS now, to the disk at the next sync()
+			self.file.flush()
+
+	def on_methodchanged(self, method):
+		# before the sP values it changes
+		self._write({'op': 'method', 'uncertainty': method,
+					 'ndraws': self.table.ndraws})
+		self.file.flush()
+
+	@myPRLProfiling.timed('journal.sync')
+	def sync(self):
+		if self.dirty and self.file is not None:
+			os.fsync(self.file.fileno())
+			self.dirty = False
+
+	def close(self, discard=True):
+		''' stops journaling. With discard (normal exit), removes the
+		autosave files. '''
+		if self.table is not None:
+			self.table.changed.disconnect(self.on_changed)
+			self.table.methodchanged.disconnect(self.on_methodchanged)
+			self.table = None
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+		if discard:
+			self.discard()
+
+	def discard(self):
+		''' removes the autosave files '''
+		for g in self._generations():
+			for kind in ('snapshot', 'journal'):
+				if os.path.exists(self._path(kind, g)):
+					os.remove(self._path(kind, g))
+
+
+def default_folder():
+	return os.path.join(os.path.expanduser('~'), '.myprl', 'autosave')
+
+
+def lock(folder):
+	''' takes the lock of folder: an open file to keep, None if another
+	process has it. The OS releases it when the process ends, also by
+	a crash. '''
+	f = open(os.path.join(folder, 'lock'), 'a+')
+	try:
+		if fcntl is not None:
+			fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+		else:
+			f.seek(0)
+			msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+	except OSError:
+		f.close()
+		return None
+	return f
+
+
+def new_folder(root):
+	''' (folder, lock) of a new folder in root, for this process only. It
+	is locked before it gets its name: orphans() never sees it free. '''
+	os.makedirs(root, exist_ok=True)
+	name = uuid.uuid4().hex
+	tmp = os.path.join(root, '.' + name)
+	os.mkdir(tmp)
+	f = lock(tmp)
+	folder = os.path.join(root, name)
+	os.rename(tmp, folder)
+	return folder, f
+
+
+def orphans(root):
+	''' [(folder, lock)] of the folders of root left by processes that are
+	gone, oldest first. Their locks are taken: other instances leave them
+	alone until remove_folder() or the end of this process. '''
+	found = []
+	for folder in glob.glob(os.path.join(root, '*')):
+		if not re.fullmatch(r'[0-9a-f]{32}', os.path.basename(folder)) \
+									or not os.path.isdir(folder):
+			continue
+		try:
+			f = lock(folder)
+		except OSError:
+			# removed in the meantime
+			continue
+		if f is not None:
+			found.append((os.path.getmtime(f.name), folder, f))
+	return [(folder, f) for _, folder, f in sorted(found)]
+
+
+def remove_folder(folder, lock):
+	''' removes folder and all its autosave files, releases lock '''
+	lock.close()
+	shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+
+	# cost per journaled add, and replay time
+	import sys
+	import time
+	import tempfile
+
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+	calibrations = myPRLModels.default_calibrations()
+	point = myPRLModels.HPData(Pm=0, P=0, x=694.28, T=298, x0=694.28, T0=298,
+							   calib=calibrations['Ruby2020'], file='No')
+
+	with tempfile.TemporaryDirectory() as folder:
+		table = myPRLModels.HPDataTable()
+		journal = Journal(folder)
+		journal.start(table)
+		t = time.perf_counter()
+		for i in range(n):
+			point.Pm = i
+			point.x = 694.28 + i * 1e-4
+			point.calcP()
+			table.add(point)
+			if i % 100 == 0:
+				table[i // 2].T = 300
+			if i % 1000 == 0:
+				journal.sync()
+		journal.sync()
+		t = time.perf_counter() - t
+		print('{} adds: {:.1f} us per journaled add ({} compactions)'.format(
+							n, t / n * 1e6, journal.generation - 1))
+
+		# crash: the journal is not closed
+		t = time.perf_counter()
+		replayed = Journal(folder).replay(myPRLModels.HPDataTable(),
+														calibrations)
+		t = time.perf_counter() - t
+		print('replay: {:.3f} s, identical: {}'.format(t,
+											replayed.df.equals(table.df)))
+
+		# rows put back in the middle by an undo
+		table.removespecific(1)
+		table.undo()
+		table.removespecific(n // 2)
+		table.removespecific(n // 2)
+		table.undo()
+		replayed = Journal(folder).replay(myPRLModels.HPDataTable(),
+														calibrations)
+		print('replay after undone removals, identical:',
+											replayed.df.equals(table.df))
+		journal.close()
@@ -1,18 +1,262 @@
 import numpy as np
-import pandas as pd
-from copy import deepcopy
-from scipy.optimize import minimize
-from PyQt5.QtCore import QObject, pyqtSignal
+# pandas is imported where it is used (DataFrame views and loading): it
+# takes longer to import than the rest of myPRL-qt
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+try:
+	from PyQt5.QtCore import QObject, pyqtSignal
+except ImportError:
+	# headless use (e.g. myPRL-cli.py) without PyQt5: minimal signals
+	QObject = object
+
+	class pyqtSignal():
+		def __init__(self, *types):
+			self.name = None
+
+		def __set_name__(self, owner, name):
+			self.name = '_slots_' + name
+
+		def __get__(self, obj, objtype=None):
+			if obj is None:
+				return self
+			# kept by the instance: they go with it
+			return _BoundSignal( obj.__dict__.setdefault(self.name, []) )
+
+	class _BoundSignal():
+		def __init__(self, slots):
+			self.slots = slots
+
+		def connect(self, slot):
+			self.slots.append(slot)
+
+		def disconnect(self, slot=None):
+			if slot is None:
+				self.slots.clear()
+			else:
+				self.slots.remove(slot)
+
+		def emit(self, *args):
+			for slot in list(self.slots):
+				slot(*args)
 
 import myPRLCalibfuncs
+import myPRLUncertainty
+import myPRLProfiling
+
+
+def bracketed_newton(func, p, args=(), x0=1., xstep=1., xtol=1e-9, 
+						maxiter=100):
+	''' Solves func(x, *args) = p for x, element-wise on whole arrays.
+
+	Each root is first bracketed by expanding steps around x0, then
+	refined by Newton steps that fall back to bisection whenever they
+	leave the bracket. Returned values are within xtol of the root,
+	NaN where no root could be bracketed. '''
+
+	# work on flat copies, reshaped at the end
+	outshape = np.broadcast(np.asarray(p), *map(np.asarray, args)).shape
+	p = np.broadcast_to(np.asarray(p, dtype=float), outshape).ravel()
+	args = [np.broadcast_to(np.asarray(a, dtype=float), outshape).ravel() 
+																for a in args]
+	shape = p.shape
+
+	def f(x, ind):
+		with np.errstate(all='ignore'):
+			return func(x, *(a[ind] for a in args)) - p[ind]
+
+	allind = np.ones(shape, dtype=bool)
+
+	# 1. bracketing
+	lo = np.full(shape, float(x0))
+	hi = lo.copy()
+	flo = f(lo, allind)
+	fhi = flo.copy()
+	step = abs(xstep) or 1.
+	for _ in range(64):
+		# (f is NaN at x0 out of the domain of func: keep stepping)
+		todo = (np.sign(flo) == np.sign(fhi)) & (flo != 0) | \
+					~np.isfinite(flo) | ~np.isfinite(fhi)
+		if not todo.any():
+			break
+		for bound, fbound, sign in [(lo, flo, -1), (hi, fhi, 1)]:
+			xnew = bound[todo] + sign * step
+			fnew = f(xnew, todo)
+			# do not step out of the domain of func
+			finite = np.isfinite(fnew)
+			sub = bound[todo]
+			fsub = fbound[todo]
+			sub[finite] = xnew[finite]
+			fsub[finite] = fnew[finite]
+			bound[todo] = sub
+			fbound[todo] = fsub
+		step *= 2
+
+	bracketed = ( (np.sign(flo) != np.sign(fhi)) | (flo == 0) ) & \
+					np.isfinite(flo) & np.isfinite(fhi)
+	hi[flo == 0] = lo[flo == 0]
+
+	# 2. safeguarded Newton, starting from the secant point
+	with np.errstate(all='ignore'):
+		x = np.where(bracketed & (fhi != flo), lo - flo * (hi - lo)/(fhi - flo), lo)
+	for _ in range(maxiter):
+		todo = bracketed & (hi - lo > 2 * xtol)
+		if not todo.any():
+			break
+		xt, lot, hit = x[todo], lo[todo], hi[todo]
+		flot = flo[todo]
+		fx = f(xt, todo)
+		h = 1e-7 * np.maximum(np.abs(xt), 1.)
+		with np.errstate(all='ignore'):
+			dx = - fx * h / (f(xt + h, todo) - fx)
+		xn = xt + dx
+		outside = ~( (xn > np.minimum(lot, hit)) & (xn < np.maximum(lot, hit)) )
+		xn[outside] = 0.5 * (lot[outside] + hit[outside])
+
+		# tiny Newton step: check that the root is really within xtol
+		small = ~outside & (np.abs(dx) < xtol/2)
+		xa = xn - np.sign(hit - lot) * xtol/2
+		xb = xn + np.sign(hit - lot) * xtol/2
+		fa = f(xa, todo)
+		fb = f(xb, todo)
+		straddle = small & (np.sign(fa) != np.sign(fb))
+		lot[straddle], hit[straddle] = xa[straddle], xb[straddle]
+		flot[straddle] = fa[straddle]
+
+		rest = ~straddle
+		fn = f(xn, todo)
+		same = rest & (np.sign(fn) == np.sign(flot))
+		lot[same] = xn[same]
+		flot[same] = fn[same]
+		other = rest & ~same
+		hit[other] = xn[other]
+
+		x[todo], lo[todo], hi[todo], flo[todo] = xn, lot, hit, flot
+
+	res = np.where(bracketed, 0.5 * (lo + hi), np.nan).reshape(outshape)
+	return res if res.ndim else res[()]
+
+
+class CalibrationGrid():
+	''' P(x) of calib at fixed T, x0, T0 tabulated on a dense x grid, and 
+	linearly interpolated both ways. The grid covers P from Pmin to Pmax 
+	(less if the calibration does not reach them) and is refined until 
+	the interpolation errors at the midpoints are below Ptol (GPa) and 
+	xtol (in calib.xstep). valid is False when P(x) is not monotonic or 
+	the tolerances cannot be met: queries are then all outside. '''
+
+	def __init__(self, calib, T, x0, T0, Pmin=-10., Pmax=500., Ptol=1e-6,
+					xtol=1e-4, n=1025, maxn=2**16 + 1):
+		self.valid = False
+		self.x = self.P = np.empty(0)
+
+		# x range: Pmax lowered until the calibration reaches it
+		for _ in range(10):
+			xlo, xhi = calib.invfunc(np.array([Pmin, Pmax]), T, x0, T0)
+			if np.isfinite([xlo, xhi]).all():
+				break
+			Pmax = 0.5 * Pmax
+		else:
+			return
+		xlo, xhi = min(xlo, xhi), max(xlo, xhi)
+		xtol = xtol * calib.xstep
+
+		while n <= maxn:
+			x = np.linspace(xlo, xhi, n)
+			P = calib.func(x, T, x0, T0)
+			dP = np.diff(P)
+			if not ( (dP > 0).all() or (dP < 0).all() ):
+				return
+			# errors of both interpolations at the midpoints
+			xm = 0.5 * (x[1:] + x[:-1])
+			Pm = calib.func(xm, T, x0, T0)
+			Perr = np.max(np.abs(0.5 * (P[1:] + P[:-1]) - Pm))
+			order = slice(None) if dP[0] > 0 else slice(None, None, -1)
+			xerr = np.max(np.abs(np.interp(Pm, P[order], x[order]) - xm))
+			if Perr <= Ptol and xerr <= xtol:
+				break
+			n = 2 * n - 1
+		else:
+			return
+
+		self.x = x
+		self.P = P
+		# increasing P for the inverse interpolation
+		self._Pinc = P[order]
+		self._xinc = x[order]
+		self.valid = True
+
+	# NaN outside of the grid
+
+	def func(self, x):
+		return np.interp(x, self.x, self.P, left=np.nan, right=np.nan)
+
+	def invfunc(self, P):
+		return np.interp(P, self._Pinc, self._xinc, left=np.nan, right=np.nan)
+
+
+class CalibrationCache():
+	''' CalibrationGrid of the last maxsize (calib, T, x0, T0), least 
+	recently used evicted first. A grid is built when its parameters are 
+	asked for the buildafter-th time: changing T, x0 or T0 at each query 
+	(e.g. scrubbing the T spinbox) does not pay for grids used once. '''
+
+	def __init__(self, maxsize=32, buildafter=2):
+		self.maxsize = maxsize
+		self.buildafter = buildafter
+		self.lock = threading.Lock() # used by the compute worker thread
+		self.entries = OrderedDict() # key: CalibrationGrid or number of queries
+
+	def get(self, calib, T, x0, T0):
+		''' CalibrationGrid of calib at T, x0, T0 or None (not built yet, 
+		or T, x0, T0 are arrays) '''
+		scalars = (float, int, np.generic)
+		if not (isinstance(T, scalars) and isinstance(x0, scalars) 
+										and isinstance(T0, scalars)):
+			return None
+		key = (calib, float(T), float(x0), float(T0))
+		with self.lock:
+			entry = self.entries.get(key, 0)
+			if isinstance(entry, CalibrationGrid):
+				self.entries.move_to_end(key)
+				return entry
+			entry += 1
+			self.entries[key] = entry
+			self.entries.move_to_end(key)
+			self._evict()
+			if entry < self.buildafter:
+				return None
+
+		# built out of the lock, the last one in wins
+		grid = CalibrationGrid(calib, *key[1:])
+		with self.lock:
+			self.entries[key] = grid
+			self.entries.move_to_end(key)
+			self._evict()
+		return grid
+
+	def _evict(self):
+		while len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+# shared by all HPCalibration, see HPCalibration.cachedfunc
+calibration_cache = CalibrationCache()
 
 
 class HPCalibration():
 	''' A general HP calibration object '''
 	def __init__(self, name, func, Tcor_name, 
-					xname, xunit, x0default, xstep, color):
+					xname, xunit, x0default, xstep, color, inverse=None,
+					fitmodel=None, grad=None):
 		self.name = name
 		self.func = func
+		self.inverse = inverse  # analytic P -> x, if available
+		self.grad = grad  # analytic dP/d(x, T, x0, T0), if available
+		self.fitmodel = fitmodel  # spectrum fit, see myPRLSpectra.FITTERS
 		self.Tcor_name = Tcor_name
 		self.xname = xname
 		self.xunit = xunit
@@ -23,15 +267,48 @@ class HPCalibration():
 	def __repr__(self):
 		return 'HPCalibration : ' + str( self.__dict__ )
 
-	def invfunc(self, p, *args, **kwargs):
-		res = minimize( lambda x: ( self.func(x, *args, **kwargs) - p )**2, 
-									x0=self.x0default, tol=1e-6)
-		return res.x[0]
+	@myPRLProfiling.timed('calib.invfunc')
+	def invfunc(self, p, *args):
+		# vectorized like func: p and args may be arrays
+		if self.inverse is not None:
+			return self.inverse(p, *args)
+		return bracketed_newton(self.func, p, args, 
+								x0=self.x0default, xstep=self.xstep)
+
+	# through calibration_cache: for repeated queries with the same T, x0
+	# and T0, e.g. scrubbing the x or P spinboxes. Exact outside of the grid.
+
+	@myPRLProfiling.timed('calib.cachedfunc')
+	def cachedfunc(self, x, T, x0, T0):
+		grid = calibration_cache.get(self, T, x0, T0)
+		if grid is None or not grid.valid:
+			return self.func(x, T, x0, T0)
+		P = grid.func(x)
+		if isinstance(P, float):
+			return P if P == P else self.func(x, T, x0, T0)
+		outside = np.isnan(P)
+		if outside.any():
+			P = np.where(outside, self.func(x, T, x0, T0), P)
+		return P
+
+	@myPRLProfiling.timed('calib.cachedinvfunc')
+	def cachedinvfunc(self, p, T, x0, T0):
+		grid = calibration_cache.get(self, T, x0, T0)
+		if grid is None or not grid.valid:
+			return self.invfunc(p, T, x0, T0)
+		x = grid.invfunc(p)
+		if isinstance(x, float):
+			return x if x == x else self.invfunc(p, T, x0, T0)
+		outside = np.isnan(x)
+		if outside.any():
+			x = np.where(outside, self.invfunc(p, T, x0, T0), x)
+		return x
 
 
 class HPData():
 
-	def __init__(self, Pm, P, x, T, x0, T0, calib, file):
+	def __init__(self, Pm, P, x, T, x0, T0, calib, file, 
+					sP=0, sx=0, sT=0, sx0=0, sT0=0):
 		super().__init__()
 
 		self.Pm = Pm
@@ -42,39 +319,317 @@ class HPData():
 		self.T0 = T0
 		self.calib = calib
 		self.file = file
+		# uncertainties (1 sigma), sP is computed from the others
+		self.sP = sP
+		self.sx = sx
+		self.sT = sT
+		self.sx0 = sx0
+		self.sT0 = sT0
 
 	def __repr__(self):
 		return str(self.df)
 
-	def calcP(self):
-		self.P = self.calib.func(self.x, self.T, self.x0, self.T0)
+	# cached: through the interpolation grids of HPCalibration.cachedfunc
 
-	def invcalcP(self):
-		self.x = self.calib.invfunc(self.P, self.T, self.x0, self.T0)
+	@myPRLProfiling.timed('point.calcP')
+	def calcP(self, cached=False):
+		func = self.calib.cachedfunc if cached else self.calib.func
+		self.P = func(self.x, self.T, self.x0, self.T0)
+		self.calcsP()
+
+	@myPRLProfiling.timed('point.invcalcP')
+	def invcalcP(self, cached=False):
+		invfunc = self.calib.cachedinvfunc if cached else self.calib.invfunc
+		x = invfunc(self.P, self.T, self.x0, self.T0)
+		if not np.isfinite(x):
+			raise ValueError('No {} found for P = {} GPa'.format(
+										self.calib.xname, self.P))
+		self.x = float(x)
+		self.calcsP()
+
+	def calcsP(self):
+		self.sP = float( myPRLUncertainty.sigmaP(self.calib, self.x, self.T, 
+											self.x0, self.T0, self.sx, self.sT,
+											self.sx0, self.sT0) )
 
 	# SOMETHING TO RETRIEVE THE CALIB OBJECT BY ITS NAME ?
 
 	@property
 	def df(self):		
+		import pandas as pd
 		_df = pd.DataFrame({'Pm': self.Pm,
 							'P' : self.P, 
 							'x' : self.x,
 							'T' : self.T,
 							'x0': self.x0,
 							'T0': self.T0,
+							'sP': self.sP,
+							'sx': self.sx,
+							'sT': self.sT,
+							'sx0': self.sx0,
+							'sT0': self.sT0,
 							'calib': self.calib.name,
 							'file' : self.file}, index=[0])
 		return _df
 
 
+def default_calibrations():
+	''' The calibrations of myPRL-qt, by name '''
+
+	Ruby2020 = HPCalibration(name = 'Ruby2020',
+							 func = myPRLCalibfuncs.Pruby2020,
+							 inverse = myPRLCalibfuncs.invPruby2020,
+							 grad = myPRLCalibfuncs.gradPruby2020,
+							 Tcor_name='Datchi 2007',
+							 xname = 'lambda',
+							 xunit = 'nm',
+							 x0default = 694.28,
+							 xstep = .01,
+							 color = 'lightcoral',
+							 fitmodel = 'ruby')
+
+	SamariumDatchi = HPCalibration(name = 'Samarium Borate Datchi 1997',
+								   func = myPRLCalibfuncs.PsamDatchi1997,
+								   inverse = myPRLCalibfuncs.invPsamDatchi1997,
+								   grad = myPRLCalibfuncs.gradPsamDatchi1997,
+								   Tcor_name='NA',
+								   xname = 'lambda',
+								   xunit = 'nm',
+								   x0default = 685.41,
+								   xstep = .01,
+								   color = 'moccasin',
+								   fitmodel = 'samarium')
+
+	Akahama2006 = HPCalibration(name = 'Diamond Raman Edge Akahama 2006',
+								func = myPRLCalibfuncs.PAkahama2006,
+								inverse = myPRLCalibfuncs.invPAkahama2006,
+								grad = myPRLCalibfuncs.gradPAkahama2006,
+								Tcor_name='NA',
+								xname = 'nu',
+								xunit = 'cm-1',
+								x0default = 1333,
+								xstep = .1,
+								color = 'darkgrey')
+
+	cBNDatchi = HPCalibration(name = 'cBN Raman Datchi 2007',
+							  func = myPRLCalibfuncs.PcBN,
+							  inverse = myPRLCalibfuncs.invPcBN,
+							  grad = myPRLCalibfuncs.gradPcBN,
+							  Tcor_name='Datchi 2007',
+							  xname = 'nu',
+							  xunit = 'cm-1',
+							  x0default = 1054,
+							  xstep = .1,
+							  color = 'lightblue')
+
+	calib_list = [Ruby2020, 
+				  SamariumDatchi, 
+				  Akahama2006, 
+				  cBNDatchi]
+
+	return {a.name:a for a in calib_list}
+
+
+class HPDataChange():
+	''' Payload of HPDataTable.changed: what kind of change ('insert', 
+	'remove', 'update' or 'reset'), which rows (first to last, included)
+	and which columns. Rows of a 'remove' are the rows before removal,
+	a 'reset' means that anything may have changed. '''
+	def __init__(self, kind, first, last, columns=None):
+		self.kind = kind
+		self.first = first
+		self.last = last
+		self.columns = set(HPDataTable.columns if columns is None else columns)
+
+	def __repr__(self):
+		return 'HPDataChange({}, {}, {}, {})'.format(self.kind, self.first, 
+											self.last, sorted(self.columns))
+
+	@property
+	def nrows(self):
+		return self.last - self.first + 1
+
+	def merge(self, other):
+		''' A single change equivalent to self followed by other. 
+		Falls back to a 'reset' when there is no simpler equivalent. '''
+		k1, k2 = self.kind, other.kind
+		if k1 == 'update' and k2 == 'update':
+			if self.nrows <= 0:
+				return other
+			if other.nrows <= 0:
+				return self
+			return HPDataChange('update', min(self.first, other.first), 
+										  max(self.last, other.last),
+										  self.columns | other.columns)
+		elif k1 == 'insert' and k2 == 'insert' and other.first == self.last + 1:
+			return HPDataChange('insert', self.first, other.last)
+		elif k1 == 'insert' and k2 == 'update' \
+						and self.first <= other.first and other.last <= self.last:
+			return self
+		elif k1 == 'remove' and k2 == 'remove':
+			if other.last + 1 == self.first:
+				# e.g. successive removelast()
+				return HPDataChange('remove', other.first, self.last)
+			elif other.first == self.first:
+				return HPDataChange('remove', self.first, 
+											  self.last + other.nrows)
+		return HPDataChange('reset', 0, -1)
+
+
+class HPDataHistory():
+	''' Undo and redo stacks of a HPDataTable. A step is a list of diffs
+	(one change, or all the changes of a batch):
+
+		('insert', first, last)          rows inserted
+		('remove', first, rows)          rows removed, with their content
+		('update', first, last, cols)    previous values of some columns
+		('reset', state)                 previous content of the whole table
+		('method', uncertainty, ndraws)  previous sP method, see set_uncertainty
+
+	Diffs hold only the changed values, calibrations by reference. The
+	oldest steps are forgotten when the stacks take more than budget bytes. '''
+
+	def __init__(self, budget=64 * 2**20):
+		self.budget = budget
+		self.undos = deque() # (step, nbytes), last done at the right
+		self.redos = deque() # (step, nbytes), next to redo at the right
+		self.nbytes = 0
+
+	def __repr__(self):
+		return 'HPDataHistory : {} undo, {} redo, {} bytes'.format(
+							len(self.undos), len(self.redos), self.nbytes)
+
+	@staticmethod
+	def _size(step):
+		# rough memory use of a step (Python objects included, measured with
+		# tracemalloc): arrays, plus the file names they keep alive
+		size = 100
+		for diff in step:
+			size += 200
+			for part in diff[1:]:
+				if isinstance(part, dict):
+					part = list(part.values())
+				for a in (part if isinstance(part, (tuple, list)) else [part]):
+					if isinstance(a, np.ndarray):
+						size += 110 + a.nbytes * (7 if a.dtype == object else 1)
+		return size
+
+	def _push(self, stack, step):
+		size = self._size(step)
+		stack.append( (step, size) )
+		self.nbytes += size
+		while self.nbytes > self.budget and (self.undos or self.redos):
+			# oldest undo first, then the last redo
+			old = self.undos.popleft() if self.undos else self.redos.popleft()
+			self.nbytes -= old[1]
+
+	def _pop(self, stack):
+		if not stack:
+			return None
+		step, size = stack.pop()
+		self.nbytes -= size
+		return step
+
+	def record(self, step):
+		''' a new edit: no redo anymore '''
+		while self.redos:
+			self.nbytes -= self.redos.pop()[1]
+		self._push(self.undos, step)
+
+	def clear(self):
+		self.undos.clear()
+		self.redos.clear()
+		self.nbytes = 0
+
+	@property
+	def canundo(self):
+		return len(self.undos) > 0
+
+	@property
+	def canredo(self):
+		return len(self.redos) > 0
+
+
+class HPDataRow():
+	''' A view on one row of a HPDataTable: reads and writes go directly
+	to the table columns. The view follows the row position, not the point:
+	it is only meant to be short-lived. '''
+
+	def __init__(self, table, index):
+		# bypass __setattr__ below
+		object.__setattr__(self, '_table', table)
+		object.__setattr__(self, '_index', index)
+
+	def __repr__(self):
+		return str(self.df)
+
+	def __getattr__(self, attr):
+		if attr in HPDataTable.columns:
+			return self._table.getitemval(self._index, attr)
+		raise AttributeError(attr)
+
+	def __setattr__(self, attr, val):
+		if attr in HPDataTable.columns:
+			self._table.setitemval(self._index, attr, val)
+		else:
+			object.__setattr__(self, attr, val)
+
+	def calcP(self):
+		self._table.recalc_item_P(self._index)
+
+	def invcalcP(self):
+		self._table.reinvcalc_item_P(self._index)
+
+	def tohpdata(self):
+		return HPData(**{ k: getattr(self, k) for k in HPDataTable.columns })
+
+	@property
+	def df(self):
+		return self.tohpdata().df
+
+
 class HPDataTable(QObject):
-	
-	changed = pyqtSignal()
+	''' Columnar storage of HP data points: the numerical columns live in
+	one preallocated (ncols x capacity) float array that grows by doubling,
+	calibrations are stored as integer codes into self.calibs. 
+	sP is computed with P, from the sx, sT, sx0 and sT0 columns, by linear 
+	propagation or by Monte Carlo (see set_uncertainty). 
+	Changes are recorded in self.history (None: no undo), see undo(). '''
+
+	# sends a HPDataChange, once per batch of changes (see batch())
+	changed = pyqtSignal(object)
+	# the 'insert', 'remove' or 'reset' HPDataChange of rows, right before
+	# and right after it is done, also in batches: what Qt models need
+	rowschanging = pyqtSignal(object)
+	rowschanged = pyqtSignal(object)
+	# the new sP method, by set_uncertainty and by its undo and redo
+	methodchanged = pyqtSignal(str)
+
+	numcols = ['Pm', 'P', 'x', 'T', 'x0', 'T0', 'sP', 'sx', 'sT', 'sx0', 'sT0']
+	columns = numcols + ['calib', 'file']
+	# columns P depends on, and columns sP depends on
+	inputcols = ['x', 'T', 'x0', 'T0']
+	sigmacols = ['sx', 'sT', 'sx0', 'sT0']
 
-	def __init__(self, df=None, calibrations=None):
+	def __init__(self, df=None, calibrations=None, capacity=64):
 		super().__init__()	
-	
-		self.datalist = []
+
+		self._n = 0
+		self._num = np.empty( (len(self.numcols), capacity) )
+		self._codes = np.empty(capacity, dtype=np.int16)
+		self._files = np.empty(capacity, dtype=object)
+		self.calibs = [] # HPCalibration objects, indexed by the codes
+
+		self._batchdepth = 0
+		self._pending = None  # HPDataChange waiting for the end of the batch
+
+		# 'linear' or 'montecarlo', see set_uncertainty
+		self.uncertainty = 'linear'
+		self.ndraws = 1000
+
+		self.history = HPDataHistory()
+		self._step = []  # diffs of the current batch
+		self._undoing = False
 
 		if df is not None:
 			self.reconstruct_from_df(df, calibrations)
@@ -83,68 +638,479 @@ class HPDataTable(QObject):
 		return str( self.df )
 
 	def __getitem__(self, index):
-		return self.datalist[index]
+		return HPDataRow(self, self._checkindex(index))
 
+	@myPRLProfiling.timed('table.setitem')
 	def __setitem__(self, index, HPDataobj):
-		self.datalist[index] = HPDataobj
-		self.changed.emit()
+		index = self._checkindex(index)
+		self._record_update(index, index, self.columns)
+		self._setrow(index, HPDataobj)
+		self._emit('update', index, index)
 
 	def __len__(self):
-		return len(self.datalist)
+		return self._n
+
+	def _emit(self, kind, first, last, columns=None):
+		change = HPDataChange(kind, first, last, columns)
+		if self._batchdepth > 0:
+			self._pending = change if self._pending is None \
+									else self._pending.merge(change)
+		else:
+			self.changed.emit(change)
+
+	@contextmanager
+	def _rowchange(self, kind, first, last):
+		# around each change of the rows
+		change = HPDataChange(kind, first, last)
+		self.rowschanging.emit(change)
+		try:
+			yield
+		finally:
+			self.rowschanged.emit(change)
+
+	def begin(self):
+		''' Starts a batch: changed is sent only once, at commit(), 
+		and the batch is undone in one step '''
+		self._batchdepth += 1
+
+	def commit(self):
+		self._batchdepth -= 1
+		if self._batchdepth == 0 and self._step:
+			step, self._step = self._step, []
+			self.history.record(step)
+		if self._batchdepth == 0 and self._pending is not None:
+			change, self._pending = self._pending, None
+			self.changed.emit(change)
 
+	@contextmanager
+	def batch(self):
+		''' with table.batch(): ... groups changes in one notification '''
+		self.begin()
+		try:
+			yield self
+		finally:
+			self.commit()
 
+	def _checkindex(self, index):
+		index = int(index)
+		if index < 0:
+			index += self._n
+		if not 0 <= index < self._n:
+			raise IndexError('HPDataTable index out of range')
+		return index
+
+	# undo / redo
+
+	def _record(self, diff):
+		if self.history is None or self._undoing:
+			return
+		if self._batchdepth > 0:
+			self._step.append(diff)
+		else:
+			self.history.record([diff])
+
+	def _getcols(self, first, last, columns):
+		# copies of some columns of rows first to last
+		sl = slice(first, last + 1)
+		cols = {}
+		for key in columns:
+			if key == 'calib':
+				cols[key] = self._codes[sl].copy()
+			elif key == 'file':
+				cols[key] = self._files[sl].copy()
+			else:
+				cols[key] = self._num[self.numcols.index(key), sl].copy()
+		return cols
+
+	def _setcols(self, first, cols):
+		for key, v in cols.items():
+			sl = slice(first, first + len(v))
+			if key == 'calib':
+				self._codes[sl] = v
+			elif key == 'file':
+				self._files[sl] = v
+			else:
+				self._num[self.numcols.index(key), sl] = v
+
+	def _record_update(self, first, last, columns):
+		# to be called before the change
+		if self.history is not None and not self._undoing and last >= first:
+			self._record( ('update', first, last, 
+								self._getcols(first, last, columns)) )
+
+	def _take(self, first, last):
+		sl = slice(first, last + 1)
+		return (self._num[:, sl].copy(), self._codes[sl].copy(), 
+				self._files[sl].copy())
+
+	def _delete(self, first, last):
+		# removes rows first to last, no notification
+		k = last - first + 1
+		n = self._n
+		self._num[:, first:n-k] = self._num[:, last+1:n]
+		self._codes[first:n-k] = self._codes[last+1:n]
+		self._files[first:n-k] = self._files[last+1:n]
+		self._files[n-k:n] = None
+		self._n -= k
+
+	def _insert(self, first, rows):
+		# inserts rows (as given by _take) before row first, no notification
+		num, codes, files = rows
+		k = len(codes)
+		n = self._n
+		self._reserve(n + k)
+		self._num[:, first+k:n+k] = self._num[:, first:n]
+		self._codes[first+k:n+k] = self._codes[first:n]
+		self._files[first+k:n+k] = self._files[first:n]
+		self._num[:, first:first+k] = num
+		self._codes[first:first+k] = codes
+		self._files[first:first+k] = files
+		self._n += k
+
+	def _state(self):
+		return (self._take(0, self._n - 1), list(self.calibs))
+
+	def _apply(self, diff):
+		# applies diff, returns the diff that reverts it
+		kind = diff[0]
+		if kind == 'insert':
+			_, first, last = diff
+			rows = self._take(first, last)
+			with self._rowchange('remove', first, last):
+				self._delete(first, last)
+			self._emit('remove', first, last)
+			return ('remove', first, rows)
+		elif kind == 'remove':
+			_, first, rows = diff
+			last = first + len(rows[1]) - 1
+			with self._rowchange('insert', first, last):
+				self._insert(first, rows)
+			self._emit('insert', first, last)
+			return ('insert', first, last)
+		elif kind == 'update':
+			_, first, last, cols = diff
+			current = self._getcols(first, last, cols)
+			self._setcols(first, cols)
+			self._emit('update', first, last, cols)
+			return ('update', first, last, current)
+		elif kind == 'method':
+			current = ('method', self.uncertainty, self.ndraws)
+			_, self.uncertainty, self.ndraws = diff
+			self.methodchanged.emit(self.uncertainty)
+			return current
+		else:
+			_, state = diff
+			current = self._state()
+			rows, self.calibs = state
+			with self._rowchange('reset', 0, len(rows[1]) - 1):
+				self._n = 0
+				self._insert(0, rows)
+				self._files[self._n:] = None
+			self._emit('reset', 0, self._n - 1)
+			return ('reset', current)
+
+	def _revert(self, step):
+		# applies a step backwards, returns the step that reverts it
+		self._undoing = True
+		try:
+			with self.batch():
+				return [self._apply(diff) for diff in reversed(step)]
+		finally:
+			self._undoing = False
+
+	@myPRLProfiling.timed('table.undo')
+	def undo(self):
+		''' undoes the last change, or batch of changes. False if none '''
+		step = None if self.history is None else self.history._pop(
+														self.history.undos)
+		if step is None:
+			return False
+		self.history._push(self.history.redos, self._revert(step))
+		return True
+
+	@myPRLProfiling.timed('table.redo')
+	def redo(self):
+		step = None if self.history is None else self.history._pop(
+														self.history.redos)
+		if step is None:
+			return False
+		self.history._push(self.history.undos, self._revert(step))
+		return True
+
+	def _reserve(self, n):
+		# amortized O(1) appends: capacity is doubled when exceeded
+		capacity = self._num.shape[1]
+		if n <= capacity:
+			return
+		capacity = max(n, 2 * capacity)
+		num = np.empty( (len(self.numcols), capacity) )
+		num[:, :self._n] = self._num[:, :self._n]
+		codes = np.empty(capacity, dtype=self._codes.dtype)
+		codes[:self._n] = self._codes[:self._n]
+		files = np.empty(capacity, dtype=object)
+		files[:self._n] = self._files[:self._n]
+		self._num, self._codes, self._files = num, codes, files
+
+	def _calibcode(self, calib):
+		# calibrations are identified by their names
+		for i, c in enumerate(self.calibs):
+			if c is calib or c.name == calib.name:
+				return i
+		self.calibs.append(calib)
+		return len(self.calibs) - 1
+
+	def _setrow(self, index, HPDataobj):
+		for k, key in enumerate(self.numcols):
+			self._num[k, index] = getattr(HPDataobj, key)
+		self._codes[index] = self._calibcode(HPDataobj.calib)
+		self._files[index] = HPDataobj.file
+
+	def column(self, key):
+		''' zero-copy view on a numerical column '''
+		return self._num[self.numcols.index(key), :self._n]
+
+	@property
+	def codes(self):
+		return self._codes[:self._n]
+
+	@property
+	def files(self):
+		return self._files[:self._n]
+
+	@property
+	def values(self):
+		''' zero-copy (n x ncols) view on the numerical columns '''
+		return self._num[:, :self._n].T
+
+	def getitemval(self, item, attr):
+		item = self._checkindex(item)
+		if attr == 'calib':
+			return self.calibs[ self._codes[item] ]
+		elif attr == 'file':
+			return self._files[item]
+		else:
+			return float( self._num[self.numcols.index(attr), item] )
+
+	@myPRLProfiling.timed('table.recalc_item_P')
 	def recalc_item_P(self, index):
 		# method implemented to emit change!
-		self.datalist[index].calcP()
-		self.changed.emit()
+		index = self._checkindex(index)
+		self._record_update(index, index, ['P', 'sP'])
+		self._calcP(index)
+		self._emit('update', index, index, ['P', 'sP'])
 
+	@myPRLProfiling.timed('table.reinvcalc_item_P')
 	def reinvcalc_item_P(self, index):
-		self.datalist[index].invcalcP()
-		self.changed.emit()
+		index = self._checkindex(index)
+		self._record_update(index, index, ['x', 'sP'])
+		self._invcalcP(index)
+		self._emit('update', index, index, ['x', 'sP'])
+
+	def _calcP(self, index):
+		x, T, x0, T0 = (self.getitemval(index, k) for k in ['x', 'T', 'x0', 'T0'])
+		calib = self.getitemval(index, 'calib')
+		self._num[1, index] = calib.func(x, T, x0, T0)
+		self._calcsP(index, index + 1)
+
+	@myPRLProfiling.timed('table.calcsP')
+	def _calcsP(self, start, stop):
+		# sP of rows start to stop, one vectorized call per calibration
+		codes = self._codes[start:stop]
+		x, T, x0, T0, sx, sT, sx0, sT0 = (self.column(k)[start:stop] 
+							for k in self.inputcols + self.sigmacols)
+		sP = self.column('sP')[start:stop]
+		for code in np.unique(codes):
+			ind = np.flatnonzero(codes == code)
+			args = (self.calibs[code], x[ind], T[ind], x0[ind], T0[ind], 
+									   sx[ind], sT[ind], sx0[ind], sT0[ind])
+			if self.uncertainty == 'montecarlo':
+				sP[ind] = myPRLUncertainty.sigmaP_montecarlo(*args, 
+														ndraws=self.ndraws)
+			else:
+				sP[ind] = myPRLUncertainty.sigmaP(*args)
+
+	@myPRLProfiling.timed('table.set_uncertainty')
+	def set_uncertainty(self, method, ndraws=None):
+		''' 'linear' or 'montecarlo' (with ndraws draws per point) 
+		computation of sP, recomputed for the whole table '''
+		if method not in ('linear', 'montecarlo'):
+			raise ValueError('Unknown uncertainty method: {}'.format(method))
+		# one undo step for the method and the sP values: undo and redo
+		# give rows back with the method of their sP
+		with self.batch():
+			self._record( ('method', self.uncertainty, self.ndraws) )
+			self.uncertainty = method
+			if ndraws is not None:
+				self.ndraws = ndraws
+			self.methodchanged.emit(method)
+			self._record_update(0, self._n - 1, ['sP'])
+			self._calcsP(0, self._n)
+			self._emit('update', 0, self._n - 1, ['sP'])
 
+	def _invcalcP(self, index):
+		P, T, x0, T0 = (self.getitemval(index, k) for k in ['P', 'T', 'x0', 'T0'])
+		calib = self.getitemval(index, 'calib')
+		x = calib.invfunc(P, T, x0, T0)
+		if not np.isfinite(x):
+			raise ValueError('No {} found for P = {} GPa'.format(calib.xname, P))
+		self._num[2, index] = x
+		self._calcsP(index, index + 1)
+
+	@myPRLProfiling.timed('table.setitemval')
 	def setitemval(self, item, attr, val):
-		if val != getattr(self.datalist[item],attr): 
-			setattr(self.datalist[item], attr, val)
-			self.changed.emit()
+		item = self._checkindex(item)
+		if val != self.getitemval(item, attr):
+			self._record_update(item, item, [attr])
+			if attr == 'calib':
+				self._codes[item] = self._calibcode(val)
+			elif attr == 'file':
+				self._files[item] = val
+			else:
+				self._num[self.numcols.index(attr), item] = val
+			self._emit('update', item, item, [attr])
+
+	@myPRLProfiling.timed('table.setcolumnval')
+	def setcolumnval(self, attr, val):
+		# same value for all points, e.g. a new T0 for the whole ramp
+		if attr not in self.columns:
+			raise ValueError('Unknown column: {}'.format(attr))
+		self._record_update(0, self._n - 1, [attr, 'P', 'sP'])
+		# calib and file as in setitemval
+		if attr == 'calib':
+			self._codes[:self._n] = self._calibcode(val)
+		elif attr == 'file':
+			self._files[:self._n] = val
+		else:
+			self.column(attr)[:] = val
+		columns = [attr]
+		if attr in self.inputcols:
+			self._recalc_all_P()
+			columns += ['P', 'sP']
+		elif attr in self.sigmacols:
+			self._calcsP(0, self._n)
+			columns.append('sP')
+		self._emit('update', 0, self._n - 1, columns)
+
+	@myPRLProfiling.timed('table.recalc_all_P')
+	def recalc_all_P(self):
+		self._record_update(0, self._n - 1, ['P', 'sP'])
+		self._recalc_all_P()
+		self._emit('update', 0, self._n - 1, ['P', 'sP'])
 
+	def _recalc_all_P(self):
+		# one vectorized call per calibration instead of one call per point
+		codes = self.codes
+		x, T, x0, T0 = (self.column(k) for k in ['x', 'T', 'x0', 'T0'])
+		P = self.column('P')
+		for code in np.unique(codes):
+			ind = np.flatnonzero(codes == code)
+			P[ind] = self.calibs[code].func(x[ind], T[ind], x0[ind], T0[ind])
+		self._calcsP(0, self._n)
+
+	@myPRLProfiling.timed('table.add')
 	def add(self, buffer):
-		# NB:  deepcopy fails if HPData inherits from QObject !
-		# deepcopy absolutely necessary here
-		# Here I work with the HPData object
-		self.datalist.append( deepcopy(buffer) )
-		self.changed.emit()
+		# values are copied from the buffer HPData into the columns
+		self._reserve(self._n + 1)
+		self._setrow(self._n, buffer)
+		with self._rowchange('insert', self._n, self._n):
+			self._n += 1
+		if self.uncertainty != 'linear':
+			# the buffer sP is a linear one
+			self._calcsP(self._n - 1, self._n)
+		self._record( ('insert', self._n - 1, self._n - 1) )
+		self._emit('insert', self._n - 1, self._n - 1)
+
+	@myPRLProfiling.timed('table.extend')
+	def extend(self, Pm, P, x, T, x0, T0, calib, files, 
+						sx=0, sT=0, sx0=0, sT0=0):
+		''' appends many points at once, with a single notification: 
+		values are arrays or scalars, calib a single HPCalibration.
+		sP is computed from the uncertainties sx, sT, sx0, sT0. '''
+		n = len(files)
+		if n == 0:
+			return
+		first = self._n
+		self._reserve(first + n)
+		for k, v in enumerate([Pm, P, x, T, x0, T0]):
+			self._num[k, first:first+n] = v
+		for key, v in zip(self.sigmacols, [sx, sT, sx0, sT0]):
+			self._num[self.numcols.index(key), first:first+n] = v
+		self._codes[first:first+n] = self._calibcode(calib)
+		self._files[first:first+n] = files
+		with self._rowchange('insert', first, first + n - 1):
+			self._n += n
+		self._calcsP(first, self._n)
+		self._record( ('insert', first, first + n - 1) )
+		self._emit('insert', first, first + n - 1)
 
 	def removelast(self):
-		# Here I work with the HPData object
-		self.datalist = self.datalist[:-1]
-		self.changed.emit()
+		if self._n > 0:
+			self.removespecific(self._n - 1)
 
+	@myPRLProfiling.timed('table.removespecific')
 	def removespecific(self, index):
-		del self.datalist[index]
-		self.changed.emit()
+		index = self._checkindex(index)
+		self._record( ('remove', index, self._take(index, index)) )
+		with self._rowchange('remove', index, index):
+			self._delete(index, index)
+		self._emit('remove', index, index)
 
+	@myPRLProfiling.timed('table.reconstruct_from_df')
 	def reconstruct_from_df(self, df, calibrations):
 		# erases the previous content!
-		self.datalist = []
-		for _, row in df.iterrows():
-			HPdi = HPData(Pm = row['Pm'],
-						  P  = row['P'], 
-						  x  = row['x'], 
-						  T  = row['T'], 
-						  x0 = row['x0'], 
-						  T0 = row['T0'],
-						  calib = calibrations[row['calib']], # retrieve calib
-						  file = row['file'])
-			self.datalist.append(HPdi)
-
-		self.changed.emit()
+		columns = {key: df[key].to_numpy(dtype=float) 
+								for key in self.numcols if key in df}
+
+		# retrieve calib
+		import pandas as pd
+		names = pd.Categorical( df['calib'] )
+		if (names.codes < 0).any():
+			raise ValueError('No calib in rows {}'.format(
+						df.index[names.codes < 0][:10].tolist()))
+		calibs = [ calibrations[name] for name in names.categories ]
+		# empty file cells (read as NaN) are empty names
+		files = df['file'].fillna('').astype(str).to_numpy(dtype=object)
+		self.reconstruct(columns, names.codes, calibs, files)
+
+	@myPRLProfiling.timed('table.reconstruct')
+	def reconstruct(self, columns, codes, calibs, files):
+		''' replaces the content by whole columns: columns is a dict of 
+		numerical columns (missing ones are 0), codes index into calibs '''
+		n = len(codes)
+		codes = np.asarray(codes)
+		bad = (codes < 0) | (codes >= len(calibs))
+		if bad.any():
+			raise ValueError('Invalid calib codes in rows {}'.format(
+									np.flatnonzero(bad)[:10].tolist()))
+		if self.history is not None and not self._undoing:
+			self._record( ('reset', self._state()) )
+		with self._rowchange('reset', 0, n - 1):
+			self._n = 0
+			self._reserve(n)
+			for k, key in enumerate(self.numcols):
+				# files saved without uncertainties: exact values
+				self._num[k, :n] = columns[key] if key in columns else 0
+
+			self.calibs = []
+			lut = np.array([ self._calibcode(c) for c in calibs ], 
+										dtype=self._codes.dtype)
+			self._codes[:n] = lut[codes] if n else codes
+			self._files[:n] = files
+			self._files[n:] = None
+			self._n = n
+
+		self._emit('reset', 0, n - 1)
 
 	@property
+	@myPRLProfiling.timed('table.df')
 	def df(self):
 		# should be used only as a REPRESENTATION of HPDataTable
-		_df = pd.DataFrame(columns=['Pm','P','x','T','x0','T0','calib','file'])
-		for xi in self.datalist:
-			_df = pd.concat([_df, xi.df ], ignore_index=True)
+		# numerical columns are a zero-copy view on the table
+		import pandas as pd
+		_df = pd.DataFrame(self.values, columns=self.numcols, copy=False)
+		_df['calib'] = pd.Categorical.from_codes(self.codes, 
+									categories=[c.name for c in self.calibs])
+		_df['file'] = self.files
 		return _df
 
 
@@ -152,6 +1118,7 @@ if __name__ == '__main__':
 
 	Ruby2020 = HPCalibration(name = 'Ruby2020',
 							 func = myPRLCalibfuncs.Pruby2020,
+							 inverse = myPRLCalibfuncs.invPruby2020,
 							 Tcor_name='Datchi2007',
 							 xname = 'lambda',
 							 xunit = 'nm',
@@ -0,0 +1,628 @@
+''' matplotlib windows of myPRL-qt. Imported on first use only: matplotlib
+is the largest part of the startup time otherwise. '''
+
+import os
+import time
+import tempfile
+import functools
+from collections import OrderedDict
+import numpy as np
+import matplotlib
+matplotlib.use('Qt5Agg')
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from PyQt5.QtWidgets import (QWidget, 
+							 QVBoxLayout,
+							 QHBoxLayout,
+							 QFormLayout,
+							 QCheckBox,
+							 QLabel,
+							 QLineEdit,
+							 QComboBox,
+							 QPushButton,
+							 QSpinBox,
+							 QDoubleSpinBox,
+							 QFileDialog,
+							 QDesktopWidget)
+from PyQt5.QtCore import QTimer
+
+import myPRLProfiling
+import myPRLPmModel
+import myPRLGrid
+import myPRLDecimate
+import myPRLExperiment
+
+
+class MplCanvas(FigureCanvas):
+    def __init__(self, parent=None, width=5, height=4, dpi=100):
+        fig = Figure(figsize=(width, height), dpi=dpi, constrained_layout=True)
+        self.axes = fig.add_subplot(111)
+        super(MplCanvas, self).__init__(fig)
+
+    def resizeEvent(self, event):
+        # new size: the layout has to be done again
+        self.figure.set_layout_engine('constrained')
+        super().resizeEvent(event)
+
+    def print_figure(self, *args, **kwargs):
+        # animated (blitted) artists are skipped by savefig otherwise
+        animated = self.figure.findobj(lambda a: a.get_animated())
+        for a in animated:
+            a.set_animated(False)
+        try:
+            super().print_figure(*args, **kwargs)
+        finally:
+            for a in animated:
+                a.set_animated(True)
+
+class PmPPlotWindow(QWidget):
+	''' P vs Pm plot. One persistent line per calibration, updated with
+	set_data and blitting; redraws are coalesced to at most maxfps. 
+	Groups are the rows of index (myPRLExperiment.CalibIndex). The P(Pm)
+	fits of models (myPRLPmModel.PmPModels) are drawn over the points, and
+	give the Pm of a target P. index and models are made from the table
+	if not given. settable shows another table (e.g. another run). 
+	Groups of more than lodpoints points are decimated for the current view
+	(myPRLDecimate), again at each zoom or pan. '''
+
+	maxfps = 20
+	lodpoints = 10000
+	lodtables = 4 # tables whose pyramids are kept, for switching back
+	branchstyles = {'loading': '--', 'unloading': ':'}
+
+	def __init__(self, HPDataTable_, calibrations_, models=None, index=None):
+		super().__init__()
+
+		self.setWindowTitle('myPRL-qt plot')
+
+		self.resize(500,400)
+
+		centerPoint = QDesktopWidget().availableGeometry().center()
+		thePosition = (centerPoint.x() + 300, centerPoint.y() - 400)
+		self.move(*thePosition)
+
+		self.calibrations = calibrations_
+		self.data = None
+		# level of detail: table: ({calib name: MinMaxPyramid of the group
+		# (Pm, P)}, its changed slot), the table shown last
+		self.lod = OrderedDict()
+		self.settable(HPDataTable_, models, index)
+
+		self.canvas = MplCanvas(self, width=5, height=4, dpi=100)
+		self.toolbar = NavigationToolbar(self.canvas, self)		
+		layout = QVBoxLayout()
+
+		layout.addWidget(self.toolbar)
+		layout.addWidget(self.canvas)
+
+		# P(Pm) fits, and the Pm to reach a target P
+		model_layout = QHBoxLayout()
+		self.fit_checkbox = QCheckBox('P(Pm) fit')
+		self.fit_checkbox.setChecked(True)
+		self.target_spinbox = QDoubleSpinBox()
+		self.target_spinbox.setPrefix('target P ')
+		self.target_spinbox.setSuffix(' GPa')
+		self.target_spinbox.setDecimals(2)
+		self.target_spinbox.setRange(-np.inf, np.inf)
+		self.target_label = QLabel('')
+		model_layout.addWidget(self.fit_checkbox)
+		model_layout.addWidget(self.target_spinbox)
+		model_layout.addWidget(self.target_label)
+		model_layout.addStretch()
+		layout.addLayout(model_layout)
+
+		self.setLayout(layout)
+
+		self.fit_checkbox.toggled.connect(lambda checked: self.refreshplot())
+		self.target_spinbox.valueChanged.connect(self.update_target)
+
+		self.canvas.axes.set_xlabel('Pm (bar)')
+		self.canvas.axes.set_ylabel('P (GPa)')
+
+		self.lines = {} # calib name: Line2D
+		self.errorbars = {} # calib name: LineCollection of the P +- sP bars
+		self.fitlines = {} # calib name: {branch: Line2D of the P(Pm) fit}
+		self.background = None
+		self.canvas.mpl_connect('draw_event', self.on_draw)
+
+		self.refreshing = False
+		self.canvas.axes.callbacks.connect('xlim_changed', self.on_lims_changed)
+		self.canvas.axes.callbacks.connect('ylim_changed', self.on_lims_changed)
+
+		self.lastrefresh = 0
+		self.refresh_timer = QTimer(self)
+		self.refresh_timer.setSingleShot(True)
+		self.refresh_timer.timeout.connect(self.refreshplot)
+
+	def settable(self, HPDataTable_, models=None, index=None):
+		# connected to data.changed before updateplot: up to date when drawn
+		if self.data is not None:
+			if self.ownmodels:
+				self.models.disconnect()
+			if self.ownindex:
+				self.index.disconnect()
+		self.data = HPDataTable_
+		self.ownmodels = models is None
+		self.models = myPRLPmModel.PmPModels(HPDataTable_) if models is None \
+																else models
+		self.ownindex = index is None
+		self.index = myPRLExperiment.CalibIndex(HPDataTable_) if index is None \
+																else index
+		if HPDataTable_ not in self.lod:
+			slot = functools.partial(self.on_data_changed, HPDataTable_)
+			HPDataTable_.changed.connect(slot)
+			self.lod[HPDataTable_] = ({}, slot)
+		self.lod.move_to_end(HPDataTable_)
+		while len(self.lod) > self.lodtables:
+			table, (_, slot) = self.lod.popitem(last=False)
+			table.changed.disconnect(slot)
+		self.pyramids = self.lod[HPDataTable_][0]
+		self.groups = {} # calib name: rows of the group at the last refresh
+		# the table may already have points: plotted at the first show
+		self.dirty = True
+		if self.isVisible():
+			self.refreshplot()
+
+	@myPRLProfiling.timed('plot.updateplot')
+	def updateplot(self, change=None):
+		if change is not None and change.kind == 'update' \
+					and not change.columns & {'Pm', 'P', 'sP', 'calib'}:
+			return
+		# coalesce the changes: refresh at most maxfps times per second
+		if not self.isVisible():
+			self.dirty = True
+			return
+		if self.refresh_timer.isActive():
+			return
+		wait = 1 / self.maxfps - (time.perf_counter() - self.lastrefresh)
+		if wait <= 0:
+			self.refreshplot()
+		else:
+			self.refresh_timer.start( int(1000 * wait) + 1 )
+
+	def showEvent(self, event):
+		super().showEvent(event)
+		if self.dirty:
+			self.refreshplot()
+
+	@myPRLProfiling.timed('plot.refreshplot')
+	def refreshplot(self):
+		self.lastrefresh = time.perf_counter()
+		self.dirty = False
+		self.refreshing = True
+
+		ax = self.canvas.axes
+		Pm = self.data.column('Pm')
+		P = self.data.column('P')
+		sP = np.nan_to_num( self.data.column('sP') )
+
+		# first: the decimation depends on the limits
+		limschanged = self.autoscale(Pm, np.concatenate([P - sP, P + sP]))
+
+		newgroups = False
+		self.groups = {}
+		for name in self.index:
+			ind = self.index[name]
+			line = self.lines.get(name)
+			if line is None:
+				color = self.calibrations[name].color
+				line, = ax.plot([], [], 
+								marker='o', 
+								color=color,
+								label=name,
+								animated=True)
+				self.lines[name] = line
+				self.errorbars[name] = ax.add_collection(
+							LineCollection([], colors=color, animated=True))
+				self.fitlines[name] = {branch: ax.plot([], [], 
+									linestyle=style,
+									color=color,
+									label='_' + branch,
+									animated=True)[0]
+							for branch, style in self.branchstyles.items()}
+				newgroups = True
+			self.groups[name] = ind
+			self.set_group(name, ind, Pm, P, sP)
+			self.set_fitlines(name)
+
+		# lines of calibs no longer in the table (e.g. after loading data)
+		for name in set(self.lines) - set(self.groups):
+			self.remove_group(name)
+			newgroups = True
+		for name in set(self.pyramids) - set(self.groups):
+			del self.pyramids[name]
+		self.refreshing = False
+
+		if newgroups:
+			if ax.get_legend() is not None:
+				ax.get_legend().remove()
+			if len(self.lines) != 0:
+				ax.legend()
+			self.canvas.figure.set_layout_engine('constrained')
+			self.canvas.draw()
+		elif self.background is None or limschanged:
+			# ticks changed but not the layout
+			self.canvas.draw()
+		else:
+			self.canvas.restore_region(self.background)
+			self.draw_lines()
+			self.canvas.blit(self.canvas.figure.bbox)
+
+		self.update_target()
+
+	def set_group(self, name, ind, Pm, P, sP):
+		show = self.decimate(name, ind, Pm, P)
+		self.lines[name].set_data(Pm[show], P[show])
+
+		# (n, 2, 2) segments from P - sP to P + sP, for sP > 0 only
+		bars = show[sP[show] > 0]
+		segments = np.empty( (len(bars), 2, 2) )
+		segments[:, :, 0] = Pm[bars, None]
+		segments[:, 0, 1] = P[bars] - sP[bars]
+		segments[:, 1, 1] = P[bars] + sP[bars]
+		self.errorbars[name].set_segments(segments)
+
+	def decimate(self, name, ind, Pm, P):
+		# rows of the group to plot in the current view
+		if len(ind) <= self.lodpoints:
+			self.pyramids.pop(name, None)
+			return ind
+		pyramid = self.pyramids.get(name)
+		if pyramid is None or len(pyramid) > len(ind):
+			pyramid = self.pyramids[name] = myPRLDecimate.MinMaxPyramid()
+		# rows appended since the last refresh
+		new = ind[len(pyramid):]
+		pyramid.extend(Pm[new], P[new])
+		ax = self.canvas.axes
+		# about one bucket per pixel column
+		budget = max(int(ax.bbox.width), 100)
+		return ind[pyramid.select(ax.get_xlim(), ax.get_ylim(), budget)]
+
+	def on_data_changed(self, table, change):
+		# pyramids follow appended rows only
+		if change.kind == 'insert' and change.last == len(table) - 1:
+			return
+		if change.kind == 'update' and \
+					not change.columns & {'Pm', 'P', 'calib'}:
+			return
+		self.lod[table][0].clear()
+
+	@myPRLProfiling.timed('plot.on_lims_changed')
+	def on_lims_changed(self, ax):
+		# zoom or pan: subsets of the new view, shown by the draw that follows
+		if self.refreshing or not self.pyramids:
+			return
+		Pm = self.data.column('Pm')
+		P = self.data.column('P')
+		sP = np.nan_to_num( self.data.column('sP') )
+		for name, ind in self.groups.items():
+			if name in self.pyramids:
+				self.set_group(name, ind, Pm, P, sP)
+
+	def remove_group(self, name):
+		self.pyramids.pop(name, None)
+		self.lines.pop(name).remove()
+		self.errorbars.pop(name).remove()
+		for line in self.fitlines.pop(name).values():
+			line.remove()
+
+	def set_fitlines(self, name):
+		# fit of each branch over the Pm range of its points
+		model = self.models.get(name)
+		for branch, line in self.fitlines[name].items():
+			fit = None if model is None else model.fits[branch]
+			if not self.fit_checkbox.isChecked() or fit is None or fit.n < 2:
+				line.set_data([], [])
+				continue
+			Pm = np.linspace(fit.Pmmin, fit.Pmmax, 200)
+			line.set_data(Pm, fit.predict(Pm))
+
+	def update_target(self, s=None):
+		# Pm for the target P, with the calibration of the last point
+		if len(self.data) == 0:
+			self.target_label.setText('')
+			return
+		calib = self.data.getitemval(len(self.data) - 1, 'calib')
+		model = self.models.get(calib.name)
+		P = self.target_spinbox.value()
+		texts = []
+		for branch in myPRLPmModel.BRANCHES:
+			if model is not None and model.fits[branch].n >= 2:
+				texts.append('{}: {:.2f} bar'.format(branch, 
+												float(model.inverse(P, branch))))
+		self.target_label.setText('Pm ' + ', '.join(texts) if texts else '')
+
+	def autoscale(self, Pm, P):
+		# grow the limits with some headroom, so that a growing ramp does not
+		# change them (and force a full redraw) at each new point
+		ax = self.canvas.axes
+		if len(P) == 0:
+			return False
+
+		changed = False
+		for on, lims, setlim, d in [(ax.get_autoscalex_on(), ax.get_xlim(), 
+														ax.set_xlim, Pm),
+									(ax.get_autoscaley_on(), ax.get_ylim(),
+														ax.set_ylim, P)]:
+			dmin, dmax = np.nanmin(d), np.nanmax(d)
+			if not on or not np.isfinite([dmin, dmax]).all():
+				continue
+			span = dmax - dmin
+			inside = lims[0] <= dmin and dmax <= lims[1]
+			if inside and span >= 0.5 * (lims[1] - lims[0]):
+				continue
+			span = span or max(0.1 * abs(dmax), 1)
+			setlim(dmin - 0.15 * span, dmax + 0.15 * span, auto=None)
+			changed = True
+		return changed
+
+	def on_draw(self, event):
+		# keep the figure without the lines for blitting
+		self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+		self.draw_lines()
+		# layout done, frozen until next calib group or resize
+		self.canvas.figure.set_layout_engine('none')
+
+	def draw_lines(self):
+		for bars in self.errorbars.values():
+			self.canvas.axes.draw_artist(bars)
+		for line in self.lines.values():
+			self.canvas.axes.draw_artist(line)
+		for lines in self.fitlines.values():
+			for line in lines.values():
+				self.canvas.axes.draw_artist(line)
+
+
+class SpectrumPlotWindow(QWidget):
+	''' Last fitted spectrum, with the fit and the fitted line position '''
+	def __init__(self):
+		super().__init__()
+
+		self.setWindowTitle('myPRL-qt spectrum')
+
+		self.resize(500,400)
+
+		centerPoint = QDesktopWidget().availableGeometry().center()
+		thePosition = (centerPoint.x() - 700, centerPoint.y() - 400)
+		self.move(*thePosition)
+
+		self.canvas = MplCanvas(self, width=5, height=4, dpi=100)
+		self.toolbar = NavigationToolbar(self.canvas, self)		
+		layout = QVBoxLayout()
+
+		layout.addWidget(self.toolbar)
+		layout.addWidget(self.canvas)
+
+		self.setLayout(layout)
+
+	def updateplot(self, x, y, fit, calib, title):
+		ax = self.canvas.axes
+		ax.cla()
+		ax.set_xlabel('{} ({})'.format(calib.xname, calib.xunit))
+		ax.set_ylabel('Intensity')
+		ax.set_title(title, fontsize='small')
+
+		ax.plot(x, y, '.', color='grey', markersize=3, label='data')
+		xfit = np.linspace(*fit.window, 1000)
+		ax.plot(xfit, fit(xfit), color=calib.color, label='fit')
+		ax.axvline(fit.x, color='k', linestyle='--', linewidth=1,
+					label='{} = {:.3f}'.format(calib.xname, fit.x))
+		ax.set_xlim(fit.window[0] - 2, fit.window[1] + 2)
+		ax.legend(fontsize='small')
+		self.canvas.draw_idle()
+
+
+class IsobarWindow(QWidget):
+	''' x needed to reach each P of a list at T from Tmin to Tmax 
+	(isobars, from myPRLGrid.x_grid), over the map of P(x, T). Both tables
+	can be exported. The map shown has at most mapsize points per side, 
+	the exported one n x n, computed into a file. '''
+
+	mapsize = 1024
+
+	def __init__(self, calibrations_, calib=None):
+		super().__init__()
+
+		self.setWindowTitle('myPRL-qt isobars')
+		self.resize(600, 600)
+
+		self.calibrations = calibrations_
+
+		self.canvas = MplCanvas(self, width=5, height=4, dpi=100)
+		self.toolbar = NavigationToolbar(self.canvas, self)
+
+		self.calibration_combo = QComboBox()
+		self.calibration_combo.addItems( self.calibrations.keys() )
+		self.x0_spinbox = QDoubleSpinBox()
+		self.x0_spinbox.setDecimals(3)
+		self.x0_spinbox.setRange(-np.inf, np.inf)
+		self.T0_spinbox = QDoubleSpinBox()
+		self.T0_spinbox.setDecimals(0)
+		self.T0_spinbox.setRange(0, np.inf)
+		self.T0_spinbox.setValue(298)
+		self.Tmin_spinbox = QDoubleSpinBox()
+		self.Tmax_spinbox = QDoubleSpinBox()
+		for spinbox, value in [(self.Tmin_spinbox, 298), 
+							   (self.Tmax_spinbox, 1000)]:
+			spinbox.setDecimals(0)
+			spinbox.setRange(0, np.inf)
+			spinbox.setSingleStep(10)
+			spinbox.setValue(value)
+		self.n_spinbox = QSpinBox()
+		self.n_spinbox.setRange(2, 8192)
+		self.n_spinbox.setValue(500)
+		self.P_edit = QLineEdit('0, 10, 20, 30, 40, 50, 60, 80, 100')
+		self.map_checkbox = QCheckBox('P map')
+		self.map_checkbox.setChecked(True)
+
+		form = QFormLayout()
+		form.addRow('Calibration', self.calibration_combo)
+		x0T0_layout = QHBoxLayout()
+		x0T0_layout.addWidget(self.x0_spinbox)
+		x0T0_layout.addWidget(QLabel('T0 (K)'))
+		x0T0_layout.addWidget(self.T0_spinbox)
+		self.x0_label = QLabel('x0')
+		form.addRow(self.x0_label, x0T0_layout)
+		T_layout = QHBoxLayout()
+		T_layout.addWidget(self.Tmin_spinbox)
+		T_layout.addWidget(QLabel('to'))
+		T_layout.addWidget(self.Tmax_spinbox)
+		T_layout.addWidget(QLabel('points'))
+		T_layout.addWidget(self.n_spinbox)
+		form.addRow('T (K)', T_layout)
+		form.addRow('P (GPa)', self.P_edit)
+
+		actions_layout = QHBoxLayout()
+		self.export_isobars_button = QPushButton('Export isobars...')
+		self.export_map_button = QPushButton('Export P map...')
+		actions_layout.addWidget(self.map_checkbox)
+		actions_layout.addWidget(self.export_isobars_button)
+		actions_layout.addWidget(self.export_map_button)
+
+		layout = QVBoxLayout()
+		layout.addWidget(self.toolbar)
+		layout.addWidget(self.canvas)
+		layout.addLayout(form)
+		layout.addLayout(actions_layout)
+		self.setLayout(layout)
+
+		self.image = None
+		self.colorbar = None
+		self.isobars = None # T, P, x(P, T)
+		self.map = None # T, x of the exported P(x, T)
+
+		# recomputed once the inputs settle
+		self.update_timer = QTimer(self)
+		self.update_timer.setSingleShot(True)
+		self.update_timer.setInterval(100)
+		self.update_timer.timeout.connect(self.updateplot)
+
+		self.calibration_combo.currentIndexChanged.connect(self.updatecalib)
+		for spinbox in [self.x0_spinbox, self.T0_spinbox, self.Tmin_spinbox,
+						self.Tmax_spinbox, self.n_spinbox]:
+			spinbox.valueChanged.connect(self.update)
+		self.P_edit.textChanged.connect(self.update)
+		self.map_checkbox.toggled.connect(self.update)
+		self.export_isobars_button.clicked.connect(self.export_isobars)
+		self.export_map_button.clicked.connect(self.export_map)
+
+		if calib is not None:
+			self.calibration_combo.setCurrentText(calib.name)
+		self.updatecalib()
+
+	@property
+	def calib(self):
+		return self.calibrations[ self.calibration_combo.currentText() ]
+
+	def updatecalib(self, s=None):
+		calib = self.calib
+		self.x0_label.setText('{}0 ({})'.format(calib.xname, calib.xunit))
+		self.x0_spinbox.setSingleStep(calib.xstep)
+		self.x0_spinbox.setValue(calib.x0default)
+		self.update()
+
+	def update(self, s=None):
+		self.update_timer.start()
+
+	def levels(self):
+		# P list, None if it cannot be read
+		try:
+			P = np.array([float(v) for v in 
+						  self.P_edit.text().replace(';', ',').split(',') 
+						  if v.strip()])
+		except ValueError:
+			return None
+		return np.unique(P) if len(P) else None
+
+	def updateplot(self):
+		P = self.levels()
+		self.P_edit.setStyleSheet('' if P is not None 
+										else 'background: #ff7575;')
+		if P is None:
+			return
+		calib = self.calib
+		x0, T0 = self.x0_spinbox.value(), self.T0_spinbox.value()
+		n = self.n_spinbox.value()
+		T = np.linspace(self.Tmin_spinbox.value(), self.Tmax_spinbox.value(), n)
+
+		x = myPRLGrid.x_grid(calib, P, T, x0, T0)
+		self.isobars = (T, P, x)
+
+		ax = self.canvas.axes
+		ax.cla()
+		for j, Pj in enumerate(P):
+			ax.plot(T, x[:, j], color='k', linewidth=1)
+			# labelled at the last T where the isobar exists
+			ok = np.flatnonzero(np.isfinite(x[:, j]))
+			if len(ok):
+				ax.annotate('{:g} GPa'.format(Pj), (T[ok[-1]], x[ok[-1], j]),
+							fontsize='small', xytext=(2, 0), 
+							textcoords='offset points', va='center')
+
+		finite = x[np.isfinite(x)]
+		if self.map_checkbox.isChecked() and len(finite):
+			# P over the x range of the isobars
+			span = max(finite.max() - finite.min(), calib.xstep)
+			xrange = (finite.min() - 0.05 * span, finite.max() + 0.05 * span)
+			self.map = (T, np.linspace(*xrange, n))
+			# no more points than the screen can show
+			m = min(n, self.mapsize)
+			Tm = np.linspace(T[0], T[-1], m)
+			xm = np.linspace(*xrange, m)
+			Pmap = myPRLGrid.P_grid(calib, xm, Tm, x0, T0)
+			self.image = ax.imshow(Pmap.T, origin='lower', aspect='auto',
+								   extent=(T[0], T[-1], xm[0], xm[-1]),
+								   cmap='viridis', alpha=0.6)
+			if self.colorbar is None:
+				self.colorbar = self.canvas.figure.colorbar(self.image, ax=ax,
+															label='P (GPa)')
+			else:
+				self.colorbar.update_normal(self.image)
+			self.colorbar.ax.set_visible(True)
+		else:
+			self.map = None
+			if self.colorbar is not None:
+				self.colorbar.ax.set_visible(False)
+
+		ax.set_xlabel('T (K)')
+		ax.set_ylabel('{} ({})'.format(calib.xname, calib.xunit))
+		ax.set_title(calib.name, fontsize='small')
+		self.canvas.figure.set_layout_engine('constrained')
+		self.canvas.draw_idle()
+
+	def _filename(self, title):
+		fileName, _ = QFileDialog.getSaveFileName(self, 
+							'myPRL-qt: ' + title, '',
+							'Text table (*.txt *.csv);;NumPy archive (*.npz)')
+		return fileName
+
+	def export_isobars(self):
+		self.update_timer.stop()
+		self.updateplot()
+		if self.isobars is None:
+			return
+		fileName = self._filename('Export isobars')
+		if fileName:
+			myPRLGrid.export_table(fileName, *self.isobars, rowname='T',
+								   colname='P')
+
+	def export_map(self):
+		self.update_timer.stop()
+		self.updateplot()
+		if self.map is None:
+			return
+		fileName = self._filename('Export P map')
+		if not fileName:
+			return
+		T, xs = self.map
+		# n x n points: computed into a file rather than in memory
+		with tempfile.TemporaryDirectory() as folder:
+			Pmap = np.lib.format.open_memmap(os.path.join(folder, 'P.npy'),
+								mode='w+', shape=(len(T), len(xs)))
+			myPRLGrid.P_grid(self.calib, xs, T, self.x0_spinbox.value(),
+							 self.T0_spinbox.value(), out=Pmap)
+			myPRLGrid.export_table(fileName, T, xs, Pmap, rowname='T',
+								   colname=self.calib.xname)
+			del Pmap
@@ -0,0 +1,257 @@
+''' P(Pm) models of a HPDataTable: one polynomial per calibration and per
+branch, loading (Pm going up) and unloading (Pm going down), to follow
+the hysteresis of the membrane. Used to predict the Pm needed for the
+next target P.
+
+Fits are least squares on the sums A = sum(phi phi^T), b = sum(phi P) of
+the basis phi = (1, u, u^2, ...), u = Pm / scale: a new point is a
+rank-one update of A and b, and the coefficients are solved again (a
+(degree+1) square system) only when asked for. Points appended to the
+table are added this way; other changes (removal, edition, loading a
+file) rebuild the sums of the table at once.
+'''
+
+import numpy as np
+
+import myPRLModels
+import myPRLProfiling
+
+BRANCHES = ('loading', 'unloading')
+
+
+class PolyFit():
+	''' Least squares polynomial of degree P(Pm), updated point by point.
+	With less than degree+1 points, the degree is lowered. '''
+
+	def __init__(self, degree=2, scale=100.):
+		self.degree = degree
+		self.scale = scale # bar, keeps the sums well conditioned
+		self.clear()
+
+	def clear(self):
+		self.n = 0
+		self.A = np.zeros( (self.degree + 1, self.degree + 1) )
+		self.b = np.zeros(self.degree + 1)
+		self.Pmmin = np.inf
+		self.Pmmax = -np.inf
+		self._powers = np.arange(self.degree + 1)
+		self._coefs = None
+
+	def _basis(self, Pm):
+		# (n, degree+1) powers of u
+		return np.power.outer(np.asarray(Pm, dtype=float) / self.scale,
+							  np.arange(self.degree + 1))
+
+	def add(self, Pm, P):
+		''' adds points, scalars or arrays. Non finite ones are skipped. '''
+		Pm, P = np.broadcast_arrays(np.atleast_1d(Pm).astype(float),
+									np.atleast_1d(P).astype(float))
+		ok = np.isfinite(Pm) & np.isfinite(P)
+		if not ok.all():
+			Pm, P = Pm[ok], P[ok]
+		if len(Pm) == 0:
+			return
+		phi = self._basis(Pm)
+		self.A += phi.T @ phi
+		self.b += phi.T @ P
+		self.n += len(Pm)
+		self.Pmmin = min(self.Pmmin, Pm.min())
+		self.Pmmax = max(self.Pmmax, Pm.max())
+		self._coefs = None
+
+	def add1(self, Pm, P):
+		''' adds a single point, faster than add '''
+		if not (np.isfinite(Pm) and np.isfinite(P)):
+			return
+		phi = (Pm / self.scale) ** self._powers
+		self.A += np.multiply.outer(phi, phi)
+		self.b += P * phi
+		self.n += 1
+		self.Pmmin = min(self.Pmmin, Pm)
+		self.Pmmax = max(self.Pmmax, Pm)
+		self._coefs = None
+
+	@property
+	def coefs(self):
+		''' polynomial coefficients in u = Pm / scale, lowest degree
+		first (None without points) '''
+		if self._coefs is None and self.n > 0:
+			k = min(self.n, self.degree + 1)
+			coefs = np.zeros(self.degree + 1)
+			# lstsq: singular when the points share the same Pm
+			coefs[:k] = np.linalg.lstsq(self.A[:k, :k], self.b[:k],
+										rcond=None)[0]
+			self._coefs = coefs
+		return self._coefs
+
+	def predict(self, Pm):
+		''' P at Pm (NaN without points) '''
+		coefs = self.coefs
+		if coefs is None:
+			return np.full(np.shape(Pm), np.nan)[()]
+		return np.polynomial.polynomial.polyval(
+							np.asarray(Pm, dtype=float) / self.scale, coefs)
+
+	def inverse(self, P):
+		''' Pm giving P, searched from the end of the fitted Pm range
+		(NaN if not found) '''
+		if self.coefs is None:
+			return np.full(np.shape(P), np.nan)[()]
+		span = max(self.Pmmax - self.Pmmin, 1.)
+		return myPRLModels.bracketed_newton(self.predict, P, x0=self.Pmmax,
+								xstep=0.1 * span, xtol=1e-6 * span)
+
+
+class PmPModel():
+	''' loading and unloading PolyFit of one calibration group. A point
+	is on the loading branch when Pm went up since the previous point of
+	the group, unloading when it went down, on the same branch as the
+	previous point when Pm did not change. '''
+
+	def __init__(self, degree=2, scale=100.):
+		self.fits = {branch: PolyFit(degree, scale) for branch in BRANCHES}
+		self.lastPm = None
+		self.lastbranch = 'loading'
+
+	def branches(self, Pm):
+		''' branch of each point of Pm following the last point, as a
+		boolean array (True: unloading) '''
+		Pm = np.asarray(Pm, dtype=float)
+		previous = np.concatenate([[Pm[0] if self.lastPm is None
+											else self.lastPm], Pm[:-1]])
+		step = np.sign(Pm - previous)
+		# no move: branch of the previous point (forward fill)
+		idx = np.where(step != 0, np.arange(len(Pm)), -1)
+		np.maximum.accumulate(idx, out=idx)
+		start = -1. if self.lastbranch == 'unloading' else 1.
+		down = np.where(idx >= 0, step[np.maximum(idx, 0)], start) < 0
+		return down
+
+	def add(self, Pm, P):
+		Pm = np.atleast_1d(np.asarray(Pm, dtype=float))
+		P = np.atleast_1d(np.asarray(P, dtype=float))
+		if len(Pm) == 0:
+			return
+		down = self.branches(Pm)
+		self.fits['loading'].add(Pm[~down], P[~down])
+		self.fits['unloading'].add(Pm[down], P[down])
+		self.lastPm = Pm[-1]
+		self.lastbranch = 'unloading' if down[-1] else 'loading'
+
+	def add1(self, Pm, P):
+		if self.lastPm is not None and Pm != self.lastPm:
+			self.lastbranch = 'unloading' if Pm < self.lastPm else 'loading'
+		self.fits[self.lastbranch].add1(Pm, P)
+		self.lastPm = Pm
+
+	def predict(self, Pm, branch='loading'):
+		return self.fits[branch].predict(Pm)
+
+	def inverse(self, P, branch='loading'):
+		return self.fits[branch].inverse(P)
+
+
+class PmPModels():
+	''' PmPModel of each calibration group of table, kept up to date with
+	table.changed. models is a dict calib name: PmPModel. '''
+
+	def __init__(self, table, degree=2, scale=100.):
+		self.table = table
+		self.degree = degree
+		self.scale = scale
+		self.models = {}
+		self.n = 0 # rows of the table in the models
+		self.rebuild()
+		table.changed.connect(self.on_changed)
+
+	def __getitem__(self, name):
+		return self.models[name]
+
+	def get(self, name):
+		return self.models.get(name)
+
+	def _add_rows(self, first, last):
+		if first == last:
+			# table.add: one point
+			name = self.table.calibs[self.table.codes[first]].name
+			if name not in self.models:
+				self.models[name] = PmPModel(self.degree, self.scale)
+			self.models[name].add1(self.table.getitemval(first, 'Pm'),
+								   self.table.getitemval(first, 'P'))
+			self.n = last + 1
+			return
+		codes = self.table.codes[first:last + 1]
+		Pm = self.table.column('Pm')[first:last + 1]
+		P = self.table.column('P')[first:last + 1]
+		for code in np.unique(codes):
+			ind = np.flatnonzero(codes == code)
+			name = self.table.calibs[code].name
+			if name not in self.models:
+				self.models[name] = PmPModel(self.degree, self.scale)
+			self.models[name].add(Pm[ind], P[ind])
+		self.n = last + 1
+
+	@myPRLProfiling.timed('model.rebuild')
+	def rebuild(self):
+		self.models = {}
+		self.n = 0
+		if len(self.table):
+			self._add_rows(0, len(self.table) - 1)
+
+	@myPRLProfiling.timed('model.on_changed')
+	def on_changed(self, change):
+		if change.kind == 'insert' and change.first == self.n:
+			# appended: incremental update
+			self._add_rows(change.first, change.last)
+		elif change.kind == 'update' and \
+					not change.columns & {'Pm', 'P', 'calib'}:
+			return
+		else:
+			self.rebuild()
+
+	def disconnect(self):
+		self.table.changed.disconnect(self.on_changed)
+
+
+if __name__ == '__main__':
+
+	# incremental update cost, and hysteresis of a loading/unloading cycle
+	import time
+
+	calibrations = myPRLModels.default_calibrations()
+	calib = calibrations['Ruby2020']
+	table = myPRLModels.HPDataTable()
+	table.history = None
+	models = PmPModels(table)
+
+	rng = np.random.default_rng(0)
+	Pmup = np.linspace(0, 80, 5000)
+	Pmdown = Pmup[::-1]
+	Pm = np.concatenate([Pmup, Pmdown])
+	# unloading lags behind
+	P = np.concatenate([0.5 * Pmup + 2e-3 * Pmup**2,
+						0.5 * Pmdown + 4e-3 * Pmdown**2])
+	P += rng.normal(0, 0.05, len(P))
+	point = myPRLModels.HPData(Pm=0, P=0, x=0, T=298, x0=694.28, T0=298,
+							   calib=calib, file='No')
+
+	t = time.perf_counter()
+	for i in range(len(Pm)):
+		point.Pm, point.P = Pm[i], P[i]
+		table.add(point)
+	t = time.perf_counter() - t
+	print('{} adds: {:.1f} us per add'.format(len(Pm), t / len(Pm) * 1e6))
+
+	model = models[calib.name]
+	for branch in BRANCHES:
+		model.inverse(30., branch)
+		t = time.perf_counter()
+		Pm40 = model.inverse(30., branch)
+		t = time.perf_counter() - t
+		print('{:9s}: P(40 bar) = {:.3f} GPa, Pm(30 GPa) = {:.3f} bar '
+			  '({:.0f} us)'.format(branch, model.predict(40., branch), Pm40,
+								   t * 1e6))
+
+	t = time.perf_counter()
+	models.rebuild()
+	print('rebuild: {:.2f} ms'.format((time.perf_counter() - t) * 1e3))
@@ -0,0 +1,147 @@
+''' Timing of the hot paths of myPRL-qt, off by default:
+
+	@myPRLProfiling.timed('table.add')
+	def add(self, buffer): ...
+
+	with myPRLProfiling.section('io.csv_save'):
+		...
+
+While disabled, a timed function costs one test of the module flag more.
+Once enabled (enable(), the diagnostics window of myPRL-qt, or the
+--profile option), the duration of each call is kept, the last
+maxsamples ones per name, and report() gives counts and p50 / p99
+latencies. Times are inclusive: HPDataTable mutators include the
+changed-signal handlers they trigger.
+'''
+
+import json
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+enabled = False
+maxsamples = 10000 # kept per name, for the percentiles
+
+_lock = threading.Lock() # the compute worker records from its thread
+_counts = {} # name: number of calls since reset()
+_totals = {} # name: total time (s) since reset()
+_samples = {} # name: deque of the last call durations (s)
+
+
+def enable(on=True):
+	global enabled
+	enabled = bool(on)
+
+
+def reset():
+	with _lock:
+		_counts.clear()
+		_totals.clear()
+		_samples.clear()
+
+
+def record(name, dt):
+	with _lock:
+		if name not in _counts:
+			_counts[name] = 0
+			_totals[name] = 0.
+			_samples[name] = deque(maxlen=maxsamples)
+		_counts[name] += 1
+		_totals[name] += dt
+		_samples[name].append(dt)
+
+
+def timed(name):
+	''' decorator: records the duration of the calls under name '''
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not enabled:
+				return func(*args, **kwargs)
+			t = time.perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				record(name, time.perf_counter() - t)
+		return wrapper
+	return decorator
+
+
+@contextmanager
+def section(name):
+	''' with section(name): ... records the duration of the block '''
+	if not enabled:
+		yield
+		return
+	t = time.perf_counter()
+	try:
+		yield
+	finally:
+		record(name, time.perf_counter() - t)
+
+
+def report():
+	''' list of dicts (name, count, total, mean, p50, p99, max), times in
+	seconds, slowest total first. Percentiles are over the last
+	maxsamples calls. '''
+	with _lock:
+		stats = [(name, _counts[name], _totals[name], np.array(_samples[name]))
+														for name in _counts]
+	rows = []
+	for name, count, total, samples in stats:
+		p50, p99 = np.percentile(samples, [50, 99])
+		rows.append({'name': name, 'count': count, 'total': total,
+					 'mean': total / count, 'p50': p50, 'p99': p99,
+					 'max': samples.max()})
+	rows.sort(key=lambda row: row['total'], reverse=True)
+	return rows
+
+
+def format_report(rows=None):
+	rows = report() if rows is None else rows
+	lines = ['{:32s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+					'name', 'count', 'total (s)', 'p50 (ms)', 'p99 (ms)',
+					'max (ms)')]
+	for row in rows:
+		lines.append('{:32s} {:8d} {:10.3f} {:10.3f} {:10.3f} {:10.3f}'.format(
+					row['name'], row['count'], row['total'], 1e3 * row['p50'],
+					1e3 * row['p99'], 1e3 * row['max']))
+	return '\n'.join(lines)
+
+
+def export(path):
+	''' writes the report to path: JSON for .json files, text otherwise '''
+	rows = report()
+	with open(path, 'w') as f:
+		if path.lower().endswith('.json'):
+			json.dump({'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+					   'report': rows}, f, indent=1)
+		else:
+			f.write(format_report(rows) + '\n')
+
+
+if __name__ == '__main__':
+
+	# overhead of a timed function, disabled and enabled
+	@timed('noop')
+	def noop():
+		pass
+
+	def plain():
+		pass
+
+	n = 1000000
+	for label, func, on in [('plain', plain, False), ('disabled', noop, False),
+							('enabled', noop, True)]:
+		enable(on)
+		t = time.perf_counter()
+		for _ in range(n):
+			func()
+		t = time.perf_counter() - t
+		print('{:10s}: {:.3f} us per call'.format(label, t / n * 1e6))
+	enable(False)
+	print(format_report())
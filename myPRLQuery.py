@@ -0,0 +1,492 @@
+''' Sorting and filtering of a HPDataTable for the table view, on the
+values of the columns (not their rounded display).
+
+	P > 20 and calib == Ruby2020
+	(T >= 300 or sP > 0.5) and not file == "run 2.txt"
+
+Numerical columns compare with numbers (<, <=, >, >=, ==, !=), calib
+and file with names (== and != only, quotes for names with spaces).
+
+Sort permutations are cached per column (SortCache) and kept up to date:
+rows appended to the table are merged in, removed rows are dropped,
+without sorting again. The filter mask is computed for the new rows only.
+File names are sorted by integer codes (FileCodes): only the distinct
+names are compared as strings.
+'''
+
+import re
+import operator
+import itertools
+from collections import OrderedDict
+import numpy as np
+
+import myPRLModels
+import myPRLProfiling
+
+_token = re.compile(r'''\s*(?:
+	(?P<num>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?![\w.]))
+	|(?P<op><=|>=|==|!=|<|>|=)
+	|(?P<paren>[()])
+	|(?P<str>"[^"]*"|'[^']*')
+	|(?P<word>[^\s()<>=!"']+))''', re.VERBOSE)
+
+_ops = {'<': operator.lt, '<=': operator.le, '>': operator.gt,
+		'>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+
+
+class Filter():
+	''' row filter of an expression, see the module docstring. Raises
+	ValueError for invalid expressions. filter(table, first, last) is
+	the boolean mask of the rows first to last. '''
+
+	def __init__(self, text):
+		self.text = text
+		self.columns = set()
+		self.tokens = self._tokenize(text)
+		self.k = 0
+		self.tree = self._or()
+		if self.k < len(self.tokens):
+			raise ValueError('Unexpected {!r}'.format(self.tokens[self.k][1]))
+
+	def _tokenize(self, text):
+		tokens = []
+		pos = 0
+		text = text.rstrip()
+		while pos < len(text):
+			m = _token.match(text, pos)
+			if m is None or m.end() == pos:
+				raise ValueError('Cannot read {!r}'.format(text[pos:].strip()))
+			kind = m.lastgroup
+			value = m.group(kind)
+			if kind == 'word' and value.lower() in ('and', 'or', 'not'):
+				kind, value = 'keyword', value.lower()
+			elif kind == 'str':
+				value = value[1:-1]
+			elif kind == 'op' and value == '=':
+				value = '=='
+			tokens.append( (kind, value) )
+			pos = m.end()
+		return tokens
+
+	def _peek(self):
+		return self.tokens[self.k] if self.k < len(self.tokens) else (None, None)
+
+	def _next(self, what):
+		kind, value = self._peek()
+		if kind is None:
+			raise ValueError('Incomplete expression, {} expected'.format(what))
+		self.k += 1
+		return kind, value
+
+	def _or(self):
+		node = self._and()
+		while self._peek() == ('keyword', 'or'):
+			self.k += 1
+			node = ('or', node, self._and())
+		return node
+
+	def _and(self):
+		node = self._not()
+		while self._peek() == ('keyword', 'and'):
+			self.k += 1
+			node = ('and', node, self._not())
+		return node
+
+	def _not(self):
+		if self._peek() == ('keyword', 'not'):
+			self.k += 1
+			return ('not', self._not())
+		if self._peek() == ('paren', '('):
+			self.k += 1
+			node = self._or()
+			if self._next(')') != ('paren', ')'):
+				raise ValueError('Missing )')
+			return node
+		return self._compare()
+
+	def _compare(self):
+		kind, column = self._next('column')
+		if kind != 'word' or column not in myPRLModels.HPDataTable.columns:
+			raise ValueError('Unknown column {!r}'.format(column))
+		kind, op = self._next('comparison')
+		if kind != 'op':
+			raise ValueError('Comparison expected after {}'.format(column))
+		kind, value = self._next('value')
+		if kind not in ('num', 'word', 'str'):
+			raise ValueError('Value expected after {} {}'.format(column, op))
+		if column in myPRLModels.HPDataTable.numcols:
+			try:
+				value = float(value)
+			except ValueError:
+				raise ValueError('{} is compared with numbers'.format(column))
+		elif op not in ('==', '!='):
+			raise ValueError('{} is compared with == or != only'.format(column))
+		self.columns.add(column)
+		return ('cmp', column, op, value)
+
+	def _eval(self, node, table, sl):
+		if node[0] == 'and':
+			return self._eval(node[1], table, sl) & self._eval(node[2], table, sl)
+		if node[0] == 'or':
+			return self._eval(node[1], table, sl) | self._eval(node[2], table, sl)
+		if node[0] == 'not':
+			return ~self._eval(node[1], table, sl)
+		_, column, op, value = node
+		if column == 'calib':
+			codes = [k for k, calib in enumerate(table.calibs)
+											if calib.name == value]
+			mask = np.isin(table.codes[sl], codes)
+			return mask if op == '==' else ~mask
+		if column == 'file':
+			values = table.files[sl]
+		else:
+			values = table.column(column)[sl]
+		return np.asarray(_ops[op](values, value), dtype=bool)
+
+	@myPRLProfiling.timed('query.filter')
+	def __call__(self, table, first=0, last=None):
+		sl = slice(first, len(table) if last is None else last + 1)
+		with np.errstate(invalid='ignore'):
+			return self._eval(self.tree, table, sl)
+
+
+def merge(rows, keys, newrows, newkeys):
+	''' rows and sorted keys with newrows of sorted newkeys inserted,
+	after the equal keys as a stable sort would '''
+	pos = np.searchsorted(keys, newkeys, side='right')
+	return np.insert(rows, pos, newrows), np.insert(keys, pos, newkeys)
+
+
+class FileCodes():
+	''' code of the file name of each row of table, codes numbering the
+	distinct names. Kept in step with the appended and removed rows by
+	SortCache, made again after other changes. '''
+
+	def __init__(self, table):
+		# one sort of the rows by name, a timsort (fast on the runs of
+		# sorted names of acquisitions): the codes are the ranks of the
+		# names at first. order and sorted (the names in order) are the
+		# sort by file, the codes are numbered from them when first used.
+		files = table.files
+		self.order = np.argsort(files, kind='stable')
+		self.sorted = files[self.order]
+		self.first = np.ones(len(files), dtype=bool)
+		self.first[1:] = self.sorted[1:] != self.sorted[:-1]
+		self.names = None
+		self.buf = None
+		self.n = len(files)
+		self.rank = None # of each code, in the names
+		self.index = None # name: code, made by the first append
+
+	@property
+	def codes(self):
+		if self.buf is None:
+			self.names = self.sorted[self.first].tolist()
+			self.buf = np.empty(self.n, dtype=np.int64)
+			self.buf[self.order] = np.cumsum(self.first) - 1
+			self.rank = np.arange(len(self.names))
+			self.order = self.sorted = self.first = None
+		return self.buf[:self.n]
+
+	def append(self, names):
+		codes = self.codes
+		if self.index is None:
+			self.index = dict(zip(self.names, itertools.count()))
+		for name in names:
+			if name not in self.index:
+				self.index[name] = len(self.names)
+				self.names.append(name)
+				self.rank = None
+		new = np.fromiter(map(self.index.__getitem__, names), 
+						  dtype=np.int64, count=len(names))
+		# grows by doubling, as appends come one row at a time
+		if self.n + len(new) > len(self.buf):
+			buf = np.empty(max(self.n + len(new), 2 * len(self.buf)),
+						   dtype=np.int64)
+			buf[:self.n] = codes
+			self.buf = buf
+		self.buf[self.n:self.n + len(new)] = new
+		self.n += len(new)
+
+	def remove(self, first, last):
+		# (names of no row left keep their codes)
+		self.buf = np.delete(self.codes, np.s_[first:last + 1])
+		self.n = len(self.buf)
+
+	def keys(self):
+		''' integer sort keys of the rows: ranks of their names '''
+		codes = self.codes
+		if self.rank is None:
+			order = sorted(range(len(self.names)), key=self.names.__getitem__)
+			self.rank = np.empty(len(order), dtype=np.int64)
+			self.rank[order] = np.arange(len(order))
+		return self.rank[codes]
+
+
+class SortCache():
+	''' argsort permutations of the columns of table, made on first use.
+	update(change) keeps them in step with the table: appended rows are
+	merged in (searchsorted in the sorted keys), removed rows dropped,
+	other changes of a column drop its permutation. The maxperms columns
+	sorted last are kept: each one costs a merge at each append. '''
+
+	maxperms = 3
+
+	def __init__(self, table):
+		self.table = table
+		self.perms = OrderedDict() # column: (permutation, sorted keys)
+		self.ncalibs = 0 # calibrations known to the 'calib' keys
+		self.files = None # FileCodes, made by the first sort by file
+
+	def key(self, column, first=0, last=None):
+		''' sort keys of the rows first to last: values, rank of the
+		calibration name, or file name (strings, as objects) '''
+		sl = slice(first, len(self.table) if last is None else last + 1)
+		if column in self.table.numcols:
+			return self.table.column(column)[sl]
+		if column == 'calib':
+			names = [calib.name for calib in self.table.calibs]
+			rank = np.empty(len(names), dtype=np.int16)
+			rank[np.argsort(names)] = np.arange(len(names))
+			return rank[self.table.codes[sl]]
+		return self.table.files[sl]
+
+	@myPRLProfiling.timed('query.sort')
+	def perm(self, column):
+		''' rows of the table sorted by column, and their sorted keys '''
+		if column not in self.perms:
+			key = self.key(column)
+			if column == 'file' and self.files is None:
+				# the sort numbering the names is the permutation
+				self.files = FileCodes(self.table)
+				perm, key = self.files.order, self.files.sorted
+			elif column == 'file':
+				# the object keys are kept for merges
+				perm = np.argsort(self.files.keys(), kind='stable')
+				key = key[perm]
+			else:
+				perm = np.argsort(key, kind='stable' if column == 'calib'
+															else 'quicksort')
+				key = key[perm]
+			self.perms[column] = (perm, key)
+			if column == 'calib':
+				self.ncalibs = len(self.table.calibs)
+			while len(self.perms) > self.maxperms:
+				self.perms.popitem(last=False)
+		self.perms.move_to_end(column)
+		return self.perms[column]
+
+	@myPRLProfiling.timed('query.sort_update')
+	def update(self, change):
+		appended = change.kind == 'insert' and \
+							change.last == len(self.table) - 1
+		if self.files is not None:
+			if appended:
+				self.files.append(self.table.files[change.first:
+												   change.last + 1].tolist())
+			elif change.kind == 'remove':
+				self.files.remove(change.first, change.last)
+			elif change.kind != 'update' or 'file' in change.columns:
+				self.files = None
+		if not self.perms:
+			return
+		if appended:
+			if len(self.table.calibs) != self.ncalibs:
+				# new calibration: the ranks of the names changed
+				self.perms.pop('calib', None)
+			for column, (perm, keys) in list(self.perms.items()):
+				new = self.key(column, change.first, change.last)
+				order = np.argsort(new, kind='stable')
+				new = new[order]
+				self.perms[column] = merge(perm, keys, order + change.first,
+										   new)
+		elif change.kind == 'remove':
+			for column, (perm, keys) in list(self.perms.items()):
+				keep = (perm < change.first) | (perm > change.last)
+				perm = perm[keep]
+				perm[perm > change.last] -= change.nrows
+				self.perms[column] = (perm, keys[keep])
+		elif change.kind == 'update':
+			for column in change.columns:
+				self.perms.pop(column, None)
+		else:
+			self.perms.clear()
+
+
+class RowView():
+	''' rows of table shown by a view: the rows passing filter (a Filter,
+	or None), sorted by column (None: table order). rows maps the view
+	rows to table rows, None when all rows are shown in table order.
+	Appended rows are merged into the view, other changes of the rows
+	(or of the values they are sorted or filtered on) make it again from
+	the cached permutation and mask. '''
+
+	def __init__(self, table):
+		self.table = table
+		self.sorts = SortCache(table)
+		self.filter = None
+		self.mask = None # filter of the table rows
+		self.column = None
+		self.descending = False
+		self.ascending = None # rows in ascending order (or table order)
+		self.keys = None # their sort keys
+
+	def __len__(self):
+		return len(self.table) if self.ascending is None else len(self.ascending)
+
+	@property
+	def active(self):
+		return self.filter is not None or self.column is not None
+
+	@property
+	def rows(self):
+		if self.descending and self.column is not None:
+			return self.ascending[::-1]
+		return self.ascending
+
+	def tablerow(self, row):
+		return row if self.ascending is None else int(self.rows[row])
+
+	def viewrows(self, first, last):
+		''' sorted view rows of the table rows first to last '''
+		if self.ascending is None:
+			return np.arange(first, last + 1)
+		rows = self.rows
+		return np.flatnonzero( (rows >= first) & (rows <= last) )
+
+	def set_filter(self, text):
+		''' text of a Filter, empty for none. Raises ValueError, the view
+		unchanged, if the expression is invalid. '''
+		self.filter = Filter(text) if text.strip() else None
+		self.mask = None if self.filter is None else self.filter(self.table)
+		self._rows()
+
+	def set_sort(self, column, descending=False):
+		self.column = column
+		self.descending = descending
+		self._rows()
+
+	def _rows(self):
+		if self.column is None:
+			self.ascending = None if self.mask is None else \
+												np.flatnonzero(self.mask)
+			self.keys = None
+			return
+		rows, keys = self.sorts.perm(self.column)
+		if self.mask is not None:
+			keep = self.mask[rows]
+			rows, keys = rows[keep], keys[keep]
+		self.ascending, self.keys = rows, keys
+
+	def _append(self, first, last, newmask):
+		new = np.arange(first, last + 1)
+		if newmask is not None:
+			new = new[newmask]
+		if self.column is None:
+			if self.ascending is not None:
+				self.ascending = np.concatenate([self.ascending, new])
+			return
+		keys = self.sorts.key(self.column, first, last)[new - first]
+		order = np.argsort(keys, kind='stable')
+		self.ascending, self.keys = merge(self.ascending, self.keys,
+										  new[order], keys[order])
+
+	def update(self, change):
+		''' follows a change of the table. Returns True when the rows of the
+		view changed, False when only values of rows in place did. '''
+		self.sorts.update(change)
+		appended = change.kind == 'insert' and \
+							change.last == len(self.table) - 1
+		newmask = None
+		if self.mask is not None:
+			if appended:
+				newmask = self.filter(self.table, change.first, change.last)
+				self.mask = np.concatenate([self.mask, newmask])
+			elif change.kind == 'remove':
+				self.mask = np.delete(self.mask,
+									  np.s_[change.first:change.last + 1])
+			elif change.kind == 'update':
+				if change.columns & self.filter.columns and change.nrows > 0:
+					self.mask[change.first:change.last + 1] = self.filter(
+									self.table, change.first, change.last)
+			else:
+				self.mask = self.filter(self.table)
+		if change.kind == 'update':
+			moved = self.filter is not None and \
+						change.columns & self.filter.columns or \
+						self.column in change.columns
+			if not moved:
+				return False
+		if not self.active:
+			return True
+		if appended and (self.column != 'calib' or 'calib' in self.sorts.perms):
+			# (new calibrations change the calib keys)
+			self._append(change.first, change.last, newmask)
+		else:
+			self._rows()
+		return True
+
+
+if __name__ == '__main__':
+
+	# sort and filter times on 1M rows, and an append with both active
+	import time
+
+	calibrations = myPRLModels.default_calibrations()
+	n = 1000000
+	rng = np.random.default_rng(0)
+	table = myPRLModels.HPDataTable()
+	table.history = None
+	for name in ['Ruby2020', 'Samarium Borate Datchi 1997']:
+		calib = calibrations[name]
+		m = n // 2
+		x = calib.x0default * (1 + rng.uniform(0, 0.05, m))
+		table.extend(Pm=rng.uniform(0, 100, m),
+					 P=calib.func(x, 300, calib.x0default, 298), x=x, T=300,
+					 x0=calib.x0default, T0=298, calib=calib,
+					 files=['spectrum_{:07d}.txt'.format(i) for i in range(m)])
+
+	view = RowView(table)
+	for column in ['P', 'calib', 'file']:
+		t = time.perf_counter()
+		view.set_sort(column)
+		t1 = time.perf_counter() - t
+		t = time.perf_counter()
+		view.set_sort(column, descending=True)
+		t2 = time.perf_counter() - t
+		print('sort by {:5s}: {:7.1f} ms, cached: {:.1f} ms'.format(column,
+													t1 * 1e3, t2 * 1e3))
+	view.set_sort('P')
+	t = time.perf_counter()
+	view.set_filter('P > 20 and calib == Ruby2020')
+	print('filter: {:.1f} ms, {} rows'.format((time.perf_counter() - t) * 1e3,
+															len(view)))
+
+	point = myPRLModels.HPData(Pm=1, P=0, x=695., T=300, x0=694.28, T0=298,
+							   calib=calibrations['Ruby2020'], file='No')
+	point.calcP()
+	t = time.perf_counter()
+	for _ in range(100):
+		table.add(point)
+		view.update(myPRLModels.HPDataChange('insert', len(table) - 1,
+											 len(table) - 1))
+	print('add with sort and filter: {:.1f} ms'.format(
+										(time.perf_counter() - t) * 10))
+	P = table.column('P')
+	ok = np.array_equal(P[view.rows], np.sort(P[view.mask])) and \
+		 np.array_equal(view.rows, view.sorts.perm('P')[0][view.mask[
+											view.sorts.perm('P')[0]]])
+	print('view sorted and filtered:', ok)
+
+	# empty file cells of a loaded file, sorted with the names
+	import pandas as pd
+	df = pd.DataFrame({'Pm': [1., 2., 3.], 'P': [1., 2., 3.],
+					   'calib': ['Ruby2020'] * 3, 'file': [np.nan, 'c', 'a']})
+	table = myPRLModels.HPDataTable()
+	table.reconstruct_from_df(df, calibrations)
+	view = RowView(table)
+	view.set_sort('file')
+	table.add(point)
+	view.update(myPRLModels.HPDataChange('insert', 3, 3))
+	print('empty file names sorted:',
+		  [table.files[row] for row in view.rows] == ['', 'No', 'a', 'c'])
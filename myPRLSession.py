@@ -0,0 +1,177 @@
+''' myPRL sessions: a HPDataTable saved as a NumPy .npz archive (no pickle)
+
+	Pm, P, x, ...   one float64 array per numerical column
+	codes           int16 calibration code of each point
+	files           file names of the points, utf-8, newline separated
+	fileoffsets     int64 offset of each name in files, and the end + 1:
+	                names can have newlines too (new in version 2)
+	calibs          JSON list of the calibrations used by the codes,
+	                with their parameters
+	meta            JSON dict: format version, uncertainty method
+
+Columns are stored as they are in memory, so that loading is a few
+array copies whatever the number of points. Text CSV stays available
+through HPDataTable.df for export.
+'''
+
+import os
+import json
+import numpy as np
+
+import myPRLCalibfuncs
+import myPRLModels
+import myPRLProfiling
+
+VERSION = 2
+EXTENSION = '.myprl'
+
+# HPCalibration attributes saved in sessions, functions by their names
+_calibattrs = ['name', 'Tcor_name', 'xname', 'xunit', 'x0default', 'xstep',
+			   'color', 'fitmodel']
+_calibfuncs = ['func', 'inverse', 'grad']
+
+
+def calib_to_dict(calib):
+	d = {k: getattr(calib, k) for k in _calibattrs}
+	for k in _calibfuncs:
+		f = getattr(calib, k)
+		d[k] = None if f is None else f.__name__
+	return d
+
+
+def calib_from_dict(d):
+	''' HPCalibration from its saved parameters, functions being looked
+	up in myPRLCalibfuncs '''
+	funcs = {}
+	for k in _calibfuncs:
+		if d.get(k) is None:
+			funcs[k] = None
+		elif hasattr(myPRLCalibfuncs, d[k]):
+			funcs[k] = getattr(myPRLCalibfuncs, d[k])
+		else:
+			raise ValueError('Unknown calibration function {} of {}'.format(
+															d[k], d['name']))
+	return myPRLModels.HPCalibration(**{k: d[k] for k in _calibattrs}, **funcs)
+
+
+@myPRLProfiling.timed('io.session_save')
+def save_session(table, path):
+	''' writes table to path, atomically (a failed save does not erase
+	a previous session), and durably: on disk when it returns, also in
+	case of power loss '''
+	arrays = {key: table.column(key) for key in table.numcols}
+	arrays['codes'] = table.codes
+	# one byte string instead of a (n x longest name) unicode array
+	names = [str(f) for f in table.files]
+	data = '\n'.join(names).encode('utf-8')
+	if len(data) != sum(map(len, names)) + len(names) - 1:
+		# not ascii: lengths in bytes
+		names = [name.encode('utf-8') for name in names]
+	offsets = np.zeros(len(names) + 1, dtype=np.int64)
+	np.cumsum(np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+			  + 1, out=offsets[1:])
+	arrays['files'] = np.frombuffer(data, dtype=np.uint8)
+	arrays['fileoffsets'] = offsets
+	arrays['calibs'] = np.array( json.dumps([calib_to_dict(c)
+												for c in table.calibs]) )
+	arrays['meta'] = np.array( json.dumps({'version': VERSION,
+										   'uncertainty': table.uncertainty,
+										   'ndraws': table.ndraws}) )
+
+	tmp = path + '.tmp'
+	with open(tmp, 'wb') as f:
+		np.savez(f, **arrays)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp, path)
+	fsync_folder(os.path.dirname(os.path.abspath(path)))
+
+
+def fsync_folder(folder):
+	''' makes the files created, renamed or removed in folder durable '''
+	if os.name == 'nt':
+		# no fsync of folders on Windows, NTFS journals their entries
+		return
+	fd = os.open(folder, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+def is_session(path):
+	''' True if path is a session, whatever its extension: sessions are
+	zip archives (.npz) '''
+	with open(path, 'rb') as f:
+		return f.read(4) == b'PK\x03\x04'
+
+
+@myPRLProfiling.timed('io.session_load')
+def load_session(path, table, calibrations=None):
+	''' replaces the content of table with the session at path. Saved
+	calibrations are matched by name with calibrations, and rebuilt from
+	their saved parameters when not found. '''
+	calibrations = calibrations or {}
+	with np.load(path, allow_pickle=False) as f:
+		meta = json.loads( str(f['meta']) )
+		if meta['version'] > VERSION:
+			raise ValueError('{} was saved by a newer myPRL (version {})'
+											.format(path, meta['version']))
+		calibs = [calibrations.get(d['name']) or calib_from_dict(d)
+								for d in json.loads( str(f['calibs']) )]
+		columns = {key: f[key] for key in table.numcols if key in f.files}
+		codes = f['codes']
+		data = f['files'].tobytes()
+		files = data.decode('utf-8').split('\n') if len(codes) else []
+		if len(files) != len(codes):
+			# newlines in the names
+			if 'fileoffsets' not in f.files:
+				raise ValueError('{}: file names of the points do not match '
+								 'the points'.format(path))
+			offsets = f['fileoffsets'].tolist()
+			files = [data[a:b - 1].decode('utf-8')
+								for a, b in zip(offsets[:-1], offsets[1:])]
+
+	table.uncertainty = meta.get('uncertainty', 'linear')
+	table.ndraws = meta.get('ndraws', table.ndraws)
+	table.reconstruct(columns, codes, calibs, files)
+	return table
+
+
+if __name__ == '__main__':
+
+	# session vs. CSV, save and load times
+	import sys
+	import time
+	import tempfile
+	import pandas as pd
+
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+	calibrations = myPRLModels.default_calibrations()
+	calib = calibrations['Ruby2020']
+
+	table = myPRLModels.HPDataTable()
+	x = np.linspace(694.3, 720, n)
+	table.extend(Pm=np.arange(n) * 0.01, P=calib.func(x, 298, 694.28, 298),
+				 x=x, T=298, x0=694.28, T0=298, calib=calib,
+				 files=['spectrum_{:07d}.txt'.format(i) for i in range(n)],
+				 sx=0.02)
+
+	with tempfile.TemporaryDirectory() as folder:
+		for name, save, load in [
+			('session', lambda p: save_session(table, p),
+						lambda p: load_session(p, myPRLModels.HPDataTable(),
+														calibrations)),
+			('csv', lambda p: table.df.to_csv(p, sep='\t', index=False),
+					lambda p: myPRLModels.HPDataTable(pd.read_csv(p, sep='\t'),
+														calibrations))]:
+			path = os.path.join(folder, 'data.' + name)
+			t = time.perf_counter()
+			save(path)
+			t1 = time.perf_counter() - t
+			t = time.perf_counter()
+			loaded = load(path)
+			t2 = time.perf_counter() - t
+			assert loaded.df.equals(table.df) or name == 'csv'
+			print('{:8s}: save {:6.3f} s, load {:6.3f} s, {:6.1f} MB'.format(
+					name, t1, t2, os.path.getsize(path) / 1e6))
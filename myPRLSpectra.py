@@ -0,0 +1,223 @@
+import numpy as np
+
+# Fluorescence spectra fitting: ruby R1/R2 doublet and Sm:SrB4O7 0-0 line.
+# Peaks are pseudo-Voigt functions on a linear background, fitted by
+# Levenberg-Marquardt with analytic Jacobians, on a window around the line.
+
+LN2 = np.log(2)
+
+
+def load_spectrum(file):
+	''' x, y columns of a spectrometer text file, sorted by x.
+	Header lines and extra columns are ignored. '''
+	try:
+		data = np.loadtxt(file, comments='#', usecols=(0, 1), ndmin=2)
+	except ValueError:
+		# header, or ',' / ';' separated
+		import pandas as pd
+		df = pd.read_csv(file, sep=None, engine='python', header=None,
+						 comment='#', usecols=[0, 1])
+		df = df.apply(pd.to_numeric, errors='coerce').dropna()
+		data = df.to_numpy(dtype=float)
+
+	x, y = data[:, 0], data[:, 1]
+	if len(x) > 1 and x[0] > x[-1]:
+		x, y = x[::-1], y[::-1]
+	return np.ascontiguousarray(x), np.ascontiguousarray(y)
+
+
+def pseudovoigt(x, A, xc, w, eta, jac=False):
+	''' A (eta L + (1 - eta) G), L and G of half width at half maximum w.
+	With jac, also returns the derivatives wrt (A, xc, w, eta). '''
+	u = (x - xc) / w
+	u2 = u * u
+	L = 1 / (1 + u2)
+	G = np.exp(-LN2 * u2)
+	shape = eta * L + (1 - eta) * G
+	f = A * shape
+	if not jac:
+		return f
+
+	# d shape / du
+	dsdu = -2 * u * (eta * L * L + (1 - eta) * LN2 * G)
+	J = np.empty( (len(x), 4) )
+	J[:, 0] = shape
+	J[:, 1] = - A * dsdu / w
+	J[:, 2] = - A * dsdu * u / w
+	J[:, 3] = A * (L - G)
+	return f, J
+
+
+class PeaksModel():
+	''' npeaks pseudo-Voigt peaks + linear background, parameters:
+	[A, xc, w, eta] * npeaks + [c0, c1], the background being
+	c0 + c1 (x - xref) '''
+
+	def __init__(self, npeaks, xref):
+		self.npeaks = npeaks
+		self.xref = xref
+		self.nparams = 4 * npeaks + 2
+
+	def __call__(self, x, p, jac=False):
+		f = p[-2] + p[-1] * (x - self.xref)
+		if jac:
+			J = np.empty( (len(x), self.nparams) )
+			J[:, -2] = 1
+			J[:, -1] = x - self.xref
+		for i in range(self.npeaks):
+			res = pseudovoigt(x, *p[4*i:4*i+4], jac=jac)
+			if jac:
+				f = f + res[0]
+				J[:, 4*i:4*i+4] = res[1]
+			else:
+				f = f + res
+		return (f, J) if jac else f
+
+	def clip(self, p):
+		# A >= 0, w > 0, 0 <= eta <= 1
+		p = p.copy()
+		for i in range(self.npeaks):
+			p[4*i] = max(p[4*i], 0)
+			p[4*i+2] = max(p[4*i+2], 1e-4)
+			p[4*i+3] = min(max(p[4*i+3], 0), 1)
+		return p
+
+
+def levenberg_marquardt(model, p0, x, y, maxiter=100, tol=1e-10):
+	''' least squares fit of model(x, p) to y, returns (p, chi2, niter) '''
+	p = model.clip( np.asarray(p0, dtype=float) )
+	f, J = model(x, p, jac=True)
+	r = y - f
+	chi2 = r @ r
+	lam = 1e-3
+
+	for it in range(1, maxiter + 1):
+		JTJ = J.T @ J
+		g = J.T @ r
+		d = np.diag(JTJ) + 1e-12
+		while True:
+			try:
+				dp = np.linalg.solve(JTJ + lam * np.diag(d), g)
+			except np.linalg.LinAlgError:
+				dp = None
+			if dp is not None:
+				pn = model.clip(p + dp)
+				rn = y - model(x, pn)
+				chi2n = rn @ rn
+				if chi2n <= chi2:
+					break
+			lam *= 10
+			if lam > 1e12:
+				return p, chi2, it
+		lam = max(lam / 10, 1e-12)
+
+		converged = chi2 - chi2n <= tol * chi2
+		p, chi2 = pn, chi2n
+		if converged:
+			break
+		f, J = model(x, p, jac=True)
+		r = y - f
+
+	return p, chi2, it
+
+
+class SpectrumFit():
+	''' Result of a peak fit: x is the position of the line used by the
+	calibration (R1 for ruby), params the full model parameters. '''
+	def __init__(self, x, model, params, chi2, niter, window):
+		self.x = x
+		self.model = model
+		self.params = params
+		self.chi2 = chi2
+		self.niter = niter
+		self.window = window # (xmin, xmax) of the fitted data
+
+	def __repr__(self):
+		return 'SpectrumFit : ' + str( self.__dict__ )
+
+	def __call__(self, x):
+		return self.model(x, self.params)
+
+
+def _halfwidth(x, y, i, base):
+	# half width at half maximum around y[i], from the data
+	half = base + (y[i] - base) / 2
+	lo = i
+	while lo > 0 and y[lo] > half:
+		lo -= 1
+	hi = i
+	while hi < len(y) - 1 and y[hi] > half:
+		hi += 1
+	return max( (x[hi] - x[lo]) / 2, 2 * np.median(np.diff(x)) )
+
+
+def _fit_window(x, y, npeaks, below, above, guess):
+	# data around the highest point, first guess of the peaks, fit
+	ok = np.isfinite(x) & np.isfinite(y)
+	if ok.sum() < 4 * npeaks + 2:
+		raise ValueError('Not enough data points to fit')
+	x, y = x[ok], y[ok]
+	i = np.argmax(y)
+	sel = (x >= x[i] - below) & (x <= x[i] + above)
+	xs, ys = x[sel], y[sel]
+	i = np.argmax(ys)
+	base = np.percentile(ys, 10)
+	w = _halfwidth(xs, ys, i, base)
+
+	model = PeaksModel(npeaks, xref=xs[i])
+	p0 = guess(xs, ys, i, base, w)
+	p, chi2, niter = levenberg_marquardt(model, p0, xs, ys)
+	return model, p, chi2, niter, (xs[0], xs[-1])
+
+
+def fit_ruby(x, y):
+	''' R1/R2 doublet, R2 being ~1.4 nm below R1 '''
+	def guess(xs, ys, i, base, w):
+		j = np.argmin( np.abs(xs - (xs[i] - 1.4)) )
+		return [ys[i] - base, xs[i], w, 0.5,
+				max(ys[j] - base, 0), xs[i] - 1.4, w, 0.5,
+				base, 0]
+
+	model, p, chi2, niter, window = _fit_window(x, y, 2, 4., 3., guess)
+	# R1 is the line at the highest wavelength
+	R1 = p[1] if p[1] > p[5] else p[5]
+	return SpectrumFit(R1, model, p, chi2, niter, window)
+
+
+def fit_samarium(x, y):
+	''' 0-0 line of Sm:SrB4O7, a single peak '''
+	def guess(xs, ys, i, base, w):
+		return [ys[i] - base, xs[i], w, 0.5, base, 0]
+
+	model, p, chi2, niter, window = _fit_window(x, y, 1, 1.5, 1.5, guess)
+	return SpectrumFit(p[1], model, p, chi2, niter, window)
+
+
+# HPCalibration.fitmodel: fit function
+FITTERS = {'ruby': fit_ruby,
+		   'samarium': fit_samarium}
+
+
+def fit_spectrum(calib, x, y):
+	''' fits the line used by calib, returns a SpectrumFit '''
+	if calib.fitmodel not in FITTERS:
+		raise ValueError('No spectrum fit for {}'.format(calib.name))
+	return FITTERS[calib.fitmodel](x, y)
+
+
+if __name__ == '__main__':
+
+	# synthetic ruby spectrum at ~10 GPa, timing of the fit
+	from timeit import repeat
+
+	rng = np.random.default_rng(0)
+	x = np.linspace(680, 710, 2048)
+	truth = [1000, 697.9, 0.25, 0.4, 500, 696.5, 0.25, 0.4, 50, 0.5]
+	model = PeaksModel(2, 697.9)
+	y = model(x, np.array(truth)) + rng.normal(0, 10, len(x))
+
+	fit = fit_ruby(x, y)
+	print('R1 = {:.4f} nm (true {}), {} iterations'.format(fit.x, truth[1],
+																fit.niter))
+	t = min(repeat(lambda: fit_ruby(x, y), number=100, repeat=5)) / 100
+	print('{:.3f} ms per spectrum'.format(t * 1e3))
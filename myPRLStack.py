@@ -0,0 +1,135 @@
+''' Spectrum stacks: all the spectra of an acquisition in one directory,
+
+	name.prlstack/
+		x.npy       common x axis (npix,)
+		y.npy       intensities (nspectra, npix) float32, memory-mapped
+		index.tsv   timestamp, Pm and file name of each spectrum
+
+so that a ramp of thousands of spectra is read lazily, without parsing
+text files. Converting a folder of text spectra:
+
+	python myPRLStack.py folder/ ramp.prlstack --pattern '*.txt'
+'''
+
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+import myPRLSpectra
+
+
+class SpectrumStack():
+	''' A spectrum stack opened read-only: stack[i] is (x, y) of spectrum i,
+	y being a view on the memory-mapped file (nothing is read before use) '''
+
+	indexcols = ['timestamp', 'Pm', 'file']
+
+	def __init__(self, path):
+		self.path = path
+		self.name = os.path.splitext( os.path.basename(os.path.normpath(path)) )[0]
+		self.x = np.load( os.path.join(path, 'x.npy') )
+		self.y = np.load( os.path.join(path, 'y.npy'), mmap_mode='r' )
+		self.index = pd.read_csv( os.path.join(path, 'index.tsv'), sep='\t',
+								  dtype={'file': str} )
+
+	def __repr__(self):
+		return 'SpectrumStack : {} ({} spectra x {} pixels)'.format(
+									self.path, *self.y.shape)
+
+	def __len__(self):
+		return self.y.shape[0]
+
+	def __getitem__(self, i):
+		return self.x, self.y[i]
+
+	@property
+	def timestamps(self):
+		return self.index['timestamp'].to_numpy()
+
+	@property
+	def Pm(self):
+		return self.index['Pm'].to_numpy(dtype=float)
+
+	@property
+	def files(self):
+		return self.index['file'].tolist()
+
+	def fit(self, calib, start=0, stop=None):
+		''' fitted x of spectra start to stop, NaN when no fit '''
+		stop = len(self) if stop is None else stop
+		x = np.full(stop - start, np.nan)
+		for i in range(start, stop):
+			try:
+				# float64 copy of one row only
+				y = np.asarray(self.y[i], dtype=float)
+				x[i - start] = myPRLSpectra.fit_spectrum(calib, self.x, y).x
+			except Exception:
+				pass
+		return x
+
+
+def is_stack(path):
+	return os.path.isfile( os.path.join(path, 'index.tsv') ) and \
+		   os.path.isfile( os.path.join(path, 'y.npy') )
+
+
+def import_folder(folder, path, pattern='*.txt', Pm=np.nan, progress=None):
+	''' Converts the text spectra of folder into a stack at path. Spectra
+	are written one by one, memory use does not depend on their number.
+	Spectra with another x axis than the first one are interpolated on it,
+	unreadable files give NaN spectra. '''
+	files = sorted( glob.glob(os.path.join(folder, pattern)) )
+	if not files:
+		raise FileNotFoundError('No {} files in {}'.format(pattern, folder))
+
+	x, _ = myPRLSpectra.load_spectrum(files[0])
+	os.makedirs(path, exist_ok=True)
+	np.save(os.path.join(path, 'x.npy'), x)
+	y = np.lib.format.open_memmap(os.path.join(path, 'y.npy'), mode='w+',
+								  dtype=np.float32, shape=(len(files), len(x)))
+
+	timestamps = np.empty(len(files))
+	for i, file in enumerate(files):
+		try:
+			xi, yi = myPRLSpectra.load_spectrum(file)
+			if len(xi) != len(x) or not np.allclose(xi, x):
+				yi = np.interp(x, xi, yi, left=np.nan, right=np.nan)
+		except ValueError:
+			# unreadable spectrum, kept in the index as NaN
+			yi = np.nan
+		y[i] = yi
+		timestamps[i] = os.path.getmtime(file)
+		if progress is not None:
+			progress(i + 1, len(files))
+	y.flush()
+	del y
+
+	index = pd.DataFrame({'timestamp': timestamps,
+						  'Pm': np.broadcast_to(Pm, len(files)),
+						  'file': [os.path.basename(f) for f in files]},
+						  columns=SpectrumStack.indexcols)
+	index.to_csv(os.path.join(path, 'index.tsv'), sep='\t', index=False)
+
+	return SpectrumStack(path)
+
+
+if __name__ == '__main__':
+
+	import sys
+	import argparse
+
+	parser = argparse.ArgumentParser(
+		description='Converts a folder of text spectra into a spectrum stack')
+	parser.add_argument('folder')
+	parser.add_argument('stack', help='output, e.g. ramp.prlstack')
+	parser.add_argument('--pattern', default='*.txt',
+						help="spectrum files in folder, default '*.txt'")
+	parser.add_argument('--Pm', type=float, default=np.nan,
+						help='membrane pressure of all the spectra')
+	args = parser.parse_args()
+
+	stack = import_folder(args.folder, args.stack, args.pattern, args.Pm,
+		progress=lambda i, n: print('{}/{}'.format(i, n), end='\r',
+															file=sys.stderr))
+	print(stack)
@@ -0,0 +1,101 @@
+''' Uncertainty of P from the (independent, gaussian) uncertainties sx, sT,
+sx0 and sT0 of x, T, x0 and T0, for whole arrays of points:
+
+	sigmaP             linear propagation with the partial derivatives of
+	                   the calibration (analytic when calib.grad is set)
+	sigmaP_montecarlo  standard deviation of P over random draws, for large
+	                   uncertainties or strongly non-linear calibrations
+'''
+
+import numpy as np
+
+import myPRLProfiling
+
+def gradient(calib, x, T, x0, T0):
+	''' dP/dx, dP/dT, dP/dx0, dP/dT0 of calib at the given points '''
+	if calib.grad is not None:
+		return calib.grad(x, T, x0, T0)
+
+	# central differences, step relative to each variable
+	args = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+												for a in (x, T, x0, T0)))
+	grad = []
+	for i, a in enumerate(args):
+		h = 1e-6 * np.maximum(np.abs(a), 1.)
+		up = list(args)
+		down = list(args)
+		up[i] = a + h
+		down[i] = a - h
+		grad.append( (calib.func(*up) - calib.func(*down)) / (2 * h) )
+	return tuple(grad)
+
+
+@myPRLProfiling.timed('uncertainty.linear')
+def sigmaP(calib, x, T, x0, T0, sx, sT, sx0, sT0):
+	''' linear propagation: sqrt( sum (dP/dv sv)^2 ) '''
+	grad = gradient(calib, x, T, x0, T0)
+	var = 0.
+	for g, s in zip(grad, (sx, sT, sx0, sT0)):
+		var = var + (g * s)**2
+	return np.sqrt(var)
+
+
+@myPRLProfiling.timed('uncertainty.montecarlo')
+def sigmaP_montecarlo(calib, x, T, x0, T0, sx, sT, sx0, sT0, ndraws=1000,
+					  rng=None, maxsize=2**16):
+	''' standard deviation of P over ndraws normal draws of the inputs of
+	each point. Points are processed by chunks of at most maxsize draws
+	in total, so that memory stays bounded for large tables. '''
+	rng = np.random.default_rng(rng)
+	args = np.broadcast_arrays(*(np.atleast_1d(np.asarray(a, dtype=float))
+							for a in (x, T, x0, T0, sx, sT, sx0, sT0)))
+	values, sigmas = args[:4], args[4:]
+	shape = values[0].shape
+	values = [v.ravel() for v in values]
+	sigmas = [s.ravel() for s in sigmas]
+	n = len(values[0])
+
+	# the same standard normal draws for all the points (common random
+	# numbers): each sP is still estimated from ndraws independent draws,
+	# sP varies smoothly along a ramp, and drawing is no longer the cost
+	z = rng.standard_normal( (4, ndraws) )
+
+	sP = np.empty(n)
+	chunk = max(1, maxsize // ndraws)
+	for start in range(0, n, chunk):
+		end = min(start + chunk, n)
+		drawn = []
+		for v, s, zi in zip(values, sigmas, z):
+			v, s = v[start:end, None], s[start:end, None]
+			if not s.any():
+				# no draws needed for exact inputs
+				drawn.append(v)
+			else:
+				drawn.append(v + s * zi)
+		P = calib.func(*drawn)
+		sP[start:end] = np.broadcast_to(P, (end - start, ndraws)).std(axis=1)
+
+	return sP.reshape(shape) if len(shape) else sP[0]
+
+
+if __name__ == '__main__':
+
+	# linear vs. Monte Carlo on a ruby ramp, timing of both
+	import time
+	import myPRLModels
+
+	calib = myPRLModels.default_calibrations()['Ruby2020']
+	n, ndraws = 100000, 1000
+	x = np.linspace(694.3, 720, n)
+	args = (x, 300., 694.28, 298., 0.02, 5., 0.01, 1.)
+
+	t = time.perf_counter()
+	lin = sigmaP(calib, *args)
+	t1 = time.perf_counter() - t
+	t = time.perf_counter()
+	mc = sigmaP_montecarlo(calib, *args, ndraws=ndraws, rng=0)
+	t2 = time.perf_counter() - t
+
+	print('linear      : {:.3f} s'.format(t1))
+	print('Monte Carlo : {:.3f} s ({} points x {} draws)'.format(t2, n, ndraws))
+	print('max relative difference: {:.3f}'.format(np.max(np.abs(mc/lin - 1))))
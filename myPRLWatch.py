@@ -0,0 +1,137 @@
+import os
+import time
+import queue
+import fnmatch
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+import myPRLSpectra
+
+
+class FolderWatcher(QObject):
+	''' Emits newfile(path, detection time) for each new file of folder
+	matching one of patterns. Uses QFileSystemWatcher (inotify on Linux), with
+	a polling timer as fallback when it cannot watch the folder, or as
+	a backstop when polling is True (e.g. network filesystems). '''
+
+	newfile = pyqtSignal(str, float)
+
+	def __init__(self, folder, patterns=('*',), polling=False, interval=250):
+		super().__init__()
+
+		self.folder = folder
+		self.patterns = patterns
+
+		# files already there are not new. Names of other entries are
+		# ignored: each scan only matches the names not seen yet.
+		self.known = set()
+		self.ignored = set()
+		self.known.update( self.scan() )
+
+		self.watcher = QFileSystemWatcher()
+		watching = self.watcher.addPath(folder)
+		self.watcher.directoryChanged.connect(self.check)
+
+		self.timer = QTimer(self)
+		self.timer.setInterval(interval)
+		self.timer.timeout.connect(self.check)
+		if polling or not watching:
+			self.timer.start()
+
+	def scan(self):
+		''' new names of the files of folder matching the patterns '''
+		new = []
+		with os.scandir(self.folder) as it:
+			for e in it:
+				if e.name in self.known or e.name in self.ignored:
+					continue
+				if any(fnmatch.fnmatch(e.name, p) for p in self.patterns) \
+															and e.is_file():
+					new.append(e.name)
+				else:
+					self.ignored.add(e.name)
+		return new
+
+	def check(self, *args):
+		t = time.perf_counter()
+		new = self.scan()
+		self.known.update(new)
+		for name in sorted(new):
+			self.newfile.emit(os.path.join(self.folder, name), t)
+
+	def stop(self):
+		self.timer.stop()
+		self.watcher.removePath(self.folder)
+
+
+class LiveFitWorker(QObject):
+	''' Fits the files put in its queue, in its own QThread, each with the
+	calibration of its point (the conditions at its detection, a HPData).
+	The queue is bounded: on a burst the oldest waiting files are dropped
+	(and sent by dropped, to be fitted later), so that the latest spectra
+	are always fitted with a low latency. Files that cannot be fitted
+	after the retries (e.g. still being written) are sent by failed. What
+	is left in the queue when it stops is given by remaining(). '''
+
+	fitted = pyqtSignal(str, float, object, float) # path, x, point, t detect
+	failed = pyqtSignal(str, object) # path, point
+	dropped = pyqtSignal(str, object) # path, point
+
+	def __init__(self, maxqueue=8, retries=20, retrydelay=0.005):
+		super().__init__()
+
+		self.queue = queue.Queue(maxqueue)
+		self.retries = retries
+		self.retrydelay = retrydelay
+		self.stopped = False
+
+	def put(self, path, point, t):
+		# called from the GUI thread
+		while True:
+			try:
+				self.queue.put_nowait( (path, point, t) )
+				return
+			except queue.Full:
+				try:
+					path_, point_, _ = self.queue.get_nowait()
+					self.dropped.emit(path_, point_)
+				except queue.Empty:
+					pass
+
+	def stop(self):
+		self.stopped = True
+
+	def remaining(self):
+		''' [(path, point)] still waiting in the queue, taken out of it '''
+		left = []
+		while True:
+			try:
+				path, point, _ = self.queue.get_nowait()
+			except queue.Empty:
+				return left
+			left.append( (path, point) )
+
+	def run(self):
+		while not self.stopped:
+			try:
+				path, point, t = self.queue.get(timeout=0.1)
+			except queue.Empty:
+				continue
+
+			# the file may still be being written: wait for its size to be 
+			# stable, and try again a bit later if it cannot be fitted
+			for _ in range(self.retries):
+				try:
+					size = os.path.getsize(path)
+					time.sleep(self.retrydelay)
+					if size == 0 or os.path.getsize(path) != size:
+						continue
+					x, y = myPRLSpectra.load_spectrum(path)
+					fit = myPRLSpectra.fit_spectrum(point.calib, x, y)
+					break
+				except Exception:
+					pass
+			else:
+				self.failed.emit(path, point)
+				continue
+
+			self.fitted.emit(path, fit.x, point, t)